@@ -3,34 +3,14 @@ import glob
 import h5py
 import cPickle
 import numpy as np
-from quagga import Model
-from quagga.matrix import Matrix
-from quagga.context import Context
 from quagga.blocks import DotBlock
-from quagga.blocks import LstmBlock
 from numpy.random import RandomState
 from quagga.blocks import SoftmaxBlock
-from quagga.connector import Connector
-from quagga.blocks import RowSlicingBlock
 from quagga.blocks import ParameterContainer
+from quagga.StreamingLstm import StreamingLstm
 from quagga.utils.initializers import H5pyInitializer
 
 
-class DataBlock(object):
-    def __init__(self, word_to_idx, device_id):
-        self.context = Context(device_id)
-        device_id = self.context.device_id
-        self.word_idx = Connector(Matrix.empty(1, 1, 'int', device_id))
-        self.word_to_idx = word_to_idx
-        self.word = None
-
-    def fprop(self):
-        word_npa = np.zeros((1, 1), np.int32, 'F')
-        word_npa[0][0] = self.word_to_idx[self.word] if self.word in self.word_to_idx else self.word_to_idx['<UNK>']
-        self.word_idx.assign_npa(self.context, word_npa)
-        self.word_idx.fprop()
-
-
 with open('/home/sergii/Desktop/quagga/examples/autoencoder/vocab.pckl') as f:
     vocab = cPickle.load(f)
 word_to_idx = vocab['word_to_idx']
@@ -56,28 +36,37 @@ p = ParameterContainer(embd_W={'init': H5pyInitializer(model_file_name, 'embd_W'
                        enc_lstm_R={'init': H5pyInitializer(model_file_name, 'enc_lstm_R'),
                                    'device_id': 1,
                                    'trainable': False})
-data_block = DataBlock(word_to_idx, device_id=1)
-enc_embd_block = RowSlicingBlock(p['embd_W'], data_block.word_idx)
-enc_lstm_block = LstmBlock(p['enc_lstm_W'], p['enc_lstm_R'], None, enc_embd_block.output, None, p['enc_lstm_c0'], p['enc_lstm_h0'], device_id=1)
-encoder_model = Model([p, data_block, enc_embd_block, enc_lstm_block])
-
-
-def encoder_step(word, begin=False):
-    data_block.word = word
-    if begin:
-        enc_lstm_block.prev_c.assign_npa(enc_lstm_block.f_context, enc_lstm_c0)
-        enc_lstm_block.prev_h.assign_npa(enc_lstm_block.f_context, enc_lstm_h0)
-    else:
-        enc_lstm_block.prev_c.assign(enc_lstm_block.f_context, enc_lstm_block.c)
-        enc_lstm_block.prev_h.assign(enc_lstm_block.f_context, enc_lstm_block.h)
-    encoder_model.fprop()
-    data_block.context.wait(enc_lstm_block.f_context)
+encoder = StreamingLstm(p['embd_W'], [p['enc_lstm_W']], [p['enc_lstm_R']], [None],
+                        [p['enc_lstm_c0']], [p['enc_lstm_h0']],
+                        max_num_sessions=256, max_batch_size=256, device_id=1)
+p.fprop()
+
+
+def get_word_idx(word):
+    return word_to_idx[word] if word in word_to_idx else word_to_idx['<UNK>']
+
+
+def get_codes(data):
+    # sentences of a batch are encoded concurrently, a step advances
+    # the ones that are not finished yet
+    codes = [None] * len(data)
+    for start in xrange(0, len(data), encoder.max_num_sessions):
+        batch = data[start:start + encoder.max_num_sessions]
+        sessions = [encoder.open_session() for _ in batch]
+        for t in xrange(max(len(datum) for datum in batch)):
+            active = [i for i, datum in enumerate(batch) if t < len(datum)]
+            encoder.step([sessions[i] for i in active], [get_word_idx(batch[i][t]) for i in active])
+            h = encoder.h.to_host()
+            for j, i in enumerate(active):
+                if t == len(batch[i]) - 1:
+                    codes[start + i] = h[j:j + 1]
+        for session in sessions:
+            encoder.close_session(session)
+    return codes
 
 
 def get_code(datum):
-    for i, e in enumerate(datum):
-        encoder_step(e, not i)
-    return enc_lstm_block.h.to_host()
+    return get_codes([datum])[0]
 
 
 dec_lstm_c0 = H5pyInitializer(model_file_name, 'dec_lstm_c0')()
@@ -99,38 +88,30 @@ p = ParameterContainer(embd_W={'init': H5pyInitializer(model_file_name, 'embd_W'
                        sce_dot_block_b={'init': H5pyInitializer(model_file_name, 'sce_dot_block_b'),
                                         'device_id': 1,
                                         'trainable': False})
-dec_embd_block = RowSlicingBlock(p['embd_W'], data_block.word_idx)
-dec_lstm_block = LstmBlock(p['dec_lstm_W'], p['dec_lstm_R'], None, dec_embd_block.output, None, p['dec_lstm_c0'], enc_lstm_block.h, device_id=1)
-dot_block = DotBlock(p['sce_dot_block_W'], p['sce_dot_block_b'], dec_lstm_block.h, device_id=1)
+decoder = StreamingLstm(p['embd_W'], [p['dec_lstm_W']], [p['dec_lstm_R']], [None],
+                        [p['dec_lstm_c0']], [None],
+                        max_num_sessions=1, max_batch_size=1, device_id=1)
+dot_block = DotBlock(p['sce_dot_block_W'], p['sce_dot_block_b'], decoder.h, device_id=1)
 sce_block = SoftmaxBlock(dot_block.output, device_id=1)
-decoder_model = Model([p, data_block, dec_embd_block,
-                       dec_lstm_block, dot_block, sce_block])
-
-
-def decoder_step(word, begin=False):
-    data_block.word = word
-    if begin:
-        dec_lstm_block.prev_c.assign_npa(dec_lstm_block.f_context, dec_lstm_c0)
-        dec_lstm_block.prev_h.assign(dec_lstm_block.f_context, enc_lstm_block.h)
-    else:
-        dec_lstm_block.prev_c.assign(dec_lstm_block.f_context, dec_lstm_block.c)
-        dec_lstm_block.prev_h.assign(dec_lstm_block.f_context, dec_lstm_block.h)
-    decoder_model.fprop()
+p.fprop()
 
 
 def decode_code(code):
-    enc_lstm_block.h.assign_npa(enc_lstm_block.f_context, code)
+    session = decoder.open_session(h=[code])
     sentence = []
     word = '<<S>>'
     while True:
-        decoder_step(word, word == '<<S>>')
-        probs = sce_block.probs.to_host()[0]
+        decoder.step([session], [get_word_idx(word)])
+        dot_block.fprop()
+        sce_block.fprop()
+        probs = sce_block.output.to_host()[0]
         word_idx = np.argmax(probs)
         sentence.append(idx_to_word[word_idx])
         word = sentence[-1]
         if word == '<<S>>':
             break
         word = '<UNK>'
+    decoder.close_session(session)
     return sentence
 
 
@@ -151,7 +132,7 @@ def load_dataset(max_sent_len=42):
 def get_validation_data_codes():
     data = load_dataset()
     print 'ggggo'
-    codes = [get_code(datum)[0] for datum in data]
+    codes = get_codes(data)
     # with h5py.File('075drop_codes.hdf5', 'w') as h5_file:
     with h5py.File('red_drop_codes.hdf5', 'w') as h5_file:
         h5_file['codes'] = np.vstack(codes)
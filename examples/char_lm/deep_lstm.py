@@ -7,14 +7,12 @@ from quagga.utils import List
 from quagga.cuda import cudart
 from quagga.matrix import Matrix
 from quagga.context import Context
-from quagga.blocks import DotBlock
 from quagga.blocks import LstmBlock
 from collections import defaultdict
 from quagga.blocks import RepeatBlock
 from quagga.connector import Connector
 from quagga.optimizers import Optimizer
 from quagga.blocks import SequencerBlock
-from quagga.blocks import SoftmaxCeBlock
 from quagga.blocks import RowSlicingBlock
 from quagga.optimizers.steps import NagStep
 from quagga.blocks import ParameterContainer
@@ -23,6 +21,7 @@ from quagga.utils.initializers import Orthogonal
 from quagga.optimizers.steps import SparseSgdStep
 from quagga.optimizers.observers import Hdf5Saver
 from quagga.utils.initializers import H5pyInitializer
+from quagga.blocks import SequentialDotSoftmaxCeBlock
 from quagga.optimizers.policies import FixedValuePolicy
 from quagga.optimizers.observers import TrainLossTracker
 from quagga.optimizers.policies import ScheduledValuePolicy
@@ -342,23 +341,16 @@ if __name__ == '__main__':
                                        paddings=[ff_c_repeat_block.output, ff_h_repeat_block.output],
                                        reverse=False,
                                        device_id=0)
-    seq_dot_block = SequencerBlock(block_class=DotBlock,
-                                   params=[p['sce_dot_block_W'], p['sce_dot_block_b']],
-                                   sequences=[ff_lstm_rnn_block.h],
-                                   output_names=['output'],
-                                   device_id=0)
-    seq_sce_block = SequencerBlock(block_class=SoftmaxCeBlock,
-                                   params=[],
-                                   sequences=[seq_dot_block.output, data_block.y, data_block.mask],
-                                   output_names=[],
-                                   device_id=0)
+    seq_sce_block = SequentialDotSoftmaxCeBlock(p['sce_dot_block_W'], p['sce_dot_block_b'],
+                                                ff_lstm_rnn_block.h, data_block.y, data_block.mask,
+                                                output_probs=False, device_id=0)
     model = Model([p, data_block, embd_block,
                    f_c_repeat_block, f_h_repeat_block, f_lstm_rnn_block,
                    s_c_repeat_block, s_h_repeat_block, s_lstm_rnn_block,
                    t_c_repeat_block, t_h_repeat_block, t_lstm_rnn_block,
                    ft_c_repeat_block, ft_h_repeat_block, ft_lstm_rnn_block,
                    ff_c_repeat_block, ff_h_repeat_block, ff_lstm_rnn_block,
-                   seq_dot_block, seq_sce_block])
+                   seq_sce_block])
     logger = get_logger('ukr_char_lstm_train.log')
     # learning_rate_policy = FixedValuePolicy(0.0005)
     learning_rate_policy = FixedValuePolicy(0.000001)
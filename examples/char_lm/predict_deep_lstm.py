@@ -1,34 +1,13 @@
 # -*- coding: utf-8 -*-
 import cPickle
 import numpy as np
-from quagga import Model
-from quagga.matrix import Matrix
 from scipy.spatial import distance
-from quagga.context import Context
-from quagga.blocks import DotBlock
-from quagga.blocks import LstmBlock
-from quagga.connector import Connector
-from quagga.blocks import SoftmaxBlock
-from quagga.blocks import RowSlicingBlock
+from quagga.LstmDecoder import LstmDecoder
 from quagga.blocks import ParameterContainer
+from quagga.StreamingLstm import StreamingLstm
 from quagga.utils.initializers import H5pyInitializer
 
 
-class DataBlock(object):
-    def __init__(self, char_to_idx, device_id):
-        self.context = Context(device_id)
-        device_id = self.context.device_id
-        self.char_idx = Connector(Matrix.empty(1, 1, 'int', device_id))
-        self.char_to_idx = char_to_idx
-        self.char = None
-
-    def fprop(self):
-        char_npa = np.zeros((1, 1), np.int32, 'F')
-        char_npa[0][0] = self.char_to_idx[self.char] if self.char in self.char_to_idx else self.char_to_idx['<unk>']
-        self.char_idx.assign_npa(self.context, char_npa)
-        self.char_idx.fprop()
-
-
 with open('vocab.pckl') as f:
     vocab = cPickle.load(f)
 char_to_idx = vocab['char_to_idx']
@@ -105,77 +84,34 @@ p = ParameterContainer(embd_W={'init': lambda: embd_W,
                                         'device_id': 1},
                        sce_dot_block_b={'init': lambda: dot_block_b,
                                         'device_id': 1})
-data_block = DataBlock(char_to_idx, device_id=1)
-embd_block = RowSlicingBlock(W=p['embd_W'], row_indexes=data_block.char_idx)
-f_lstm_rnn_block = LstmBlock(p['f_lstm_W'], p['f_lstm_R'], None, embd_block.output, None, p['f_lstm_c0'], p['f_lstm_h0'], device_id=1)
-s_lstm_rnn_block = LstmBlock(p['s_lstm_W'], p['s_lstm_R'], None, f_lstm_rnn_block.h, None, p['s_lstm_c0'], p['s_lstm_h0'], device_id=1)
-t_lstm_rnn_block = LstmBlock(p['t_lstm_W'], p['t_lstm_R'], None, s_lstm_rnn_block.h, None, p['t_lstm_c0'], p['t_lstm_h0'], device_id=1)
-ft_lstm_rnn_block = LstmBlock(p['ft_lstm_W'], p['ft_lstm_R'], None, t_lstm_rnn_block.h, None, p['ft_lstm_c0'], p['ft_lstm_h0'], device_id=1)
-ff_lstm_rnn_block = LstmBlock(p['ff_lstm_W'], p['ff_lstm_R'], None, ft_lstm_rnn_block.h, None, p['ff_lstm_c0'], p['ff_lstm_h0'], device_id=1)
-dot_block = DotBlock(p['sce_dot_block_W'], p['sce_dot_block_b'], ff_lstm_rnn_block.h, device_id=1)
-softmax_block = SoftmaxBlock(dot_block.output, device_id=1)
-model = Model([p, data_block, embd_block,
-               f_lstm_rnn_block,
-               s_lstm_rnn_block,
-               t_lstm_rnn_block,
-               ft_lstm_rnn_block,
-               ff_lstm_rnn_block,
-               dot_block, softmax_block])
+names = ['f_lstm', 's_lstm', 't_lstm', 'ft_lstm', 'ff_lstm']
+stream = StreamingLstm(p['embd_W'],
+                       [p[name + '_W'] for name in names],
+                       [p[name + '_R'] for name in names],
+                       [None] * len(names),
+                       [p[name + '_c0'] for name in names],
+                       [p[name + '_h0'] for name in names],
+                       max_num_sessions=1, max_batch_size=1, device_id=1)
+decoder = LstmDecoder(p['sce_dot_block_W'], p['sce_dot_block_b'], stream, eos=None, device_id=1)
+p.fprop()
 
 
-def step(char, begin=False):
-    data_block.char = char
-    if begin:
-        p['f_lstm_c0'].assign_npa(f_lstm_rnn_block.f_context, f_lstm_c0)
-        p['f_lstm_h0'].assign_npa(f_lstm_rnn_block.f_context, f_lstm_h0)
-        p['s_lstm_c0'].assign_npa(s_lstm_rnn_block.f_context, s_lstm_c0)
-        p['s_lstm_h0'].assign_npa(s_lstm_rnn_block.f_context, s_lstm_h0)
-        p['t_lstm_c0'].assign_npa(t_lstm_rnn_block.f_context, t_lstm_c0)
-        p['t_lstm_h0'].assign_npa(t_lstm_rnn_block.f_context, t_lstm_h0)
-        p['ft_lstm_c0'].assign_npa(ft_lstm_rnn_block.f_context, ft_lstm_c0)
-        p['ft_lstm_h0'].assign_npa(ft_lstm_rnn_block.f_context, ft_lstm_h0)
-        p['ff_lstm_c0'].assign_npa(ff_lstm_rnn_block.f_context, ff_lstm_c0)
-        p['ff_lstm_h0'].assign_npa(ff_lstm_rnn_block.f_context, ff_lstm_h0)
-    else:
-        f_lstm_rnn_block.prev_c.assign(f_lstm_rnn_block.f_context, f_lstm_rnn_block.c)
-        f_lstm_rnn_block.prev_h.assign(f_lstm_rnn_block.f_context, f_lstm_rnn_block.h)
-        s_lstm_rnn_block.prev_c.assign(s_lstm_rnn_block.f_context, s_lstm_rnn_block.c)
-        s_lstm_rnn_block.prev_h.assign(s_lstm_rnn_block.f_context, s_lstm_rnn_block.h)
-        t_lstm_rnn_block.prev_c.assign(t_lstm_rnn_block.f_context, t_lstm_rnn_block.c)
-        t_lstm_rnn_block.prev_h.assign(t_lstm_rnn_block.f_context, t_lstm_rnn_block.h)
-        ft_lstm_rnn_block.prev_c.assign(ft_lstm_rnn_block.f_context, ft_lstm_rnn_block.c)
-        ft_lstm_rnn_block.prev_h.assign(ft_lstm_rnn_block.f_context, ft_lstm_rnn_block.h)
-        ff_lstm_rnn_block.prev_c.assign(ff_lstm_rnn_block.f_context, ff_lstm_rnn_block.c)
-        ff_lstm_rnn_block.prev_h.assign(ff_lstm_rnn_block.f_context, ff_lstm_rnn_block.h)
-    model.fprop()
-    return softmax_block.probs.to_host()
+def get_char_idx(char):
+    return char_to_idx[char] if char in char_to_idx else char_to_idx['<unk>']
 
 
-def make_prediction(seed, n_steps):
-    seed = u''.join([e for e in seed if e in char_to_idx])
-    predicted_chars = []
-    for i, char in enumerate(seed):
-        probs = step(char, i == 0)
-    for i in xrange(n_steps):
-        if predicted_chars and predicted_chars[-1] == ' ':
-            char_idx = np.random.choice(len(idx_to_char), 1, p=probs[0])
-            # char_idx = np.argmax(probs[0])
-        else:
-            # char_idx = np.random.choice(len(idx_to_char), 1, p=probs[0])
-            char_idx = np.argmax(probs[0])
-        predicted_chars.append(idx_to_char[char_idx])
-        probs = step(predicted_chars[-1])
-    return predicted_chars
+def make_prediction(seed, n_steps, top_k=5):
+    seed = [char_to_idx[e] for e in seed if e in char_to_idx]
+    predicted_chars = decoder.sample([seed], n_steps, top_k=top_k)[0]
+    return [idx_to_char[e] for e in predicted_chars]
 
 
 def get_last_hiddens(word):
-    for i, char in enumerate(word):
-        step(char, i == 0)
-    return np.concatenate([f_lstm_rnn_block.h.to_host()[0],
-                           s_lstm_rnn_block.h.to_host()[0],
-                           t_lstm_rnn_block.h.to_host()[0],
-                           ft_lstm_rnn_block.h.to_host()[0],
-                           ff_lstm_rnn_block.h.to_host()[0]])
+    session = stream.open_session()
+    for char in word:
+        stream.step([session], [get_char_idx(char)])
+    stream.close_session(session)
+    return np.concatenate([block.h.to_host()[0] for block in stream.blocks])
 
 
 def get_similarity(first_word, second_word):
@@ -22,20 +22,19 @@ from quagga.cuda import cudart
 from urllib import urlretrieve
 from quagga.matrix import Matrix
 from quagga.context import Context
-from quagga.blocks import DotBlock
 from collections import defaultdict
 from quagga.blocks import LstmBlock
 from quagga.blocks import RepeatBlock
 from quagga.connector import Connector
 from quagga.optimizers import Optimizer
 from quagga.blocks import SequencerBlock
-from quagga.blocks import SoftmaxCeBlock
 from quagga.blocks import RowSlicingBlock
 from quagga.blocks import ParameterContainer
 from quagga.utils.initializers import Constant
 from quagga.blocks import HorizontalStackBlock
 from quagga.utils.initializers import Orthogonal
 from quagga.optimizers.observers import Hdf5Saver
+from quagga.blocks import SequentialDotSoftmaxCeBlock
 from quagga.optimizers.observers import ValidTracker, LossForValidTracker
 from quagga.optimizers.observers import TrainLossTracker
 from quagga.optimizers.policies import FixedValuePolicy
@@ -280,20 +279,14 @@ if __name__ == '__main__':
                                            List(bwd_lstm_block.h[:] + [h_bwd_repeat_block.output], bwd_lstm_block.h.length + 1)],
                                 output_names=['output'],
                                 device_id=0)
-    seq_dot_block = SequencerBlock(block_class=DotBlock,
-                                   params=[p['sce_dot_block_W'], p['sce_dot_block_b']],
-                                   sequences=[seq_hstack.output],
-                                   output_names=['output'],
-                                   device_id=0)
     sentence_batch = List([Connector(data_block.sentence_batch[:, i]) for i in xrange(data_block.sentence_batch.ncols)], data_block.sentence_batch.ncols)
-    seq_sce_block = SequencerBlock(block_class=SoftmaxCeBlock,
-                                   params=[],
-                                   sequences=[seq_dot_block.output, sentence_batch, data_block.mask],
-                                   device_id=0)
+    seq_sce_block = SequentialDotSoftmaxCeBlock(p['sce_dot_block_W'], p['sce_dot_block_b'],
+                                                seq_hstack.output, sentence_batch, data_block.mask,
+                                                output_probs=False, device_id=0)
     model = Model([p, data_block, seq_embd_block,
                    c_fwd_repeat_block, h_fwd_repeat_block, fwd_lstm_block,
                    c_bwd_repeat_block, h_bwd_repeat_block, bwd_lstm_block,
-                   seq_hstack, seq_dot_block, seq_sce_block])
+                   seq_hstack, seq_sce_block])
 
     logger = get_logger('train.log')
     momentum_policy = FixedValuePolicy(0.95)
@@ -0,0 +1,175 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import quagga
+from itertools import izip
+from quagga.Model import Model
+from quagga.utils import List
+from quagga.context import Context
+from quagga.blocks import DotBlock
+from quagga.blocks import DropoutBlock
+from quagga.connector import Connector
+from quagga.blocks import ParameterContainer
+from quagga.MemoryPlanner import MemoryPlanner, _inner_blocks
+
+
+class InferenceCompiler(object):
+    """
+    Compiles a trained model into :class:`InferenceModel`, which only runs
+    ``fprop`` and is fed and read through ``predict``.
+
+    The blocks are built again by the function that built the trained
+    model's blocks, with the following changes:
+
+    * connectors are not bpropagable (see
+      :meth:`quagga.connector.Connector.forward_only`), so neither connectors
+      nor blocks allocate backward matrices and ``fprop`` zeroes nothing;
+    * parameters get the values of the trained
+      :class:`~quagga.blocks.ParameterContainer`;
+    * :class:`~quagga.blocks.DropoutBlock` whose output is used only as ``x``
+      of a :class:`~quagga.blocks.DotBlock` is removed and its testing mode
+      scaling is folded into the parameter that is ``W`` of that block,
+      unless the parameter is used by other blocks;
+    * for synchronous :class:`~quagga.context.CpuContext` intermediate
+      buffers share memory according to
+      :class:`~quagga.MemoryPlanner.MemoryPlanner` with ``forward_only``.
+
+    Parameters
+    ----------
+    fold_dropout : bool
+    plan_memory : bool
+    """
+    def __init__(self, fold_dropout=True, plan_memory=True):
+        self.fold_dropout = fold_dropout
+        self.plan_memory = plan_memory
+
+    def compile(self, build_blocks, parameters, inputs, outputs):
+        """
+        Returns :class:`InferenceModel`. ``build_blocks`` must create the
+        same blocks as the ones of the trained model, among them one
+        :class:`~quagga.blocks.ParameterContainer` whose parameters are
+        assigned from ``parameters``. ``inputs`` and ``outputs`` are functions
+        that receive the blocks and return dicts of connectors (or lists of
+        connectors for sequences) that ``predict`` feeds and reads.
+        """
+        folded = []
+
+        def build_inference_blocks():
+            with Connector.forward_only():
+                blocks = build_blocks()
+            if self.fold_dropout:
+                blocks, folded[:] = _fold_dropout(blocks)
+            return blocks
+
+        if self.plan_memory and quagga.processor_type == 'cpu' and not Context().deferring:
+            planner = MemoryPlanner(forward_only=True)
+            blocks = planner.build(build_inference_blocks, lambda blocks: outputs(blocks).values()).blocks
+        else:
+            blocks = build_inference_blocks()
+
+        for container in blocks:
+            if isinstance(container, ParameterContainer):
+                break
+        else:
+            raise ValueError('Blocks must contain a ParameterContainer!')
+        for name, param in container.parameters.iteritems():
+            context = Context(param.device_id)
+            param.assign_npa(context, parameters[name].to_host())
+            for folded_param, scale in folded:
+                if folded_param is param:
+                    # copies on other devices are assigned from it by fprop
+                    W = param._f_matrices[param._fo_device_id]
+                    W.scale(context, scale, W)
+        return InferenceModel(blocks, inputs(blocks), outputs(blocks))
+
+
+class InferenceModel(Model):
+    """
+    :class:`~quagga.Model` in testing mode that is fed and read by
+    :meth:`predict`. Instances are created by
+    :meth:`InferenceCompiler.compile`.
+    """
+    def __init__(self, blocks, inputs, outputs):
+        super(InferenceModel, self).__init__(blocks)
+        self.inputs = inputs
+        self.outputs = outputs
+        self.context = Context()
+        self.set_testing_mode()
+
+    def predict(self, batch):
+        """
+        Assigns ``batch`` (dict of numpy arrays, or lists of them for
+        sequences, by input names) to the inputs, runs ``fprop`` and returns
+        dict of the outputs' numpy arrays (or lists of them).
+        """
+        for name, value in batch.iteritems():
+            x = self.inputs[name]
+            if isinstance(x, List):
+                x.length = len(value)
+                for e, v in izip(x, value):
+                    e.assign_npa(self.context, v)
+                    e.fprop()
+            else:
+                x.assign_npa(self.context, value)
+                x.fprop()
+        self.fprop()
+        predictions = {}
+        for name, output in self.outputs.iteritems():
+            if isinstance(output, List):
+                predictions[name] = [e.to_host() for e in output]
+            else:
+                predictions[name] = output.to_host()
+        return predictions
+
+
+def _fold_dropout(blocks):
+    """
+    Returns blocks without the dropout blocks that can be folded into
+    weights of the next dot blocks and pairs of the weights' parameters
+    and scales.
+    """
+    params = {}
+    for block in blocks:
+        if isinstance(block, ParameterContainer):
+            for param in block.parameters.itervalues():
+                for m in param._f_matrices.itervalues():
+                    params[id(m)] = param
+    all_blocks = sum(([block] + _inner_blocks(block) for block in blocks), [])
+    kept_blocks, folded = [], []
+    for block in blocks:
+        if isinstance(block, DropoutBlock):
+            outputs = block.output._f_matrices.values()
+            consumers = [b for b in all_blocks if b is not block and any(_uses(b, m) for m in outputs)]
+            if len(consumers) == 1 and isinstance(consumers[0], DotBlock):
+                dot_block = consumers[0]
+                param = params.get(id(dot_block.W))
+                if any(dot_block.x is m for m in outputs) and \
+                        dot_block.x.device_id == block.x.device_id and \
+                        param is not None and \
+                        sum(any(_uses(b, m) for m in param._f_matrices.itervalues()) for b in all_blocks) == 1:
+                    dot_block.x = block.x
+                    folded.append((param, 1.0 - block.dropout_prob))
+                    continue
+        kept_blocks.append(block)
+    return kept_blocks, folded
+
+
+def _uses(block, matrix):
+    for value in vars(block).itervalues():
+        if value is matrix:
+            return True
+        if isinstance(value, (list, tuple)) and any(e is matrix for e in value):
+            return True
+    return False
\ No newline at end of file
@@ -0,0 +1,189 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import numpy as np
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.blocks import DotBlock
+from quagga.StreamingLstm import _forward_only
+
+
+class LstmDecoder(object):
+    """
+    Generates continuations of prompts (lists of tokens) by a language model
+    that consists of :class:`~quagga.StreamingLstm.StreamingLstm` and a
+    softmax output layer. All prompts are decoded at once: a generated token
+    is one step of the stream for all unfinished hypotheses, which leave the
+    batch as soon as they end. Distributions of the next tokens stay on the
+    device, only the best candidates (or sampled tokens) of every hypothesis
+    are copied to host.
+
+    Parameters
+    ----------
+    W : Matrix (GpuMatrix or CpuMatrix)
+        Output weights
+    b : Matrix (GpuMatrix or CpuMatrix)
+        Output bias, can be None
+    stream : StreamingLstm
+        Stream with an embedding of the tokens
+    eos : int
+        Token that ends hypotheses, None if only ``max_len`` does
+    device_id : int
+        Defines the device's id on which the computation will take place
+    """
+    def __init__(self, W, b, stream, eos, device_id=None):
+        if not hasattr(stream, 'embd_block'):
+            raise ValueError('The stream must have an embedding of the tokens!')
+        self.context = Context(device_id)
+        device_id = self.context.device_id
+        self.stream = stream
+        self.eos = eos
+        # matrices that follow the batch of the stream are allocated for
+        # its largest batch
+        stream.slots.nrows = stream.max_batch_size
+        b = _forward_only(b, device_id) if b else None
+        self.dot_block = DotBlock(_forward_only(W, device_id), b, stream.h, device_id)
+        self.logits = self.dot_block.output
+        self.probs = Matrix.empty(self.logits.nrows, self.logits.ncols, device_id=device_id)
+        self.uniforms = Matrix.empty(self.logits.nrows, 1, device_id=device_id)
+        self.tokens = Matrix.empty(self.logits.nrows, 1, 'int', device_id)
+
+    def beam_search(self, prompts, beam_size, max_len):
+        """
+        Returns for every prompt a list of up to ``beam_size`` pairs of
+        generated tokens (without ``eos``) and their log probability, the
+        best first. Search of a prompt stops when it has ``beam_size``
+        finished hypotheses or none of its live hypotheses can outscore the
+        best finished one. Hypotheses are reordered by copying states of the
+        stream's sessions.
+        """
+        stream = self.stream
+        if len(prompts) * beam_size > stream.max_batch_size:
+            raise ValueError('There must be at most {} hypotheses!'.format(stream.max_batch_size))
+        sessions = [[stream.open_session() for _ in xrange(beam_size)] for _ in prompts]
+        self._prefill(prompts, [e[0] for e in sessions])
+        # candidates of a hypothesis
+        k = min(beam_size, int(self.logits.ncols))
+        values = Matrix.empty(stream.max_batch_size, k, device_id=self.context.device_id)
+        indices = Matrix.empty(stream.max_batch_size, k, 'int', self.context.device_id)
+        # live hypotheses of a prompt are (session, tokens, score)
+        live = {i: [(e[0], [prompt[-1]], 0.0)] for i, (e, prompt) in enumerate(zip(sessions, prompts))}
+        finished = [[] for _ in prompts]
+        while live:
+            rows = [(i, hyp) for i in sorted(live) for hyp in live[i]]
+            stream.step([hyp[0] for _, hyp in rows], [hyp[1][-1] for _, hyp in rows])
+            self._fprop_probs()
+            values.nrows = len(rows)
+            indices.nrows = len(rows)
+            self.probs.top_k(self.context, values, indices)
+            with np.errstate(divide='ignore'):
+                log_probs = np.log(values.to_host())
+            indices_np = indices.to_host()
+
+            destinations, sources = [], []
+            row = 0
+            for i in sorted(live):
+                candidates = []
+                for session, tokens, score in live[i]:
+                    for j in xrange(k):
+                        candidates.append((score + log_probs[row, j], int(indices_np[row, j]), session, tokens))
+                    row += 1
+                candidates.sort(key=lambda e: -e[0])
+                new_live = []
+                for score, token, session, tokens in candidates:
+                    if len(finished[i]) + len(new_live) == beam_size:
+                        break
+                    if token == self.eos:
+                        finished[i].append((tokens[1:], score))
+                    elif len(tokens) == max_len:
+                        finished[i].append((tokens[1:] + [token], score))
+                    else:
+                        new_live.append((session, tokens + [token], score))
+                if not new_live or finished[i] and max(e[1] for e in finished[i]) >= new_live[0][2]:
+                    for session in sessions[i]:
+                        stream.close_session(session)
+                    del live[i]
+                    continue
+                # the k-th hypothesis continues in the k-th session of the prompt
+                live[i] = []
+                for session, (parent, tokens, score) in zip(sessions[i], new_live):
+                    if session != parent:
+                        destinations.append(session)
+                        sources.append(parent)
+                    live[i].append((session, tokens, score))
+            if destinations:
+                stream.assign_states(destinations, sources)
+        return [sorted(e, key=lambda e: -e[1]) for e in finished]
+
+    def sample(self, prompts, max_len, temperature=1.0, top_k=None, rng=None):
+        """
+        Returns for every prompt generated tokens (without ``eos``) that are
+        sampled from the model's distributions with logits divided by
+        ``temperature``, restricted to the ``top_k`` most probable tokens if
+        it is not None.
+        """
+        stream = self.stream
+        if len(prompts) > stream.max_batch_size:
+            raise ValueError('There must be at most {} prompts!'.format(stream.max_batch_size))
+        rng = rng if rng else np.random
+        sessions = [stream.open_session() for _ in prompts]
+        self._prefill(prompts, sessions)
+        if top_k:
+            values = Matrix.empty(stream.max_batch_size, top_k, device_id=self.context.device_id)
+            indices = Matrix.empty(stream.max_batch_size, top_k, 'int', self.context.device_id)
+        outputs = [[] for _ in prompts]
+        live = range(len(prompts))
+        tokens = [prompt[-1] for prompt in prompts]
+        while live:
+            stream.step([sessions[i] for i in live], tokens)
+            self._fprop_probs(temperature)
+            n = len(live)
+            if top_k:
+                values.nrows = n
+                indices.nrows = n
+                self.probs.top_k(self.context, values, indices)
+                probs = values.to_host()
+                cdf = np.cumsum(probs / probs.sum(axis=1, keepdims=True), axis=1)
+                choices = np.minimum(np.sum(cdf <= rng.rand(n, 1), axis=1), top_k - 1)
+                tokens = indices.to_host()[np.arange(n), choices]
+            else:
+                self.uniforms.assign_npa(self.context, rng.rand(n, 1).astype(np.float32))
+                self.probs.sample(self.context, self.uniforms, self.tokens)
+                tokens = self.tokens.to_host()[:, 0]
+            next_live, next_tokens = [], []
+            for i, token in zip(live, map(int, tokens)):
+                if token != self.eos:
+                    outputs[i].append(token)
+                if token == self.eos or len(outputs[i]) == max_len:
+                    stream.close_session(sessions[i])
+                else:
+                    next_live.append(i)
+                    next_tokens.append(token)
+            live, tokens = next_live, next_tokens
+        return outputs
+
+    def _prefill(self, prompts, sessions):
+        # all tokens of the prompts except the last ones
+        if not all(prompts):
+            raise ValueError('Prompts must not be empty!')
+        for t in xrange(max(len(prompt) for prompt in prompts) - 1):
+            active = [i for i, prompt in enumerate(prompts) if t < len(prompt) - 1]
+            self.stream.step([sessions[i] for i in active], [prompts[i][t] for i in active])
+
+    def _fprop_probs(self, temperature=1.0):
+        self.dot_block.fprop()
+        if temperature != 1.0:
+            self.logits.scale(self.context, 1.0 / temperature, self.logits)
+        self.logits.softmax(self.context, self.probs)
\ No newline at end of file
@@ -0,0 +1,265 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import numpy as np
+from quagga.Model import Model
+from quagga.context import Context
+from quagga.connector import Connector
+from quagga.matrix import MemoryArena
+from quagga.matrix.MemoryArena import _round_up, _aligned_zeros
+
+
+class MemoryPlanner(object):
+    """
+    Builds a :class:`~quagga.Model` whose intermediate buffers share memory.
+
+    The blocks are built twice. During the first build every allocation of
+    :meth:`quagga.matrix.CpuMatrix.empty` and every
+    :meth:`quagga.connector.Connector.register_usage` call is recorded. The
+    lifetime of a buffer is the range of steps at which it is reachable from
+    the block that is processed: ``fprop`` of the blocks in the model order
+    followed by ``bprop`` in the reversed order. Blocks that consist of other
+    blocks (e.g. :class:`~quagga.blocks.SequencerBlock`) take a step per
+    inner block during ``fprop``. Buffers whose lifetimes do not overlap are
+    packed into one storage, from which the second build takes its memory.
+
+    The memory is not shared for
+
+    * parameters, their gradients and connectors that are not outputs of the
+      model's blocks (inputs that are filled by the user);
+    * outputs that nobody registered usage of (e.g. probabilities of
+      :class:`~quagga.blocks.SoftmaxCeBlock` that are read by
+      ``calculate_loss``);
+    * buffers that were written during the construction of the blocks;
+    * matrices returned by ``keep``.
+
+    A buffer must not carry its values from one ``fprop``/``bprop`` run to
+    the next one. Work of the blocks must be executed in the model order,
+    so the plan is valid only for synchronous
+    :class:`~quagga.context.CpuContext`.
+
+    Parameters
+    ----------
+    forward_only : bool
+        If True, the plan is made for a model that is used only for ``fprop``
+        (testing mode). Lifetimes end with the last ``fprop`` usage and
+        backward matrices of the connectors, which are only zeroed during
+        ``fprop``, live for one step. ``bprop`` of such a model gives wrong
+        results.
+    alignment : int
+        Alignment of every buffer in bytes.
+    """
+    def __init__(self, forward_only=False, alignment=64):
+        self.forward_only = forward_only
+        self.alignment = alignment
+        self.stats = None
+
+    def build(self, build_blocks, keep=None):
+        """
+        Returns :class:`~quagga.Model` that consists of the blocks returned by
+        ``build_blocks``. ``build_blocks`` is called twice and must create the
+        same blocks each time. ``keep`` is a function that receives the blocks
+        and returns matrices and connectors whose memory must not be shared.
+        """
+        if Context().deferring:
+            raise ValueError('Memory plan requires synchronous contexts!')
+        recorder = _RecordingArena()
+        with recorder:
+            blocks = build_blocks()
+        allocations = self._plan(blocks, recorder, keep)
+        del blocks
+        storage_nbytes = max([offset + _round_up(int(np.prod(shape)) * np.dtype(dtype).itemsize, self.alignment)
+                              for shape, dtype, offset in allocations if offset is not None] + [0])
+        storage = _aligned_zeros(storage_nbytes, self.alignment)
+        arena = _PlannedArena(storage, allocations)
+        with arena:
+            blocks = build_blocks()
+        if arena.nallocations != len(allocations):
+            raise ValueError('Blocks differ from the ones the plan was made for!')
+        self.stats['storage_nbytes'] = storage_nbytes
+        return Model(blocks)
+
+    def _plan(self, blocks, recorder, keep):
+        arrays = recorder.arrays
+        indices = dict((id(a), k) for k, a in enumerate(arrays))
+        get_indices = lambda objs: set(filter(lambda k: k is not None, (indices.get(id(_root(a))) for a in objs)))
+
+        first, last = {}, {}
+        owned_connectors = []
+        model = Model(blocks)
+        t = 0
+        for block in model.fpropable_blocks:
+            inner_blocks = _inner_blocks(block)
+            block_arrays, connectors = _reachable(block, inner_blocks)
+            owned_connectors.extend(connectors)
+            _use(get_indices(block_arrays), t, t + max(len(inner_blocks), 1) - 1, first, last)
+            for inner_block in inner_blocks:
+                block_arrays, connectors = _reachable(inner_block)
+                owned_connectors.extend(connectors)
+                _use(get_indices(block_arrays), t, t, first, last)
+                t += 1
+            if not inner_blocks:
+                t += 1
+        if not self.forward_only:
+            for block in model.bpropable_blocks:
+                inner_blocks = _inner_blocks(block)
+                if getattr(inner_blocks[0] if inner_blocks else block, 'learning', True) is False:
+                    # bprop of the block does nothing
+                    continue
+                _use(get_indices(_reachable(block)[0]), t, t, first, last)
+                t += 1
+
+        pinned = set(k for k, a in enumerate(arrays) if k not in first or a.any())
+        owned_ids = set(id(c) for c in owned_connectors)
+        registered_ids = set(id(c) for c in recorder.connectors)
+        for connector in recorder.connectors:
+            if id(connector) not in owned_ids:
+                pinned.update(get_indices(_reachable(connector)[0]))
+        for connector in owned_connectors:
+            if id(connector) not in registered_ids or \
+                    not get_indices([connector._f_matrices[connector._fo_device_id].npa]):
+                pinned.update(get_indices(_reachable(connector)[0]))
+        if keep:
+            pinned.update(get_indices(_reachable(list(keep(blocks)))[0]))
+
+        nbytes = [_round_up(a.nbytes, self.alignment) for a in arrays]
+        shared = [k for k in xrange(len(arrays)) if k not in pinned]
+        buffers = dict((k, (nbytes[k], first[k], last[k])) for k in shared)
+        scratch = set()
+        if self.forward_only:
+            # backward matrices are only zeroed during fprop, so all of them
+            # share one buffer that lives while any of them is zeroed
+            for connector in owned_connectors:
+                if connector.bpropagable:
+                    b_matrices = connector._b_matrices.values() + connector._b_matrices_pool.values()
+                    scratch.update(get_indices(m.npa for m in b_matrices))
+            scratch -= pinned
+            if scratch:
+                for k in scratch:
+                    del buffers[k]
+                buffers[-1] = (max(nbytes[k] for k in scratch),
+                               min(first[k] for k in scratch),
+                               max(first[k] for k in scratch))
+        buffer_offsets = _pack(buffers)
+        offsets = [buffer_offsets.get(-1 if k in scratch else k) for k in xrange(len(arrays))]
+
+        self.stats = {'nallocations': len(arrays),
+                      'npinned': len(pinned),
+                      'pinned_nbytes': sum(arrays[k].nbytes for k in pinned),
+                      'planned_nbytes': sum(nbytes[k] for k in shared)}
+        return [(a.shape, a.dtype, offsets[k]) for k, a in enumerate(arrays)]
+
+
+class _RecordingArena(MemoryArena):
+    def __init__(self):
+        super(_RecordingArena, self).__init__()
+        self.arrays = []
+        self.connectors = []
+
+    def empty(self, shape, dtype):
+        a = np.zeros(shape, dtype)
+        self.arrays.append(a)
+        self.nallocations += 1
+        self.allocated_nbytes += a.nbytes
+        return a
+
+    def register_usage(self, connector):
+        self.connectors.append(connector)
+
+
+class _PlannedArena(MemoryArena):
+    def __init__(self, storage, allocations):
+        super(_PlannedArena, self).__init__()
+        self.storage = storage
+        self.allocations = allocations
+
+    def empty(self, shape, dtype):
+        k = self.nallocations
+        if k == len(self.allocations) or self.allocations[k][:2] != (shape, np.dtype(dtype)):
+            raise ValueError('Blocks differ from the ones the plan was made for!')
+        offset = self.allocations[k][2]
+        if offset is None:
+            a = np.zeros(shape, dtype)
+        else:
+            nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            a = self.storage[offset:offset+nbytes].view(dtype).reshape(shape)
+        self.nallocations += 1
+        self.allocated_nbytes += a.nbytes
+        return a
+
+
+def _pack(buffers):
+    """
+    Greedily assigns offsets to ``buffers`` (dict of nbytes, first and last
+    steps) from the largest one, so that buffers whose lifetimes overlap do
+    not overlap in memory.
+    """
+    offsets = {}
+    for k in sorted(buffers, key=lambda k: (-buffers[k][0], k)):
+        nbytes, first, last = buffers[k]
+        offset = 0
+        overlapping = [e for e in offsets if buffers[e][1] <= last and first <= buffers[e][2]]
+        for e in sorted(overlapping, key=lambda e: offsets[e]):
+            if offset + nbytes <= offsets[e]:
+                break
+            offset = max(offset, offsets[e] + buffers[e][0])
+        offsets[k] = offset
+    return offsets
+
+
+def _root(a):
+    while isinstance(a.base, np.ndarray):
+        a = a.base
+    return a
+
+
+def _inner_blocks(block):
+    blocks = getattr(block, 'blocks', None)
+    if isinstance(blocks, list) and all(hasattr(b, 'fprop') for b in blocks):
+        return blocks
+    return []
+
+
+def _use(indices, first_step, last_step, first, last):
+    for k in indices:
+        first[k] = min(first.get(k, first_step), first_step)
+        last[k] = max(last.get(k, last_step), last_step)
+
+
+def _reachable(obj, exclude=()):
+    """
+    Returns arrays and connectors that are reachable from ``obj`` through
+    attributes of quagga objects and containers.
+    """
+    arrays, connectors = [], []
+    visited = set(id(e) for e in exclude)
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in visited:
+            continue
+        visited.add(id(obj))
+        if isinstance(obj, np.ndarray):
+            arrays.append(obj)
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif type(obj).__module__.startswith('quagga.') and hasattr(obj, '__dict__'):
+            if isinstance(obj, Connector):
+                connectors.append(obj)
+            stack.extend(vars(obj).values())
+    return arrays, connectors
@@ -0,0 +1,195 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import numpy as np
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.blocks import LstmBlock
+from quagga.connector import Connector
+from quagga.blocks import RowSlicingBlock
+from quagga.blocks import InputlessLstmBlock
+
+
+class StreamingLstm(object):
+    """
+    Runs a stack of :class:`~quagga.blocks.LstmBlock` layers (the first one
+    can be :class:`~quagga.blocks.InputlessLstmBlock`) one step at a time for
+    many concurrent sessions, e.g. for generation or encoding of sequences
+    that arrive token by token.
+
+    ``c`` and ``h`` of every open session are kept in a row (the session's
+    slot) of per layer stores of ``max_num_sessions`` rows. :meth:`step`
+    gathers the states of the given sessions into a batch, runs every layer
+    once for the whole batch and scatters the new states back, so a step
+    costs one matrix product per layer for any number of sessions. Outputs
+    of the top layer for the stepped sessions are in ``h``, blocks built on
+    ``h`` follow its number of rows.
+
+    Parameters are used by the stream's blocks, so their container has to be
+    propagated (``fprop``) before the first step.
+
+    Parameters
+    ----------
+    embd_W : Matrix (GpuMatrix or CpuMatrix)
+        Embedding of the tokens, None if the first layer is inputless
+    W : list
+        Input weights of every layer, None for the inputless first layer
+    R : list
+        Recurrent weights of every layer
+    b : list
+        Biases of every layer, can contain None
+    c0 : list
+        Initial ``c`` rows of every layer, can contain None for zeros
+    h0 : list
+        Initial ``h`` rows of every layer, can contain None for zeros
+    max_num_sessions : int
+    max_batch_size : int
+        Maximum number of sessions in one step
+    device_id : int
+        Defines the device's id on which the computation will take place
+    """
+    def __init__(self, embd_W, W, R, b, c0, h0, max_num_sessions, max_batch_size, device_id=None):
+        if any(e is None for e in W[1:]):
+            raise ValueError('Only the first layer can be inputless!')
+        if (embd_W is None) != (W[0] is None):
+            raise ValueError('The first layer must be inputless if and only if there is no embedding!')
+        self.context = Context(device_id)
+        device_id = self.context.device_id
+        self.max_num_sessions = max_num_sessions
+        self.max_batch_size = max_batch_size
+        self.free_slots = range(max_num_sessions - 1, -1, -1)
+        # all batch matrices share the number of rows with slots
+        self.slots = Matrix.empty(max_batch_size, 1, 'int', device_id)
+        self.source_slots = Matrix.empty(self.slots.nrows, 1, 'int', device_id)
+        self.slot = Matrix.empty(1, 1, 'int', device_id)
+
+        if embd_W:
+            self.tokens = Connector(Matrix.empty(self.slots.nrows, 1, 'int', device_id))
+            self.embd_block = RowSlicingBlock(_forward_only(embd_W, device_id), self.tokens)
+            x = self.embd_block.output
+        self.blocks = []
+        self.c_stores, self.h_stores = [], []
+        self.c0, self.h0 = [], []
+        self.prev_c, self.prev_h = [], []
+        self.state_row = []
+        for k in xrange(len(R)):
+            dim = int(R[k].nrows)
+            self.c_stores.append(Matrix.empty(max_num_sessions, dim, device_id=device_id))
+            self.h_stores.append(Matrix.empty(max_num_sessions, dim, device_id=device_id))
+            for inits, init in [(self.c0, c0[k]), (self.h0, h0[k])]:
+                if init is None:
+                    inits.append(Matrix.from_npa(np.zeros((1, dim), np.float32), device_id=device_id))
+                else:
+                    inits.append(init.register_usage(device_id))
+            self.state_row.append(Matrix.empty(1, dim, device_id=device_id))
+            prev_c = Connector(Matrix.empty(self.slots.nrows, dim, device_id=device_id))
+            prev_h = Connector(Matrix.empty(self.slots.nrows, dim, device_id=device_id))
+            if b[k] is None:
+                b_k = Connector(Matrix.from_npa(np.zeros((1, 4 * dim), np.float32), device_id=device_id))
+            else:
+                b_k = _forward_only(b[k], device_id)
+            R_k = _forward_only(R[k], device_id)
+            if W[k] is None:
+                block = InputlessLstmBlock(R_k, b_k, None, None, prev_c, prev_h, device_id)
+            else:
+                block = LstmBlock(_forward_only(W[k], device_id), R_k, b_k, None, x, None, prev_c, prev_h, device_id)
+            self.prev_c.append(block.prev_c)
+            self.prev_h.append(block.prev_h)
+            self.blocks.append(block)
+            x = block.h
+        self.h = x
+        self.contexts = [block.f_context for block in self.blocks]
+        if embd_W:
+            self.contexts.append(self.embd_block.context)
+
+    def open_session(self, c=None, h=None):
+        """
+        Returns id of a new session whose states are the initial ones or,
+        for the layers where ``c`` or ``h`` (lists of rows) are not None,
+        these rows.
+        """
+        if not self.free_slots:
+            raise ValueError('There are already {} open sessions!'.format(self.max_num_sessions))
+        session = self.free_slots.pop()
+        self.slot.assign_npa(self.context, np.array([[session]], np.int32))
+        for k in xrange(len(self.blocks)):
+            for stores, inits, rows in [(self.c_stores, self.c0, c), (self.h_stores, self.h0, h)]:
+                if rows is not None and rows[k] is not None:
+                    self.state_row[k].assign_npa(self.context, rows[k])
+                    stores[k].assign_rows_slice(self.context, self.slot, self.state_row[k])
+                else:
+                    stores[k].assign_rows_slice(self.context, self.slot, inits[k])
+        return session
+
+    def close_session(self, session):
+        """
+        Frees the slot of ``session`` for new sessions.
+        """
+        if session in self.free_slots or not 0 <= session < self.max_num_sessions:
+            raise ValueError('Session {} is not open!'.format(session))
+        self.free_slots.append(session)
+
+    def assign_states(self, sessions, sources):
+        """
+        Copies states of ``sources[i]`` to ``sessions[i]`` with row gathers,
+        e.g. to reorder hypotheses of beam search. All states are read before
+        any is written, so ``sessions`` and ``sources`` can overlap. ``h`` is
+        not valid until the next step.
+        """
+        if len(set(sessions)) != len(sessions):
+            raise ValueError('Sessions must be distinct!')
+        self.slots.nrows = len(sessions)
+        self.slots.assign_npa(self.context, np.array(sessions, np.int32)[:, np.newaxis])
+        self.source_slots.assign_npa(self.context, np.array(sources, np.int32)[:, np.newaxis])
+        # batch inputs of the blocks are free until the next step
+        for k in xrange(len(self.blocks)):
+            self.c_stores[k].slice_rows(self.context, self.source_slots, self.prev_c[k])
+            self.h_stores[k].slice_rows(self.context, self.source_slots, self.prev_h[k])
+            self.c_stores[k].assign_rows_slice(self.context, self.slots, self.prev_c[k])
+            self.h_stores[k].assign_rows_slice(self.context, self.slots, self.prev_h[k])
+
+    def step(self, sessions, tokens=None):
+        """
+        Advances ``sessions`` by ``tokens`` (one token per session, None if
+        the first layer is inputless). The i-th row of ``h`` is the output
+        of ``sessions[i]``.
+        """
+        if len(set(sessions)) != len(sessions):
+            raise ValueError('Sessions of one step must be distinct!')
+        if hasattr(self, 'embd_block') and (tokens is None or len(tokens) != len(sessions)):
+            raise ValueError('There must be a token for every session!')
+        self.slots.nrows = len(sessions)
+        self.slots.assign_npa(self.context, np.array(sessions, np.int32)[:, np.newaxis])
+        if hasattr(self, 'embd_block'):
+            self.tokens.assign_npa(self.context, np.array(tokens, np.int32)[:, np.newaxis])
+            self.tokens.fprop()
+        for k in xrange(len(self.blocks)):
+            self.c_stores[k].slice_rows(self.context, self.slots, self.prev_c[k])
+            self.h_stores[k].slice_rows(self.context, self.slots, self.prev_h[k])
+        # blocks must not overwrite their outputs before the previous
+        # step stored them
+        self.context.block(*self.contexts)
+        if hasattr(self, 'embd_block'):
+            self.embd_block.fprop()
+        for block in self.blocks:
+            block.fprop()
+        for k, block in enumerate(self.blocks):
+            self.c_stores[k].assign_rows_slice(self.context, self.slots, block.c)
+            self.h_stores[k].assign_rows_slice(self.context, self.slots, block.h)
+
+
+def _forward_only(param, device_id):
+    # blocks of the stream do not allocate derivatives of parameters
+    return Connector(param.register_usage(device_id))
\ No newline at end of file
@@ -0,0 +1,243 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import numpy as np
+from itertools import izip
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.connector import Connector
+
+
+class AdaptiveSoftmaxCeBlock(object):
+    """
+    Adaptive softmax (Grave et al., 2016) with mean cross entropy loss.
+    Classes must be sorted by decreasing frequency and are split by
+    ``cutoffs`` into the head and tail clusters. The head softmax is taken
+    over the head classes and one token per tail cluster. The probability of
+    a tail class is the probability of its cluster token times the softmax
+    over the cluster, which is computed from a projection of ``x`` to a lower
+    dimension. The probabilities are exactly normalized.
+
+    During ``fprop`` the labels are copied to host and the rows of every
+    tail cluster are gathered, so a cluster costs in proportion to the
+    number of rows whose labels belong to it. Derivatives of ``x`` are
+    scattered back to their rows. In testing mode probabilities of all
+    classes are also stored in ``probs`` unless ``output_probs`` is False.
+
+    Parameters
+    ----------
+    head_W : Matrix (GpuMatrix or CpuMatrix)
+        Head weights, a column for every head class and tail cluster
+    head_b : Matrix (GpuMatrix or CpuMatrix)
+        Head bias row, can be None
+    tail_params : list
+        Pairs of a projection to the cluster's dimension and the cluster's
+        weights, one pair per tail cluster
+    x : Matrix (GpuMatrix or CpuMatrix)
+        Block's input
+    true_labels : Matrix (GpuMatrix or CpuMatrix)
+        Column of class indices (int)
+    cutoffs : list
+        Increasing class indices at which clusters end, the last one is the
+        number of classes
+    mask : Matrix (GpuMatrix or CpuMatrix)
+        Column that is 0 for padded rows, can be None
+    output_probs : bool
+    device_id : int
+        Defines the device's id on which the computation will take place
+    """
+    def __init__(self, head_W, head_b, tail_params, x, true_labels, cutoffs,
+                 mask=None, output_probs=True, device_id=None):
+        if len(tail_params) != len(cutoffs) - 1:
+            raise ValueError('There must be a pair of parameters for every tail cluster!')
+        if int(head_W.ncols) != cutoffs[0] + len(tail_params):
+            raise ValueError('Head must have a column for every head class and tail cluster!')
+        self.context = Context(device_id)
+        device_id = self.context.device_id
+        self.cutoffs = cutoffs
+        # dL/dparam is None for parameters that are not bpropagable
+        head_W, dL_dhead_W = _register_usage(head_W, device_id)
+        self.W, self.dL_dW = [head_W], [dL_dhead_W]
+        if head_b:
+            self.b, self.dL_db = _register_usage(head_b, device_id)
+        self.P, self.dL_dP = [], []
+        for P, W in tail_params:
+            P, dL_dP = _register_usage(P, device_id)
+            W, dL_dW = _register_usage(W, device_id)
+            self.P.append(P)
+            self.dL_dP.append(dL_dP)
+            self.W.append(W)
+            self.dL_dW.append(dL_dW)
+        if x.bpropagable:
+            self.x, self.dL_dx = x.register_usage(device_id, device_id)
+        else:
+            self.x = x.register_usage(device_id)
+        self.true_labels = true_labels.register_usage(device_id)
+        if mask:
+            self.mask = mask.register_usage(device_id)
+        self.learning = hasattr(self, 'dL_dx') or getattr(self, 'dL_db', None) is not None or \
+                        any(d is not None for d in self.dL_dW + self.dL_dP)
+        if self.learning:
+            self.b_context = Context(device_id)
+
+        # logits hold dL/dlogits after fprop, h_k holds dL/dh_k and
+        # x_k holds dL/dx_k during bprop
+        nrows, dim = self.x.nrows, self.x.ncols
+        max_nrows = int(nrows)
+        self.logits = [Matrix.empty(nrows, head_W.ncols, device_id=device_id)]
+        self.labels = [Matrix.empty(nrows, 1, 'int', device_id)]
+        self.losses = Matrix.empty(nrows, 1, device_id=device_id)
+        self.row_indices = [None]
+        self.x_k = [None]
+        self.h_k = [None]
+        self.mask_k = [None]
+        self.losses_k = [None]
+        for P, W in izip(self.P, self.W[1:]):
+            self.row_indices.append(Matrix.empty(max_nrows, 1, 'int', device_id))
+            self.x_k.append(Matrix.empty(max_nrows, dim, device_id=device_id))
+            self.h_k.append(Matrix.empty(max_nrows, P.ncols, device_id=device_id))
+            self.logits.append(Matrix.empty(max_nrows, W.ncols, device_id=device_id))
+            self.labels.append(Matrix.empty(max_nrows, 1, 'int', device_id))
+            self.losses_k.append(Matrix.empty(max_nrows, 1, device_id=device_id))
+            if mask:
+                self.mask_k.append(Matrix.empty(max_nrows, 1, device_id=device_id))
+        self.nrows_k = [0] * len(self.W)
+        if output_probs:
+            self.probs = Connector(Matrix.empty(nrows, cutoffs[-1], device_id=device_id))
+            self.head_probs = Matrix.empty_like(self.logits[0], device_id)
+            self.cluster_probs = [Matrix.empty(nrows, cutoffs[0], device_id=device_id)]
+            self.cluster_probs.extend(Matrix.empty(nrows, 1, device_id=device_id) for _ in self.P)
+            self.tail_probs = [Matrix.empty(nrows, W.ncols, device_id=device_id) for W in self.W[1:]]
+            self.tail_h = [Matrix.empty(nrows, P.ncols, device_id=device_id) for P in self.P]
+        self.training_mode = True
+        self.loss = None
+
+    def fprop(self):
+        # host side split of the rows into clusters
+        true_labels = self.true_labels.to_host()[:, 0]
+        head_labels = np.minimum(true_labels, self.cutoffs[0])
+        for k in xrange(1, len(self.W)):
+            in_cluster = (true_labels >= self.cutoffs[k - 1]) & (true_labels < self.cutoffs[k])
+            head_labels[in_cluster] = self.cutoffs[0] + k - 1
+            row_indices = np.flatnonzero(in_cluster).astype(np.int32)[:, np.newaxis]
+            self.nrows_k[k] = row_indices.shape[0]
+            if self.nrows_k[k]:
+                self.row_indices[k].assign_npa(self.context, row_indices)
+                labels = true_labels[row_indices] - self.cutoffs[k - 1]
+                self.labels[k].assign_npa(self.context, labels.astype(np.int32))
+        self.labels[0].assign_npa(self.context, head_labels.astype(np.int32)[:, np.newaxis])
+
+        # head
+        logits = self.logits[0]
+        logits.assign_dot(self.context, self.x, self.W[0])
+        if hasattr(self, 'b'):
+            logits.add(self.context, self.b)
+        if not self.training_mode and hasattr(self, 'probs'):
+            logits.softmax(self.context, self.head_probs)
+        dL_dlogits = logits if self.learning and self.training_mode else None
+        logits.softmax_ce(self.context, self.labels[0], self.losses, dL_dlogits)
+
+        # tail clusters, only on their rows
+        for k in xrange(1, len(self.W)):
+            nrows = self.nrows_k[k]
+            if not nrows:
+                continue
+            x_k, h_k, logits = self.x_k[k], self.h_k[k], self.logits[k]
+            for m in [x_k, h_k, logits, self.labels[k], self.losses_k[k]]:
+                m.nrows = nrows
+            self.x.slice_rows(self.context, self.row_indices[k], x_k)
+            h_k.assign_dot(self.context, x_k, self.P[k - 1])
+            logits.assign_dot(self.context, h_k, self.W[k])
+            dL_dlogits = logits if self.learning and self.training_mode else None
+            logits.softmax_ce(self.context, self.labels[k], self.losses_k[k], dL_dlogits)
+            self.losses.add_rows_slice(self.context, self.row_indices[k], self.losses_k[k])
+
+        if not self.training_mode and hasattr(self, 'probs'):
+            self._fprop_probs()
+
+    def _fprop_probs(self):
+        # probs = [p(head), p(cluster k) * softmax(x * P_k * W_k)]
+        self.head_probs.hsplit(self.context, self.cluster_probs)
+        for k in xrange(1, len(self.W)):
+            tail_probs = self.tail_probs[k - 1]
+            self.tail_h[k - 1].assign_dot(self.context, self.x, self.P[k - 1])
+            tail_probs.assign_dot(self.context, self.tail_h[k - 1], self.W[k])
+            tail_probs.softmax(self.context, tail_probs)
+            tail_probs.hprod(self.context, self.cluster_probs[k])
+        self.probs.assign_hstack(self.context, self.cluster_probs[:1] + self.tail_probs)
+        self.probs.fprop()
+
+    def bprop(self):
+        if not self.learning or not self.training_mode:
+            return
+        self.b_context.wait(self.context)
+        nrows = int(self.x.nrows)
+        # head
+        dL_dlogits = self.logits[0]
+        if hasattr(self, 'mask'):
+            dL_dlogits.hprod(self.b_context, self.mask)
+        if self.dL_dW[0] is not None:
+            self.dL_dW[0].add_dot(self.b_context, self.x, dL_dlogits, 'T')
+        if getattr(self, 'dL_db', None) is not None:
+            self.dL_db.add_sum_along_axis(self.b_context, dL_dlogits, axis=0)
+        if hasattr(self, 'dL_dx'):
+            self.dL_dx.add_dot(self.b_context, dL_dlogits, self.W[0], 'N', 'T')
+
+        # tail clusters, derivatives are scaled from the mean over the
+        # cluster's rows to the mean over all rows
+        for k in xrange(1, len(self.W)):
+            if not self.nrows_k[k]:
+                continue
+            x_k, h_k, dL_dlogits = self.x_k[k], self.h_k[k], self.logits[k]
+            dL_dlogits.scale(self.b_context, float(self.nrows_k[k]) / nrows, dL_dlogits)
+            if hasattr(self, 'mask'):
+                self.mask_k[k].nrows = self.nrows_k[k]
+                self.mask.slice_rows(self.b_context, self.row_indices[k], self.mask_k[k])
+                dL_dlogits.hprod(self.b_context, self.mask_k[k])
+            if self.dL_dW[k] is not None:
+                self.dL_dW[k].add_dot(self.b_context, h_k, dL_dlogits, 'T')
+            if self.dL_dP[k - 1] is None and not hasattr(self, 'dL_dx'):
+                continue
+            dL_dh_k = h_k
+            dL_dh_k.assign_dot(self.b_context, dL_dlogits, self.W[k], 'N', 'T')
+            if self.dL_dP[k - 1] is not None:
+                self.dL_dP[k - 1].add_dot(self.b_context, x_k, dL_dh_k, 'T')
+            if hasattr(self, 'dL_dx'):
+                dL_dx_k = x_k
+                dL_dx_k.assign_dot(self.b_context, dL_dh_k, self.P[k - 1], 'N', 'T')
+                self.dL_dx.add_rows_slice(self.b_context, self.row_indices[k], dL_dx_k)
+
+    def calculate_loss(self, context):
+        losses_np = self.losses.to_host(context)
+        mask = self.mask.to_host(context) if hasattr(self, 'mask') else None
+        context.add_callback(self._calculate_mean_loss, losses_np, mask)
+
+    def _calculate_mean_loss(self, losses_np, mask=None):
+        if mask is not None:
+            self.loss = np.sum(losses_np * mask) / np.sum(mask)
+        else:
+            self.loss = np.mean(losses_np)
+
+    def set_training_mode(self):
+        self.training_mode = True
+
+    def set_testing_mode(self):
+        self.training_mode = False
+
+
+def _register_usage(param, device_id):
+    if param.bpropagable:
+        return param.register_usage(device_id, device_id)
+    return param.register_usage(device_id), None
\ No newline at end of file
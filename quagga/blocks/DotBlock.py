@@ -45,8 +45,6 @@ class DotBlock(object):
         if b:
             if b.bpropagable:
                 self.b, self.dL_db = b.register_usage(device_id, device_id)
-                self.ones = Matrix.empty(x.nrows, 1, self.b.dtype, device_id)
-                self.ones.sync_fill(1.0)
             else:
                 self.b = b.register_usage(device_id)
         if x.bpropagable:
@@ -76,10 +74,9 @@ class DotBlock(object):
         # dL/dW = x.T * dL_doutput
         if hasattr(self, 'dL_dW'):
             self.dL_dW.add_dot(self.b_context, self.x, dL_doutput, 'T')
-        # TODO(sergii): replace this modification with reduction kernel along axis=0
-        # dL/db = 1.T * dL_doutput
+        # dL/db = sum(dL_doutput, axis=0)
         if hasattr(self, 'dL_db'):
-            self.dL_db.add_dot(self.b_context, self.ones, dL_doutput, 'T')
+            self.dL_db.add_sum_along_axis(self.b_context, dL_doutput, axis=0)
         # dL/dx = dL_doutput * W.T
         if hasattr(self, 'dL_dx'):
             self.dL_dx.add_dot(self.b_context, dL_doutput, self.W, 'N', 'T')
\ No newline at end of file
@@ -0,0 +1,294 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import quagga
+from quagga.matrix import Matrix
+from quagga.connector import Connector
+
+
+class LstmCell(object):
+    """
+    Cell computations shared by :class:`~quagga.blocks.LstmBlock` and
+    :class:`~quagga.blocks.InputlessLstmBlock`. Subclasses register their
+    parameters and inputs (``x`` and ``W`` only if the block has an input)
+    and call :meth:`_init_cell`.
+    """
+    def _init_cell(self, batch_size, device_id):
+        # CPU matrices have fused cell operations. Both paths recompute
+        # activation derivatives from the activations during the backward
+        # pass instead of storing them
+        self.fused = quagga.processor_type == 'cpu'
+        self.input_projected = False
+        self.weight_gradients_deferred = False
+
+        dim = self.R.nrows
+        self._set_zifo(Matrix.empty(batch_size, 4 * dim, device_id=device_id))
+        self.c = Matrix.empty(batch_size, dim, device_id=device_id)
+        self.c = Connector(self.c, device_id if self.learning else None)
+        self.tanh_c = Matrix.empty_like(self.c, device_id)
+        self.h = Matrix.empty_like(self.c, device_id)
+        self.h = Connector(self.h, device_id if self.learning else None)
+
+        if self.learning:
+            self._set_dL_dpre_zifo(Matrix.empty_like(self.zifo))
+
+    def _set_zifo(self, zifo):
+        dim = self.R.nrows
+        self.zifo = zifo
+        self.z = self.zifo[:, 0*dim:1*dim]
+        self.i = self.zifo[:, 1*dim:2*dim]
+        self.f = self.zifo[:, 2*dim:3*dim]
+        self.o = self.zifo[:, 3*dim:4*dim]
+
+    def _set_dL_dpre_zifo(self, dL_dpre_zifo):
+        if self.fused:
+            self.dL_dpre_zifo = dL_dpre_zifo
+            return
+        # dzifo/dpre_zifo is computed from zifo during bprop,
+        # dL/dpre_zifo overwrites derivatives in the same buffer
+        dim = self.R.nrows
+        self._dzifo_dpre_zifo = dL_dpre_zifo
+        self.dz_dpre_z = self._dzifo_dpre_zifo[:, 0*dim:1*dim]
+        self.di_dpre_i = self._dzifo_dpre_zifo[:, 1*dim:2*dim]
+        self.df_dpre_f = self._dzifo_dpre_zifo[:, 2*dim:3*dim]
+        self.do_dpre_o = self._dzifo_dpre_zifo[:, 3*dim:4*dim]
+        self.dL_dpre_zifo = self._dzifo_dpre_zifo
+        self.dL_dpre_z = self.dz_dpre_z
+        self.dL_dpre_i = self.di_dpre_i
+        self.dL_dpre_f = self.df_dpre_f
+        self.dL_dpre_o = self.do_dpre_o
+
+    def use_input_projection(self, zifo):
+        """
+        Makes the block use ``zifo`` that is already filled with x[t] * W,
+        for instance by :class:`~quagga.blocks.SequencerBlock` that computes
+        the input projection for all timesteps with one matrix product.
+        """
+        if not hasattr(self, 'W'):
+            raise ValueError('Inputless block has no input projection!')
+        self._set_zifo(zifo)
+        self.input_projected = True
+
+    def defer_weight_gradients(self, dL_dpre_zifo):
+        """
+        Makes the block store dL/dpre_zifo[t] in ``dL_dpre_zifo`` and skip
+        accumulation of dL/dW, dL/dR, dL/db and dL/dx, so that the caller (e.g.
+        :class:`~quagga.blocks.SequencerBlock`) can compute them for all
+        timesteps with one matrix product each.
+        """
+        self._set_dL_dpre_zifo(dL_dpre_zifo)
+        self.weight_gradients_deferred = True
+
+    def share_dL_dpre_zifo(self, block):
+        """
+        Makes the block keep dL/dpre_zifo[t] in the buffer of ``block``. The
+        buffer is overwritten by the ``bprop`` of the other block, so it must
+        wait for :attr:`bprop_contexts` of this block (see
+        ``checkpoint_every`` of :class:`~quagga.blocks.SequencerBlock`).
+        """
+        if self.weight_gradients_deferred or block.weight_gradients_deferred:
+            raise ValueError('Blocks with deferred weight gradients can not share dL_dpre_zifo!')
+        self._set_dL_dpre_zifo(block.dL_dpre_zifo)
+
+    @property
+    def bprop_contexts(self):
+        """
+        Contexts in which ``bprop`` reads dL/dpre_zifo[t].
+        """
+        names = ['b_context', 'W_b_context', 'R_b_context', 'b_b_context', 'x_b_context']
+        return [getattr(self, name) for name in names if hasattr(self, name)]
+
+    def use_active_rows(self):
+        """
+        Makes the block read only the first ``x.nrows`` rows of prev_c[t] and
+        prev_h[t], so that x[t] of packed sequences (sorted by decreasing
+        length) may have fewer rows than x[t-1]. Requires row slicing of
+        matrices that only :class:`~quagga.matrix.CpuMatrix` supports.
+        """
+        if not hasattr(self, 'x'):
+            raise ValueError('Batch of inputless block is given by prev_c!')
+        if hasattr(self, 'mask'):
+            raise ValueError('Packed sequences can not be masked!')
+        nrows = self.x.nrows
+        self._active_rows = []
+        for name in ['prev_c', 'prev_h', 'dL_dprev_c', 'dL_dprev_h']:
+            if hasattr(self, name):
+                matrix = getattr(self, name)
+                setattr(self, name, matrix[:nrows])
+                self._active_rows.append((getattr(self, name), matrix))
+
+    def _pass_modif_contexts(self, to_views):
+        # views of the active rows do not share last_modif_context with
+        # their matrices, which the neighbouring blocks read and write
+        for view, matrix in getattr(self, '_active_rows', []):
+            if to_views:
+                view.last_modif_context = matrix.last_modif_context
+            else:
+                matrix.last_modif_context = view.last_modif_context
+
+    def use_reset(self, reset):
+        """
+        Makes the block zero prev_c[t] and prev_h[t] in the rows where
+        ``reset`` (column) is 1, so that a new sequence starts in the row at
+        this timestep and no gradient is propagated to the previous one.
+        Used for batches whose rows consist of several packed sequences.
+        """
+        device_id = self.f_context.device_id
+        self.reset = reset.register_usage(device_id)
+        self._prev_c, self._prev_h = self.prev_c, self.prev_h
+        self.prev_c = Matrix.empty_like(self._prev_c, device_id)
+        self.prev_h = Matrix.empty_like(self._prev_h, device_id)
+        if hasattr(self, 'dL_dprev_c'):
+            self._dL_dprev_c = self.dL_dprev_c
+            self.dL_dprev_c = Matrix.empty_like(self.prev_c, device_id)
+        if hasattr(self, 'dL_dprev_h'):
+            self._dL_dprev_h = self.dL_dprev_h
+            self.dL_dprev_h = Matrix.empty_like(self.prev_h, device_id)
+
+    def _reset_prevs(self):
+        # s[t-1] = (1 - reset) .* s[t-1]
+        for prev, _prev in [(self.prev_c, self._prev_c), (self.prev_h, self._prev_h)]:
+            prev.fill(self.f_context, 0.0)
+            prev.add_hprod_one_minus_mask(self.f_context, self.reset, _prev)
+
+    def _bprop_reset(self):
+        # dL/ds[t-1] += (1 - reset) .* dL/ds'[t-1]
+        for name in ['dL_dprev_c', 'dL_dprev_h']:
+            if hasattr(self, name):
+                getattr(self, '_' + name).add_hprod_one_minus_mask(self.b_context, self.reset, getattr(self, name))
+
+    def share_activations(self, block, share_c=True):
+        """
+        Makes the block keep its gates, tanh(c[t]) and, if ``share_c``, c[t]
+        in the buffers of ``block``. The buffers are overwritten by the
+        ``fprop`` of the other block, so their values have to be restored
+        with :meth:`recompute` before ``bprop`` (see ``checkpoint_every`` of
+        :class:`~quagga.blocks.SequencerBlock`).
+        """
+        if self.input_projected or block.input_projected:
+            raise ValueError('Blocks with projected inputs can not share activations!')
+        self._set_zifo(block.zifo)
+        self.tanh_c = block.tanh_c
+        if share_c:
+            c = self.c.register_usage(self.f_context.device_id)
+            c.data = block.c.register_usage(block.f_context.device_id).data
+
+    def fprop(self):
+        self.recompute()
+        self.c.fprop()
+        self.h.fprop()
+
+    def recompute(self):
+        """
+        Computes the gates, c[t] and h[t] as ``fprop`` does, but does not
+        propagate the outputs, so derivatives that were already accumulated
+        for c[t] and h[t] are kept.
+        """
+        self._pass_modif_contexts(to_views=True)
+        if hasattr(self, 'reset'):
+            self._reset_prevs()
+        if self.fused:
+            self.zifo.lstm_cell(self.f_context, getattr(self, 'x', None), getattr(self, 'W', None),
+                                self.prev_h, self.R, self.b, self.prev_c, self.c, self.tanh_c, self.h,
+                                getattr(self, 'mask', None), self.input_projected)
+            return
+        # zifo = tanh_sigm(x[t] * W + h[t-1] * R + b)
+        if self.input_projected:
+            self.zifo.add_dot(self.f_context, self.prev_h, self.R)
+        elif hasattr(self, 'W'):
+            self.zifo.assign_dot(self.f_context, self.x, self.W)
+            self.zifo.add_dot(self.f_context, self.prev_h, self.R)
+        else:
+            self.zifo.assign_dot(self.f_context, self.prev_h, self.R)
+        self.zifo.add(self.f_context, self.b)
+        self.zifo.tanh_sigm(self.f_context, self.zifo, axis=1)
+
+        # c[t] = i[t] .* z[t] + f[t] .* c[t-1]
+        # h[t] = o[t] .* tanh(c[t])
+        self.c.assign_sum_hprod(self.f_context, self.i, self.z, self.f, self.prev_c)
+        self.c.tanh(self.f_context, self.tanh_c)
+        self.h.assign_hprod(self.f_context, self.o, self.tanh_c)
+        if hasattr(self, 'mask'):
+            # s[t] = mask .* s[t] + (1 - mask) .* s[t-1]
+            self.c.assign_masked_addition(self.f_context, self.mask, self.c, self.prev_c)
+            self.h.assign_masked_addition(self.f_context, self.mask, self.h, self.prev_h)
+
+    def bprop(self):
+        if not self.learning:
+            return
+        self._pass_modif_contexts(to_views=True)
+        if hasattr(self, 'reset'):
+            # dL/ds'[t-1] of the reset states are accumulated from scratch
+            for name in ['dL_dprev_c', 'dL_dprev_h']:
+                if hasattr(self, name):
+                    getattr(self, name).fill(self.b_context, 0.0)
+        dL_dc = self.c.backward_matrix
+        dL_dh = self.h.backward_matrix
+        if self.fused:
+            self.dL_dpre_zifo.lstm_cell_derivative(self.b_context, self.zifo, self.prev_c, self.tanh_c,
+                                                   dL_dc, dL_dh, self.grad_clipping, getattr(self, 'mask', None),
+                                                   getattr(self, 'dL_dprev_c', None), getattr(self, 'dL_dprev_h', None))
+        else:
+            if hasattr(self, 'mask'):
+                # dL/ds[t-1] = (1 - mask) .* dL/ds[t]
+                # dL/ds[t] = mask .* dL/ds[t]
+                if hasattr(self, 'dL_dprev_c'):
+                    self.dL_dprev_c.add_hprod_one_minus_mask(self.b_context, self.mask, dL_dc)
+                dL_dc.hprod(self.b_context, self.mask)
+                if hasattr(self, 'dL_dprev_h'):
+                    self.dL_dprev_h.add_hprod_one_minus_mask(self.b_context, self.mask, dL_dh)
+                dL_dh.hprod(self.b_context, self.mask)
+            # dL/dc[t] = dL[t+1]/dc[t] + dL/dh[t] .* o[t] .* dtanh(c[t])/dc[t]
+            # dL/dpre_o[t] holds dL/dh[t] .* o[t] until the gate derivatives
+            # are computed
+            self.dL_dpre_o.assign_hprod(self.b_context, dL_dh, self.o)
+            dL_dc.add_tanh_derivative(self.b_context, self.tanh_c, self.dL_dpre_o)
+            self._dzifo_dpre_zifo.assign_tanh_sigm_derivative(self.b_context, self.zifo, axis=1)
+
+            # dL/dpre_o[t] = dL/dh[t] .* tanh(c[t]) .* do[t]/dpre_o[t]
+            # dL/dpre_f[t] = dL/dc[t] .* c[t-1] .* df[t]/dpre_f[t]
+            # dL/dpre_i[t] = dL/dc[t] .* z[t] .* di[t]/dpre_i[t]
+            # dL/dpre_z[t] = dL/dc[t] .* i[t] .* dz[t]/dpre_z[t]
+            self.dL_dpre_o.assign_hprod(self.b_context, dL_dh, self.tanh_c, self.do_dpre_o)
+            self.dL_dpre_f.assign_hprod(self.b_context, dL_dc, self.prev_c, self.df_dpre_f)
+            self.dL_dpre_i.assign_hprod(self.b_context, dL_dc, self.z, self.di_dpre_i)
+            self.dL_dpre_z.assign_hprod(self.b_context, dL_dc, self.i, self.dz_dpre_z)
+            self.dL_dpre_zifo.last_modif_context = self.b_context
+
+            if self.grad_clipping:
+                self.dL_dpre_zifo.clip(self.b_context, -self.grad_clipping, self.grad_clipping)
+            if hasattr(self, 'dL_dprev_c'):
+                # dL/dc[t-1] = f[t] .* dL/dc[t]
+                self.dL_dprev_c.add_hprod(self.b_context, self.f, dL_dc)
+
+        if not self.weight_gradients_deferred:
+            if hasattr(self, 'dL_dW'):
+                # dL_dW += x[t].T * dL/dpre_zifo[t]
+                self.dL_dW.add_dot(self.W_b_context, self.x, self.dL_dpre_zifo, 'T')
+            if hasattr(self, 'dL_dR'):
+                # dL_dR += h[t-1].T * dL/dpre_zifo[t]
+                self.dL_dR.add_dot(self.R_b_context, self.prev_h, self.dL_dpre_zifo, 'T')
+            if hasattr(self, 'dL_db'):
+                # dL_db += sum(dL/dpre_zifo[t], axis=0)
+                self.dL_db.add_sum_along_axis(self.b_b_context, self.dL_dpre_zifo, axis=0)
+            if hasattr(self, 'dL_dx'):
+                # dL/dx[t] = dL/dpre_zifo[t] * W.T
+                self.dL_dx.add_dot(self.x_b_context, self.dL_dpre_zifo, self.W, 'N', 'T')
+        if hasattr(self, 'dL_dprev_h'):
+            # dL/dh[t-1] = dL/dpre_zifo[t] * R.T
+            self.dL_dprev_h.add_dot(self.b_context, self.dL_dpre_zifo, self.R, 'N', 'T')
+        if hasattr(self, 'reset'):
+            self._bprop_reset()
+        self._pass_modif_contexts(to_views=False)
\ No newline at end of file
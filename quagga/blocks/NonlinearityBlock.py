@@ -39,37 +39,29 @@ class NonlinearityBlock(object):
         if self.learning:
             self.b_context = Context(device_id)
             self.x, self.dL_dx = x.register_usage(device_id, device_id)
-            self._df_dpref = Matrix.empty_like(self.x, device_id)
         else:
             self.x = x.register_usage(device_id)
         output = Matrix.empty_like(x, device_id)
         self.output = Connector(output, device_id if self.learning else None)
-        if nonlinearity == 'sigmoid':
-            self.f = self.x.sigmoid
-        elif nonlinearity == 'tanh':
-            self.f = self.x.tanh
-        elif nonlinearity == 'relu':
-            self.f = self.x.relu
-        elif nonlinearity == 'softmax':
+        if nonlinearity == 'softmax':
             raise ValueError('For softmax nonlinearity use SoftmaxBlock!')
-        else:
+        if nonlinearity not in {'sigmoid', 'tanh', 'relu'}:
             raise ValueError('TODO!')
+        self.f = getattr(self.x, nonlinearity)
+        if self.learning:
+            # df/dpref is computed from the output during bprop
+            self.add_df_dpref = getattr(self.dL_dx, 'add_{}_derivative'.format(nonlinearity))
         self.training_mode = True
 
-    @property
-    def df_dpref(self):
-        if self.training_mode and self.learning:
-            return self._df_dpref
-
     def fprop(self):
-        self.f(self.f_context, self.output, self.df_dpref)
+        self.f(self.f_context, self.output)
         self.output.fprop()
 
     def bprop(self):
         if hasattr(self, 'dL_dx'):
             # dL/dpref = dL/df .* df/dpref
             dL_df = self.output.backward_matrix
-            self.dL_dx.add_hprod(self.b_context, dL_df, self.df_dpref)
+            self.add_df_dpref(self.b_context, self.output, dL_df)
 
     def set_training_mode(self):
         self.training_mode = True
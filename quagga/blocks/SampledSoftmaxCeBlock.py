@@ -0,0 +1,228 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import numpy as np
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.connector import Connector
+
+
+class SampledSoftmaxCeBlock(object):
+    """
+    Output layer for large vocabularies that is trained with sampled softmax
+    cross entropy (Jean et al., 2015), which is a variant of noise
+    contrastive estimation.
+
+    In training mode every ``fprop`` draws ``num_samples`` classes on the host
+    and the softmax of each row is taken over its true class and the drawn
+    ones only. Logits are corrected by the log of the expected number of
+    times the class is drawn. Only the rows of ``W`` and ``b`` that belong to
+    these classes are gathered and get gradients, so the cost does not depend
+    on the vocabulary size. Drawn classes that equal the true one are kept.
+
+    In testing mode the full softmax is computed and stored in ``probs``.
+
+    Parameters
+    ----------
+    W : Matrix (GpuMatrix or CpuMatrix)
+        Output embedding, a row for every class
+    b : Matrix (GpuMatrix or CpuMatrix)
+        Bias column, a row for every class, can be None
+    x : Matrix (GpuMatrix or CpuMatrix)
+        Block's input
+    true_labels : Matrix (GpuMatrix or CpuMatrix)
+        Column of class indices (int)
+    num_samples : int
+        Number of classes that are drawn for a batch
+    sampler : str or numpy.ndarray
+        ``'log_uniform'`` (Zipfian distribution, classes must be sorted by
+        decreasing frequency) or counts of all classes for the unigram
+        distribution
+    mask : Matrix (GpuMatrix or CpuMatrix)
+        Column that is 0 for padded rows, can be None
+    dense : bool
+        If False, gradients of ``W`` and ``b`` are sparse matrices of the
+        gathered rows
+    seed : int
+    device_id : int
+        Defines the device's id on which the computation will take place
+    """
+    def __init__(self, W, b, x, true_labels, num_samples, sampler='log_uniform',
+                 mask=None, dense=True, seed=42, device_id=None):
+        self.context = Context(device_id)
+        device_id = self.context.device_id
+        self.dense = dense
+        if W.bpropagable:
+            if dense:
+                self.W, self.dL_dW = W.register_usage(device_id, device_id)
+            else:
+                self.W, self.dL_dW = W.register_usage_with_sparse_backward_matrix()
+        else:
+            self.W = W.register_usage(device_id)
+        if b:
+            if b.bpropagable:
+                if dense:
+                    self.b, self.dL_db = b.register_usage(device_id, device_id)
+                else:
+                    self.b, self.dL_db = b.register_usage_with_sparse_backward_matrix()
+            else:
+                self.b = b.register_usage(device_id)
+        if x.bpropagable:
+            self.x, self.dL_dx = x.register_usage(device_id, device_id)
+        else:
+            self.x = x.register_usage(device_id)
+        self.true_labels = true_labels.register_usage(device_id)
+        if mask:
+            self.mask = mask.register_usage(device_id)
+        self.learning = hasattr(self, 'dL_dW') or hasattr(self, 'dL_db') or hasattr(self, 'dL_dx')
+        if self.learning:
+            self.b_context = Context(device_id)
+
+        num_classes = int(self.W.nrows)
+        if isinstance(sampler, basestring):
+            if sampler != 'log_uniform':
+                raise ValueError('Unknown sampler {}!'.format(sampler))
+            k = np.arange(num_classes, dtype=np.float64)
+            probs = np.log((k + 2) / (k + 1)) / np.log(num_classes + 1)
+        else:
+            probs = np.asarray(sampler, np.float64).flatten()
+            if probs.size != num_classes:
+                raise ValueError('Sampler must have a count for every class!')
+            probs /= probs.sum()
+        self.num_samples = num_samples
+        self.cdf = np.cumsum(probs)
+        # log of the expected number of times a class is drawn
+        self.log_q_np = np.log(num_samples * probs + 1e-20).astype(np.float32)[:, np.newaxis]
+        self.log_q = Matrix.from_npa(self.log_q_np, device_id=device_id)
+        self.rng = np.random.RandomState(seed)
+
+        nrows, dim = self.x.nrows, self.x.ncols
+        self.sampled_ids = Matrix.empty(num_samples, 1, 'int', device_id)
+        self.sampled_bias = Matrix.empty(num_samples, 1, device_id=device_id)
+        self.true_bias = Matrix.empty(nrows, 1, device_id=device_id)
+        if hasattr(self, 'b'):
+            self.b_true = Matrix.empty(nrows, 1, device_id=device_id)
+            self.b_sampled = Matrix.empty(num_samples, 1, device_id=device_id)
+        # W_true and W_sampled hold gradients of the gathered rows during bprop
+        self.W_true = Matrix.empty(nrows, dim, device_id=device_id)
+        self.W_sampled = Matrix.empty(num_samples, dim, device_id=device_id)
+        # true_logits and sampled_logits hold their derivatives during bprop
+        self.true_logits = Matrix.empty(nrows, 1, device_id=device_id)
+        self.sampled_logits = Matrix.empty(nrows, num_samples, device_id=device_id)
+        # logits holds dL/dlogits after fprop, the true class is the first one
+        self.logits = Matrix.empty(nrows, num_samples + 1, device_id=device_id)
+        self.losses = Matrix.empty(nrows, 1, device_id=device_id)
+        max_nrows = int(nrows)
+        self.ones = Matrix.from_npa(np.ones((max_nrows, 1), np.float32), device_id=device_id)
+        self.zeros = Matrix.from_npa(np.zeros((max_nrows, 1), np.int32), device_id=device_id)
+        self.probs = Connector(Matrix.empty(nrows, num_classes, device_id=device_id))
+        self.training_mode = True
+        self.loss = None
+
+    def fprop(self):
+        self.ones.nrows = self.x.nrows
+        self.zeros.nrows = self.x.nrows
+        if self.training_mode:
+            self._sampled_fprop()
+        else:
+            self._full_fprop()
+
+    def _sampled_fprop(self):
+        sampled_ids = np.searchsorted(self.cdf, self.rng.rand(self.num_samples) * self.cdf[-1])
+        sampled_ids = np.minimum(sampled_ids, self.cdf.size - 1).astype(np.int32)[:, np.newaxis]
+        self.sampled_ids.assign_npa(self.context, sampled_ids)
+        self.sampled_bias.assign_npa(self.context, -self.log_q_np[sampled_ids[:, 0]])
+        self.W.slice_rows(self.context, self.true_labels, self.W_true)
+        self.W.slice_rows(self.context, self.sampled_ids, self.W_sampled)
+        # bias = b[ids] - log(Q[ids])
+        self.log_q.slice_rows(self.context, self.true_labels, self.true_bias)
+        self.true_bias.scale(self.context, -1.0, self.true_bias)
+        if hasattr(self, 'b'):
+            self.b.slice_rows(self.context, self.true_labels, self.b_true)
+            self.true_bias.add(self.context, self.b_true)
+            self.b.slice_rows(self.context, self.sampled_ids, self.b_sampled)
+            self.sampled_bias.add(self.context, self.b_sampled)
+        # logits = [sum(x .* W[true_labels], axis=1), x * W[sampled_ids].T] + bias
+        self.true_logits.assign_hprod_sum(self.context, self.x, self.W_true)
+        self.true_logits.add(self.context, self.true_bias)
+        self.sampled_logits.assign_dot(self.context, self.x, self.W_sampled, 'N', 'T')
+        self.sampled_logits.add_dot(self.context, self.ones, self.sampled_bias, 'N', 'T')
+        self.logits.assign_hstack(self.context, [self.true_logits, self.sampled_logits])
+        # dL/dlogits replaces logits right away
+        dL_dlogits = self.logits if self.learning else None
+        self.logits.softmax_ce(self.context, self.zeros, self.losses, dL_dlogits)
+
+    def _full_fprop(self):
+        # probs = softmax(x * W.T + b.T)
+        self.probs.assign_dot(self.context, self.x, self.W, 'N', 'T')
+        if hasattr(self, 'b'):
+            self.probs.add_dot(self.context, self.ones, self.b, 'N', 'T')
+        self.probs.softmax_ce(self.context, self.true_labels, self.losses)
+        self.probs.softmax(self.context, self.probs)
+        self.probs.fprop()
+
+    def bprop(self):
+        if not self.learning or not self.training_mode:
+            return
+        self.b_context.wait(self.context)
+        dL_dlogits = self.logits
+        if hasattr(self, 'mask'):
+            dL_dlogits.hprod(self.b_context, self.mask)
+        dL_dtrue_logits, dL_dsampled_logits = self.true_logits, self.sampled_logits
+        dL_dlogits.hsplit(self.b_context, [dL_dtrue_logits, dL_dsampled_logits])
+        if hasattr(self, 'dL_dx'):
+            # dL/dx += dL/dtrue_logits .* W[true_labels] + dL/dsampled_logits * W[sampled_ids]
+            self.dL_dx.add_dot(self.b_context, dL_dsampled_logits, self.W_sampled)
+            self.W_true.hprod(self.b_context, dL_dtrue_logits)
+            self.dL_dx.add(self.b_context, self.W_true)
+        if hasattr(self, 'dL_dW'):
+            dL_dW_true, dL_dW_sampled = self.W_true, self.W_sampled
+            dL_dW_true.assign(self.b_context, self.x)
+            dL_dW_true.hprod(self.b_context, dL_dtrue_logits)
+            dL_dW_sampled.assign_dot(self.b_context, dL_dsampled_logits, self.x, 'T')
+            self._add_rows(self.dL_dW, self.true_labels, dL_dW_true)
+            self._add_rows(self.dL_dW, self.sampled_ids, dL_dW_sampled)
+        if hasattr(self, 'dL_db'):
+            dL_db_sampled = self.sampled_bias
+            dL_db_sampled.assign_dot(self.b_context, dL_dsampled_logits, self.ones, 'T')
+            self._add_rows(self.dL_db, self.true_labels, dL_dtrue_logits)
+            self._add_rows(self.dL_db, self.sampled_ids, dL_db_sampled)
+
+    def _add_rows(self, dL_dparam, row_indexes, dL_drows):
+        if self.dense:
+            dL_dparam.add_rows_slice(self.b_context, row_indexes, dL_drows)
+        else:
+            dL_dparam.add_rows_slice(row_indexes, dL_drows)
+
+    def calculate_loss(self, context):
+        """
+        Mean cross entropy, which is estimated over the drawn classes in
+        training mode
+        """
+        losses_np = self.losses.to_host(context)
+        mask = self.mask.to_host(context) if hasattr(self, 'mask') else None
+        context.add_callback(self._calculate_mean_loss, losses_np, mask)
+
+    def _calculate_mean_loss(self, losses_np, mask=None):
+        if mask is not None:
+            self.loss = np.sum(losses_np * mask) / np.sum(mask)
+        else:
+            self.loss = np.mean(losses_np)
+
+    def set_training_mode(self):
+        self.training_mode = True
+
+    def set_testing_mode(self):
+        self.training_mode = False
\ No newline at end of file
@@ -16,7 +16,9 @@
 from itertools import izip
 
 from quagga.utils import List
+from quagga.matrix import Matrix
 from quagga.context import Context
+from quagga.connector import Connector
 
 
 class SequencerBlock(object):
@@ -30,6 +32,52 @@ class SequencerBlock(object):
     prev_names
     paddings
     reverse
+    input_projection : bool
+        If True, inputs of all timesteps are multiplied by the input weights
+        with one matrix product before the recurrence. ``block_class`` must
+        provide ``use_input_projection`` method (e.g.
+        :class:`~quagga.blocks.LstmBlock`). Requires row slicing of matrices
+        that only :class:`~quagga.matrix.CpuMatrix` supports
+    defer_weight_gradients : bool
+        If True, weight gradients (and gradients of inputs) of all timesteps
+        are computed after the backward pass through time with one matrix
+        product each. ``block_class`` must provide ``defer_weight_gradients``
+        method. Requires row slicing of matrices as ``input_projection`` does
+    checkpoint_every : int
+        If set, timesteps are split into segments of ``checkpoint_every``
+        blocks and blocks at the same position of different segments keep
+        their intermediate activations in the same buffers (c[t] is kept only
+        at the end of a segment, unless it is an output). During ``bprop`` the
+        activations of a segment are recomputed from its checkpoint before
+        backpropagating through it, which costs about one extra ``fprop``.
+        Unless ``defer_weight_gradients`` is set, all blocks also keep
+        dL/dpre_zifo[t] in one buffer. ``block_class`` must provide
+        ``share_activations``, ``share_dL_dpre_zifo`` and ``recompute``
+        methods (e.g. :class:`~quagga.blocks.LstmBlock`). Can not be used
+        together with ``input_projection``
+    truncated_bptt : bool
+        If True, the sequences are consecutive windows of long streams. The
+        first timestep of a window starts from the last state (``prev_names``)
+        of the previous window instead of ``paddings``, and gradients are
+        not propagated to the previous window. ``paddings`` give the state of
+        the first window and of the first window after :meth:`reset_states`
+        and do not receive gradients. The state is carried between ``fprop``
+        calls, so the memory of the blocks must not be shared by
+        :class:`~quagga.MemoryPlanner` (see its ``keep`` argument)
+    packed : bool
+        If True, the sequences are packed: they are sorted by decreasing
+        length and ``nrows`` of the elements of a timestep is the number of
+        sequences that are still active, so the blocks compute only the
+        active rows. ``block_class`` must provide ``use_active_rows`` method
+        (e.g. :class:`~quagga.blocks.LstmBlock`). Requires row slicing of
+        matrices as ``input_projection`` does and can not be used together
+        with ``reverse``, ``checkpoint_every`` and ``truncated_bptt``
+    resets : list
+        Per-timestep columns that are 1 in the rows where a new sequence
+        starts, so that one row of the batch may hold several sequences one
+        after another. The previous state (``prev_names``) of such a row is
+        zeroed and does not receive gradients. ``block_class`` must provide
+        ``use_reset`` method (e.g. :class:`~quagga.blocks.LstmBlock`)
     device_id : int
         Defines the device's id on which the computation will take place
 
@@ -37,15 +85,33 @@ class SequencerBlock(object):
     Returns
     -------
     """
-    def __init__(self, block_class, params, sequences, output_names=None, prev_names=None, paddings=None, reverse=False, device_id=None):
-        context = Context(device_id)
-        device_id = context.device_id
+    def __init__(self, block_class, params, sequences, output_names=None, prev_names=None, paddings=None, reverse=False, input_projection=False, defer_weight_gradients=False, checkpoint_every=None, truncated_bptt=False, packed=False, resets=None, device_id=None):
+        self.context = Context(device_id)
+        device_id = self.context.device_id
         self.reverse = reverse
         self.prev_names = prev_names
         if prev_names and reverse:
             self.temp_prev = []
             self.dL_dtemp_prev = []
             self.k = None
+        if checkpoint_every and (input_projection or not prev_names):
+            raise ValueError('Activation checkpointing requires prev_names '
+                             'and can not be used with input projection!')
+        self.checkpoint_every = checkpoint_every
+        if truncated_bptt:
+            if reverse or not prev_names:
+                raise ValueError('Truncated BPTT requires prev_names '
+                                 'and can not be used in reverse!')
+            self.paddings = paddings
+            # states are not bpropagable, so gradients stop at the window
+            # boundary
+            paddings = [Connector(Matrix.empty_like(padding, device_id)) for padding in paddings]
+            self.states = paddings
+            self.last_k = None
+        self.truncated_bptt = truncated_bptt
+        if packed and (reverse or checkpoint_every or truncated_bptt):
+            raise ValueError('Packed sequences can not be used in reverse, with '
+                             'activation checkpointing or truncated BPTT!')
         self._length = sequences[0]._length
         self.blocks = []
         output_names = output_names if output_names else []
@@ -64,12 +130,31 @@ class SequencerBlock(object):
                 self.blocks.append(block_class(*args, device_id=device_id))
             except TypeError:
                 self.blocks.append(block_class(*args))
+            if packed and prev_names:
+                self.blocks[-1].use_active_rows()
+            if resets and prev_names:
+                self.blocks[-1].use_reset(resets[k])
+            if checkpoint_every and len(self.blocks) > checkpoint_every:
+                # c of the last block of a segment is the checkpoint
+                share_c = 'c' not in output_names and len(self.blocks) % checkpoint_every
+                self.blocks[-1].share_activations(self.blocks[-1 - checkpoint_every], share_c)
             for i, output_name in enumerate(output_names):
                 outputs[i].append(getattr(self.blocks[-1], output_name))
         for output_name, output in izip(output_names, outputs):
             output = output[::-1] if reverse else output
             output = List(output, self._length)
             setattr(self, output_name, output)
+        self.input_projection = input_projection
+        self.defer_weight_gradients = defer_weight_gradients and self.blocks[0].learning
+        if input_projection or self.defer_weight_gradients:
+            self._init_sequence_buffers(input_projection, self.defer_weight_gradients, device_id)
+        # dL/dpre_zifo[t] is consumed by the bprop of its own block, so
+        # without deferred weight gradients the blocks can share one buffer
+        self.share_dL_dpre_zifo = checkpoint_every and self.blocks[0].learning and \
+                                  not self.defer_weight_gradients
+        if self.share_dL_dpre_zifo:
+            for block in self.blocks[1:]:
+                block.share_dL_dpre_zifo(self.blocks[0])
 
         if hasattr(self.blocks[0], 'calculate_loss') and hasattr(self.blocks[0], 'loss'):
             def calculate_loss(context):
@@ -77,7 +162,6 @@ class SequencerBlock(object):
                 for i in xrange(self._length):
                     self.blocks[i].calculate_loss(context)
             self.calculate_loss = calculate_loss
-            self.context = context
             SequencerBlock.loss = property(lambda self: [self.blocks[i].loss for i in xrange(self._length)])
 
     def fprop(self):
@@ -91,9 +175,36 @@ class SequencerBlock(object):
             generator = xrange(start_k, max_input_sequence_len)
         else:
             generator = xrange(self._length)
+            if self.truncated_bptt:
+                self._carry_states()
+        if self.input_projection:
+            self._project_inputs(generator[0], generator[-1] + 1)
         for k in generator:
             self.blocks[k].fprop()
 
+    def reset_states(self):
+        """
+        Makes the next window start from ``paddings``.
+        """
+        self.last_k = None
+
+    def _carry_states(self):
+        if self.last_k is None:
+            sources = self.paddings
+        else:
+            block = self.blocks[self.last_k]
+            sources = [getattr(block, name) for name in self.prev_names]
+        # the states are still used by the first block of the previous window
+        block = self.blocks[0]
+        contexts = [block.f_context]
+        if block.learning:
+            contexts.append(block.b_context)
+        self.context.wait(*contexts)
+        for state, source in izip(self.states, sources):
+            state.assign(self.context, source)
+            state.fprop()
+        self.last_k = self._length.value - 1
+
     def bprop(self):
         if self.reverse:
             max_input_sequence_len = len(self.blocks)
@@ -101,11 +212,122 @@ class SequencerBlock(object):
             generator = xrange(start_k, max_input_sequence_len)
         else:
             generator = xrange(self._length)
-        # If there was no prev_names order is not important.
-        # By not reversing it we can gain speed up.
-        generator = reversed(generator) if self.prev_names else generator
-        for k in generator:
-            self.blocks[k].bprop()
+        if self.checkpoint_every and self.blocks[0].learning:
+            self._bprop_segments(generator[0], generator[-1] + 1)
+        else:
+            # If there was no prev_names order is not important.
+            # By not reversing it we can gain speed up.
+            generator = reversed(generator) if self.prev_names else generator
+            for k in generator:
+                self.blocks[k].bprop()
+        if self.defer_weight_gradients:
+            start_k = len(self.blocks) - self._length.value if self.reverse else 0
+            self._add_weight_gradients(start_k, start_k + self._length.value)
+
+    def _bprop_segments(self, start_k, stop_k):
+        n = self.checkpoint_every
+        next_blocks = []
+        next_block = None
+        for j in reversed(xrange(start_k // n, (stop_k - 1) // n + 1)):
+            blocks = self.blocks[max(j * n, start_k):min((j + 1) * n, stop_k)]
+            if next_blocks:
+                # activations of the last segment are still in the buffers,
+                # others were overwritten by the following segments
+                for block in blocks:
+                    block.f_context.wait(*[b.b_context for b in next_blocks])
+                    block.recompute()
+            for block in reversed(blocks):
+                if self.share_dL_dpre_zifo and next_block:
+                    block.b_context.wait(*next_block.bprop_contexts)
+                block.bprop()
+                next_block = block
+            next_blocks = blocks
+
+    def _init_sequence_buffers(self, input_projection, defer_weight_gradients, device_id):
+        # buffers hold one row block per timestep and the blocks work with
+        # views of their row blocks, so that the products that do not depend
+        # on the recurrence are computed for all timesteps at once
+        block = self.blocks[0]
+        self.batch_size = int(block.zifo.nrows)
+        nrows = len(self.blocks) * self.batch_size
+        ncols = int(block.zifo.ncols)
+        if input_projection or (defer_weight_gradients and hasattr(block, 'dL_dW')):
+            self.x_buffer = Matrix.empty(nrows, int(block.x.ncols), device_id=device_id)
+            self.x_buffer.fill(self.context, 0.0)
+            self.x_views = self._get_row_block_views(self.x_buffer, [b.x for b in self.blocks])
+        if input_projection:
+            self.zifo_buffer = Matrix.empty(nrows, ncols, device_id=device_id)
+            views = self._get_row_block_views(self.zifo_buffer, [b.zifo for b in self.blocks])
+            for block, zifo in izip(self.blocks, views):
+                block.use_input_projection(zifo)
+        if defer_weight_gradients:
+            self.dL_dpre_zifo_buffer = Matrix.empty(nrows, ncols, device_id=device_id)
+            views = self._get_row_block_views(self.dL_dpre_zifo_buffer, [b.zifo for b in self.blocks])
+            for block, dL_dpre_zifo in izip(self.blocks, views):
+                block.defer_weight_gradients(dL_dpre_zifo)
+            if hasattr(block, 'dL_dR'):
+                self.prev_h_buffer = Matrix.empty(nrows, int(block.prev_h.ncols), device_id=device_id)
+                self.prev_h_buffer.fill(self.context, 0.0)
+                self.prev_h_views = self._get_row_block_views(self.prev_h_buffer, [b.prev_h for b in self.blocks])
+            if hasattr(block, 'dL_dx'):
+                self.dL_dx_buffer = Matrix.empty(nrows, int(block.x.ncols), device_id=device_id)
+                self.dL_dx_views = self._get_row_block_views(self.dL_dx_buffer, [b.x for b in self.blocks])
+
+    def _get_row_block_views(self, buffer, matrices):
+        views = []
+        for k, matrix in enumerate(matrices):
+            view = buffer[k * self.batch_size:(k + 1) * self.batch_size]
+            view.nrows = matrix.nrows
+            views.append(view)
+        return views
+
+    def _stack_inputs(self, start_k, stop_k):
+        for k in xrange(start_k, stop_k):
+            self.x_views[k].assign(self.context, self.blocks[k].x)
+
+    def _project_inputs(self, start_k, stop_k):
+        self._stack_inputs(start_k, stop_k)
+        rows = slice(start_k * self.batch_size, stop_k * self.batch_size)
+        # zifo[k] = x[k] * W for all active timesteps
+        self.zifo_buffer[rows].assign_dot(self.context, self.x_buffer[rows], self.blocks[0].W)
+        for k in xrange(start_k, stop_k):
+            self.blocks[k].zifo.last_modif_context = self.context
+
+    def _add_weight_gradients(self, start_k, stop_k):
+        blocks = self.blocks[start_k:stop_k]
+        self.context.wait(*[block.b_context for block in blocks])
+        for k in xrange(start_k, stop_k):
+            batch_size = int(self.blocks[k].zifo.nrows)
+            if batch_size < self.batch_size:
+                # row blocks are not filled completely by smaller batches,
+                # and their memory can be shared with other buffers
+                rows = slice(k * self.batch_size + batch_size, (k + 1) * self.batch_size)
+                self.dL_dpre_zifo_buffer[rows].fill(self.context, 0.0)
+                if hasattr(self, 'x_buffer'):
+                    self.x_buffer[rows].fill(self.context, 0.0)
+                if hasattr(self, 'prev_h_buffer'):
+                    self.prev_h_buffer[rows].fill(self.context, 0.0)
+        rows = slice(start_k * self.batch_size, stop_k * self.batch_size)
+        dL_dpre_zifo = self.dL_dpre_zifo_buffer[rows]
+        block = self.blocks[0]
+        if hasattr(block, 'dL_dW'):
+            if not self.input_projection:
+                self._stack_inputs(start_k, stop_k)
+            # dL_dW += x.T * dL/dpre_zifo for all active timesteps
+            block.dL_dW.add_dot(self.context, self.x_buffer[rows], dL_dpre_zifo, 'T')
+        if hasattr(block, 'dL_dR'):
+            for k in xrange(start_k, stop_k):
+                self.prev_h_views[k].assign(self.context, self.blocks[k].prev_h)
+            # dL_dR += h_prev.T * dL/dpre_zifo for all active timesteps
+            block.dL_dR.add_dot(self.context, self.prev_h_buffer[rows], dL_dpre_zifo, 'T')
+        if hasattr(block, 'dL_db'):
+            # dL_db += sum(dL/dpre_zifo, axis=0)
+            block.dL_db.add_sum_along_axis(self.context, dL_dpre_zifo, axis=0)
+        if hasattr(block, 'dL_dx'):
+            # dL/dx = dL/dpre_zifo * W.T for all active timesteps
+            self.dL_dx_buffer[rows].assign_dot(self.context, dL_dpre_zifo, block.W, 'N', 'T')
+            for k in xrange(start_k, stop_k):
+                self.blocks[k].dL_dx.add(self.context, self.dL_dx_views[k])
 
     def connect_block_with_padding(self, k):
         for name in self.prev_names:
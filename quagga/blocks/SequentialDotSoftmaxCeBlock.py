@@ -0,0 +1,202 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import numpy as np
+from itertools import izip
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.connector import Connector
+
+
+class SequentialDotSoftmaxCeBlock(object):
+    """
+    Output layer of sequence models: ``softmax(x[t] * W + b)`` with mean cross
+    entropy loss for all timesteps at once. Rows of the active timesteps are
+    stacked into one matrix, so the projection, the softmax and the
+    derivatives are computed with one call each instead of one per timestep
+    as :class:`~quagga.blocks.DotBlock` and
+    :class:`~quagga.blocks.SoftmaxCeBlock` wrapped in
+    :class:`~quagga.blocks.SequencerBlock` do. Derivatives of ``x[t]`` are
+    scaled as theirs, i.e. by the inverse of the (mean) batch size.
+
+    Parameters
+    ----------
+    W : Matrix (GpuMatrix or CpuMatrix)
+        Weight matrix
+    b : Matrix (GpuMatrix or CpuMatrix)
+        Bias row, can be None
+    x_sequence : List
+        Block's inputs
+    true_labels : List
+        Column of class indices (int) for every timestep
+    mask : List
+        Column for every timestep that is 0 for padded rows, can be None
+    compact : bool
+        If True, only rows whose mask is not 0 are gathered into the
+        compact matrix on which the projection, the softmax and the loss are
+        computed, and derivatives are scattered back to their rows, so that
+        padded rows do not cost anything. Row indices are computed on the
+        host, so ``fprop`` waits for the mask. ``probs`` then holds only the
+        gathered rows. Requires mask of zeros and ones
+    output_probs : bool
+        If False, ``probs`` are not stored: ``fprop`` computes the loss of
+        every row and overwrites the logits with their derivative in one
+        fused pass, and ``calculate_loss`` copies only the losses to host
+    device_id : int
+        Defines the device's id on which the computation will take place
+    """
+    def __init__(self, W, b, x_sequence, true_labels, mask=None, compact=False, output_probs=True, device_id=None):
+        self.context = Context(device_id)
+        device_id = self.context.device_id
+        if W.bpropagable:
+            self.W, self.dL_dW = W.register_usage(device_id, device_id)
+        else:
+            self.W = W.register_usage(device_id)
+        if b:
+            if b.bpropagable:
+                self.b, self.dL_db = b.register_usage(device_id, device_id)
+            else:
+                self.b = b.register_usage(device_id)
+        self.length = x_sequence.length
+        if x_sequence[0].bpropagable:
+            self.x_sequence, self.dL_dx_sequence = izip(*x_sequence.register_usage(device_id, device_id))
+            self.dL_dx_parts = [Matrix.empty_like(x, device_id) for x in self.x_sequence]
+        else:
+            self.x_sequence = x_sequence.register_usage(device_id)
+        self.true_labels = true_labels.register_usage(device_id)
+        if mask:
+            self.mask = mask.register_usage(device_id)
+        self.learning = hasattr(self, 'dL_dW') or hasattr(self, 'dL_db') or \
+                        hasattr(self, 'dL_dx_sequence')
+        if self.learning:
+            self.b_context = Context(device_id)
+
+        nrows = sum(int(x.nrows) for x in self.x_sequence)
+        # x_stack holds stacked dL/dx during bprop, logits holds dL/dlogits
+        self.x_stack = Matrix.empty(nrows, self.x_sequence[0].ncols, device_id=device_id)
+        self.logits = Matrix.empty(nrows, self.W.ncols, device_id=device_id)
+        if output_probs:
+            self.probs = Connector(Matrix.empty_like(self.logits, device_id))
+        else:
+            self.losses = Matrix.empty(nrows, 1, device_id=device_id)
+        self.true_labels_stack = Matrix.empty(nrows, 1, 'int', device_id)
+        if mask:
+            self.mask_stack = Matrix.empty(nrows, 1, device_id=device_id)
+        self.compact = compact and bool(mask)
+        if self.compact:
+            # x_compact holds compact dL/dx during bprop
+            self.row_indices = Matrix.empty(nrows, 1, 'int', device_id)
+            self.x_compact = Matrix.empty(nrows, self.x_stack.ncols, device_id=device_id)
+            self.true_labels_compact = Matrix.empty(nrows, 1, 'int', device_id)
+        self.loss = None
+
+    def _stack(self, matrix, matrices):
+        matrix.nrows = sum(int(m.nrows) for m in matrices)
+        matrix.assign_vstack(self.context, matrices)
+
+    def fprop(self):
+        length = int(self.length)
+        self._stack(self.x_stack, self.x_sequence[:length])
+        self._stack(self.true_labels_stack, self.true_labels[:length])
+        if hasattr(self, 'mask'):
+            self._stack(self.mask_stack, self.mask[:length])
+        x, self.true_labels_used = self.x_stack, self.true_labels_stack
+        if self.compact:
+            # x = x[mask != 0]
+            mask = self.mask_stack.to_host()
+            self.row_indices.assign_npa(self.context, np.flatnonzero(mask).astype(np.int32)[:, np.newaxis])
+            for matrix in [self.x_compact, self.true_labels_compact]:
+                matrix.nrows = self.row_indices.nrows
+            self.x_stack.slice_rows(self.context, self.row_indices, self.x_compact)
+            self.true_labels_stack.slice_rows(self.context, self.row_indices, self.true_labels_compact)
+            x, self.true_labels_used = self.x_compact, self.true_labels_compact
+        self.logits.nrows = x.nrows
+        # probs = softmax(x * W + b) for all active timesteps
+        self.logits.assign_dot(self.context, x, self.W)
+        if hasattr(self, 'b'):
+            self.logits.add(self.context, self.b)
+        if hasattr(self, 'probs'):
+            self.probs.nrows = x.nrows
+            self.logits.softmax(self.context, self.probs)
+            self.probs.fprop()
+        else:
+            # dL/dlogits replaces logits right away
+            self.losses.nrows = x.nrows
+            dL_dlogits = self.logits if self.learning else None
+            self.logits.softmax_ce(self.context, self.true_labels_used, self.losses, dL_dlogits)
+
+    def bprop(self):
+        if not self.learning:
+            return
+        length = int(self.length)
+        self.b_context.wait(self.context)
+        # dL/dlogits = (probs - true_labels) * length / nrows
+        dL_dlogits = self.logits
+        if hasattr(self, 'probs'):
+            dL_dlogits.assign_softmax_ce_derivative(self.b_context, self.probs, self.true_labels_used)
+        x = self.x_compact if self.compact else self.x_stack
+        scale = float(length) * int(x.nrows) / int(self.x_stack.nrows)
+        dL_dlogits.scale(self.b_context, scale, dL_dlogits)
+        if hasattr(self, 'mask') and not self.compact:
+            dL_dlogits.hprod(self.b_context, self.mask_stack)
+        if hasattr(self, 'dL_dW'):
+            # dL/dW += x.T * dL/dlogits
+            self.dL_dW.add_dot(self.b_context, x, dL_dlogits, 'T')
+        if hasattr(self, 'dL_db'):
+            # dL/db += sum(dL/dlogits, axis=0)
+            self.dL_db.add_sum_along_axis(self.b_context, dL_dlogits, axis=0)
+        if hasattr(self, 'dL_dx_sequence'):
+            # dL/dx = dL/dlogits * W.T, split back into timesteps
+            dL_dx_stack = self.x_stack
+            if self.compact:
+                dL_dx_compact = self.x_compact
+                dL_dx_compact.assign_dot(self.b_context, dL_dlogits, self.W, 'N', 'T')
+                dL_dx_stack.fill(self.b_context, 0.0)
+                dL_dx_stack.add_rows_slice(self.b_context, self.row_indices, dL_dx_compact)
+            else:
+                dL_dx_stack.assign_dot(self.b_context, dL_dlogits, self.W, 'N', 'T')
+            dL_dx_stack.vsplit(self.b_context, self.dL_dx_parts[:length])
+            for dL_dx, dL_dx_part in izip(self.dL_dx_sequence, self.dL_dx_parts[:length]):
+                dL_dx.add(self.b_context, dL_dx_part)
+
+    def calculate_loss(self, context):
+        mask = hasattr(self, 'mask') and not self.compact
+        if not hasattr(self, 'probs'):
+            losses_np = self.losses.to_host(context)
+            mask = self.mask_stack.to_host(context) if mask else None
+            context.add_callback(self._calculate_mean_loss, losses_np, mask)
+            return
+        true_labels_np = self.true_labels_used.to_host(context)
+        probs_np = self.probs.to_host(context)
+        if mask:
+            mask = self.mask_stack.to_host(context)
+            context.add_callback(self._calculate_ce_loss, true_labels_np, probs_np, mask)
+        else:
+            context.add_callback(self._calculate_ce_loss, true_labels_np, probs_np)
+
+    def _calculate_ce_loss(self, true_labels_np, probs_np, mask=None):
+        idxs = range(probs_np.shape[0]), true_labels_np.flatten()
+        logs = np.log(probs_np[idxs] + 1e-20)
+        if mask is not None:
+            logs *= mask[:, 0]
+            self.loss = - np.sum(logs) / np.sum(mask)
+        else:
+            self.loss = - np.mean(logs)
+
+    def _calculate_mean_loss(self, losses_np, mask=None):
+        if mask is not None:
+            self.loss = np.sum(losses_np * mask) / np.sum(mask)
+        else:
+            self.loss = np.mean(losses_np)
\ No newline at end of file
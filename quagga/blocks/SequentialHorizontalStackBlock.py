@@ -19,7 +19,7 @@ from itertools import chain
 from quagga.utils import List
 from quagga.matrix import Matrix
 from quagga.context import Context
-from quagga.connector import Connector
+from quagga.utils.SequenceTensor import SequenceTensor
 
 
 class SequentialHorizontalStackBlock(object):
@@ -58,11 +58,8 @@ class SequentialHorizontalStackBlock(object):
             self.y_sequence = y_sequence.register_usage(device_id)
         self.x_sequence = List(self.x_sequence, x_sequence.length)
         self.y_sequence = List(self.y_sequence, y_sequence.length)
-        output = []
-        for _ in xrange(x_sequence.length):
-            matrix = Matrix.empty(x_sequence[0].nrows, x_ncols + y_ncols, dtype, device_id)
-            output.append(Connector(matrix, device_id))
-        self.output = List(output, x_sequence.length)
+        self.output = SequenceTensor(len(x_sequence), x_sequence[0].nrows, x_ncols + y_ncols,
+                                     dtype, device_id, device_id, x_sequence.length)
         if learning:
             self.dL_dx_sequences = List(self.dL_dx_sequences, x_sequence.length)
             self.dL_dy_sequences = List(self.dL_dy_sequences, x_sequence.length)
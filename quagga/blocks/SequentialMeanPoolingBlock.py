@@ -21,7 +21,6 @@ from quagga.connector import Connector
 
 
 class SequentialMeanPoolingBlock(object):
-    # TODO(sergii): change sequentially_tile to add_sequentially_tile, because can erase gradients
     def __init__(self, matrices, device_id=None):
         self.context = Context(device_id)
         device_id = self.context.device_id
@@ -40,5 +39,5 @@ class SequentialMeanPoolingBlock(object):
 
     def bprop(self):
         dL_doutput = self.output.backward_matrix
-        dL_doutput.scale(self.context, ct.c_float(1.0 / self.length))
-        Matrix.sequentially_tile(self.context, dL_doutput, self.dL_dmatrices[:self.length])
\ No newline at end of file
+        alpha = ct.c_float(1.0 / self.length)
+        Matrix.add_scaled_sequentially_tile(self.context, alpha, dL_doutput, self.dL_dmatrices[:self.length])
\ No newline at end of file
@@ -20,7 +20,6 @@ from quagga.connector import Connector
 
 
 class SequentialSumPoolingBlock(object):
-    # TODO(sergii): change sequentially_tile to add_sequentially_tile, because can erase gradients
     def __init__(self, matrices, device_id=None):
         self.context = Context(device_id)
         device_id = self.context.device_id
@@ -39,4 +38,4 @@ class SequentialSumPoolingBlock(object):
 
     def bprop(self):
         dL_doutput = self.output.backward_matrix
-        Matrix.sequentially_tile(self.context, dL_doutput, self.dL_dmatrices[:self.length])
\ No newline at end of file
+        Matrix.add_sequentially_tile(self.context, dL_doutput, self.dL_dmatrices[:self.length])
\ No newline at end of file
@@ -22,9 +22,14 @@ from quagga.connector import Connector
 class SoftmaxCeBlock(object):
     """
     Softmax nonlinearity with mean cross entropy loss
+
+    If ``output_probs`` is False, probabilities are not stored: ``fprop``
+    computes only the loss of every row and ``bprop`` computes the
+    derivative straight from ``x``, each in one fused pass. This mode
+    requires integer ``true_labels``.
     """
 
-    def __init__(self, x, true_labels, mask=None, device_id=None):
+    def __init__(self, x, true_labels, mask=None, output_probs=True, device_id=None):
         self.context = Context(device_id)
         device_id = self.context.device_id
         if x.bpropagable:
@@ -34,18 +39,28 @@ class SoftmaxCeBlock(object):
         self.true_labels = true_labels.register_usage(device_id)
         if mask:
             self.mask = mask.register_usage(device_id)
-        self.probs = Connector(Matrix.empty_like(self.x))
+        if output_probs:
+            self.probs = Connector(Matrix.empty_like(self.x))
+        else:
+            if self.true_labels.dtype != 'int':
+                raise ValueError('SoftmaxCeBlock without probs requires integer true_labels!')
+            self.losses = Matrix.empty(self.x.nrows, 1, device_id=device_id)
         self.loss = None
 
     def fprop(self):
-        self.x.softmax(self.context, self.probs)
-        self.probs.fprop()
+        if hasattr(self, 'probs'):
+            self.x.softmax(self.context, self.probs)
+            self.probs.fprop()
+        else:
+            self.x.softmax_ce(self.context, self.true_labels, self.losses)
 
     def bprop(self):
         if not hasattr(self, 'dL_dx'):
             return
         # error = (probs - true_labels) / M
-        if self.true_labels.dtype == 'int':
+        if not hasattr(self, 'probs'):
+            self.x.softmax_ce(self.context, self.true_labels, derivative=self.dL_dx, beta=1.0)
+        elif self.true_labels.dtype == 'int':
             self.dL_dx.add_softmax_ce_derivative(self.context, self.probs, self.true_labels)
         else:
             self.dL_dx.add_scaled_subtraction(self.context, 1. / self.probs.nrows, self.probs, self.true_labels)
@@ -53,6 +68,11 @@ class SoftmaxCeBlock(object):
             self.dL_dx.hprod(self.context, self.mask)
 
     def calculate_loss(self, context):
+        if not hasattr(self, 'probs'):
+            losses_np = self.losses.to_host(context)
+            mask = self.mask.to_host(context) if hasattr(self, 'mask') else None
+            context.add_callback(self._calculate_mean_loss, losses_np, mask)
+            return
         true_labels_np = self.true_labels.to_host(context)
         probs_np = self.probs.to_host(context)
         if hasattr(self, 'mask'):
@@ -71,4 +91,10 @@ class SoftmaxCeBlock(object):
             logs *= mask[:, 0]
             self.loss = - np.sum(logs) / np.sum(mask)
         else:
-            self.loss = - np.mean(logs)
\ No newline at end of file
+            self.loss = - np.mean(logs)
+
+    def _calculate_mean_loss(self, losses_np, mask=None):
+        if mask is not None:
+            self.loss = np.sum(losses_np * mask) / np.sum(mask)
+        else:
+            self.loss = np.mean(losses_np)
\ No newline at end of file
@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ----------------------------------------------------------------------------
+from quagga.blocks.AdaptiveSoftmaxCeBlock import AdaptiveSoftmaxCeBlock
 from quagga.blocks.ArgmaxBlock import ArgmaxBlock
 from quagga.blocks.ColSlicingBlock import ColSlicingBlock
 from quagga.blocks.DotBlock import DotBlock
@@ -29,8 +30,10 @@ from quagga.blocks.NonlinearityBlock import NonlinearityBlock
 from quagga.blocks.ParameterContainer import ParameterContainer
 from quagga.blocks.RepeatBlock import RepeatBlock
 from quagga.blocks.RowSlicingBlock import RowSlicingBlock
+from quagga.blocks.SampledSoftmaxCeBlock import SampledSoftmaxCeBlock
 from quagga.blocks.ScheduledSamplingBlock import ScheduledSamplingBlock
 from quagga.blocks.SequencerBlock import SequencerBlock
+from quagga.blocks.SequentialDotSoftmaxCeBlock import SequentialDotSoftmaxCeBlock
 from quagga.blocks.SequentialHorizontalStackBlock import SequentialHorizontalStackBlock
 from quagga.blocks.SequentialMeanPoolingBlock import SequentialMeanPoolingBlock
 from quagga.blocks.SequentialSumPoolingBlock import SequentialSumPoolingBlock
@@ -13,8 +13,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ----------------------------------------------------------------------------
+import threading
+from contextlib import contextmanager
 from quagga.matrix import Matrix
 from quagga.context import Context
+from quagga.matrix import MemoryArena
 from quagga.matrix import SparseMatrix
 
 
@@ -50,16 +53,21 @@ class Connector(object):
                                 | +------------------+ |<---+
                                 +----------------------+    +-----------------+
     """
+    _build_state = threading.local()
 
-    def __init__(self, f_matrix, bu_device_id=None):
+    def __init__(self, f_matrix, bu_device_id=None, b_matrix=None):
         self._fo_device_id = f_matrix.device_id
         self._f_matrices = {self._fo_device_id: f_matrix}
         self.context = {self._fo_device_id: Context(self._fo_device_id)}
-        if bu_device_id is not None:
+        if bu_device_id is not None and not getattr(Connector._build_state, 'forward_only', False):
             self._bu_device_id = bu_device_id
             self._b_matrices = dict()
             self._b_matrices_pool = dict()
             self._b_sparse_matrix = None
+            if b_matrix is not None:
+                # preallocated backward matrix (e.g. a view of a buffer
+                # that holds backward matrices of a whole sequence)
+                self._b_matrices[bu_device_id] = b_matrix
         # We need do this trick because instead we will add attribute
         # to the Connector instance by setting it
         # instead of setting attribute in f_matrix
@@ -67,19 +75,40 @@ class Connector(object):
         for attr_name in self.__f_matrix_setable_attributes:
             getattr(self, attr_name)
 
+    @staticmethod
+    @contextmanager
+    def forward_only():
+        """
+        Connectors that are created in the calling thread inside
+        ``with Connector.forward_only():`` statement are not bpropagable,
+        so blocks that are built there allocate no backward state.
+        """
+        forward_only = getattr(Connector._build_state, 'forward_only', False)
+        Connector._build_state.forward_only = True
+        try:
+            yield
+        finally:
+            Connector._build_state.forward_only = forward_only
+
     @property
     def bpropagable(self):
         return hasattr(self, '_bu_device_id')
 
-    def register_usage_with_sparse_backward_matrix(self):
+    def register_usage_with_sparse_backward_matrix(self, compact=False):
         if self._bu_device_id != self._fo_device_id:
             raise ValueError("Registering usage with sparse backward matrix "
                              "requires equal forward obtaining device and "
                              "backward usage device.")
+        arena = MemoryArena.current()
+        if arena:
+            arena.register_usage(self)
         fwd_matrix = self._f_matrices[self._fo_device_id]
         if self._b_sparse_matrix:
+            if self._b_sparse_matrix.compact != compact:
+                raise ValueError('All usages must agree on the compact mode '
+                                 'of the sparse backward matrix!')
             return fwd_matrix, self._b_sparse_matrix
-        self._b_sparse_matrix = SparseMatrix(self._bu_device_id)
+        self._b_sparse_matrix = SparseMatrix(self._bu_device_id, compact)
         return fwd_matrix, self._b_sparse_matrix
 
     def register_usage(self, fu_device_id, bo_device_id=None):
@@ -94,6 +123,9 @@ class Connector(object):
         if not self.bpropagable and bo_device_id:
             raise ValueError("Nobody is going to use computation from backward step. "
                              "You mustn't register for backward propagate!")
+        arena = MemoryArena.current()
+        if arena:
+            arena.register_usage(self)
         if fu_device_id != self._fo_device_id and fu_device_id not in self._f_matrices:
             self._f_matrices[fu_device_id] = Matrix.empty_like(self, fu_device_id)
             self.context[fu_device_id] = Context(fu_device_id)
@@ -13,26 +13,235 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ----------------------------------------------------------------------------
+import Queue
+import threading
+from collections import deque
+
+
 class CpuContext(object):
     """
-    Mock class created for compatibility purposes in order to enable
-    quick switching between GPU and CPU implementations.
+    Computational context for CPU matrices.
+
+    By default the class is a mock created for compatibility purposes in order
+    to enable quick switching between GPU and CPU implementations: all work is
+    executed immediately and synchronisation methods do nothing.
+
+    After :meth:`start_workers` has been called, newly created contexts become
+    asynchronous. Each of them is an ordered work queue (the counterpart of a
+    CUDA stream) executed by a shared pool of worker threads, and
+    :meth:`wait`/:meth:`block` set up real event dependencies between queues.
+    NumPy releases the GIL inside BLAS calls and large ufunc loops, so work
+    from independent contexts runs on separate cores.
+
+    Parameters
+    ----------
+    device_id : int
+        Defines with which device the computational context will be associated
     """
+    _pool = None
+
     def __init__(self, device_id=None):
         self.device_id = device_id if device_id else 0
+        if CpuContext._pool:
+            self._queue = deque()
+            self._lock = threading.Lock()
+            self._is_scheduled = False
+            self._exception = None
+
+    @classmethod
+    def start_workers(cls, num_workers):
+        """
+        Starts ``num_workers`` worker threads. Contexts created afterwards
+        execute their work asynchronously.
+        """
+        if cls._pool:
+            raise ValueError('Workers have been already started!')
+        cls._pool = _WorkerPool(num_workers)
+
+    @classmethod
+    def stop_workers(cls):
+        """
+        Stops worker threads. Contexts created afterwards are synchronous.
+        Asynchronous contexts must not be used after that.
+        """
+        if cls._pool:
+            cls._pool.stop()
+            cls._pool = None
+
+    @property
+    def deferring(self):
+        """
+        Whether work submitted to the context is executed later by a worker
+        thread. Work submitted from a worker thread is executed in place,
+        that is how composite operations are run inside one queued task.
+        """
+        return hasattr(self, '_queue') and not getattr(_worker_state, 'active', False)
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Enqueues ``function`` call into the context. It will be executed after
+        all preceding work of the context has completed.
+        """
+        if not self.deferring:
+            function(*args, **kwargs)
+            return
+        with self._lock:
+            self._queue.append((function, args, kwargs))
+            if self._is_scheduled:
+                return
+            self._is_scheduled = True
+        CpuContext._pool.put(self._run)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._is_scheduled = False
+                    return
+                task = self._queue.popleft()
+                function, args, kwargs = task
+                if isinstance(function, _Event) and not function.is_set():
+                    # the rest of the queue has to wait for the event, so we
+                    # release the worker instead of blocking it
+                    self._queue.appendleft(task)
+                    event = function
+                    break
+            if isinstance(function, _Event):
+                continue
+            try:
+                function(*args, **kwargs)
+            except Exception as e:
+                if self._exception is None:
+                    self._exception = e
+        event.add_callback(CpuContext._pool.put, self._run)
+
+    def _record_event(self):
+        event = _Event()
+        self.submit(event.set)
+        return event
 
     def synchronize(self):
-        pass
+        """
+        Blocks the host until all preceding commands in the given context
+        have completed. Re-raises the first exception that was raised by
+        the context's work.
+        """
+        if not self.deferring:
+            return
+        self._record_event().wait()
+        if self._exception is not None:
+            exception, self._exception = self._exception, None
+            raise exception
 
     def wait(self, *args):
-        pass
+        """
+        Makes all future work submitted to the context wait until all
+        computations in ``args`` contexts have finished.
+
+        Parameters
+        ----------
+        args : list of :class:`~quagga.context.CpuContext`
+        """
+        if not self.deferring:
+            return
+        for context in args:
+            if context is not self and context.deferring:
+                event = context._record_event()
+                self.submit(event)
 
     def block(self, *args):
-        pass
+        """
+        Makes all future work submitted to the ``args`` contexts wait until all
+        computations in the context have finished.
+
+        Parameters
+        ----------
+        args : list of :class:`~quagga.context.CpuContext`
+        """
+        if not self.deferring:
+            return
+        event = self._record_event()
+        for context in args:
+            if context is not self and context.deferring:
+                context.submit(event)
 
     def add_callback(self, callback, *args, **kwargs):
-        callback(*args, **kwargs)
+        """
+        Adds ``callback`` function to the current context, which will be called
+        after all preceding computations have completed.
+
+        Parameters
+        ----------
+        callback : python function
+        args
+            Arguments of the ``callback`` function.
+        kwargs
+            Named arguments of the ``callback`` function.
+        """
+        self.submit(callback, *args, **kwargs)
 
     @staticmethod
     def callback(function):
-        return function
\ No newline at end of file
+        return function
+
+
+class _Event(object):
+    """
+    One-shot event. Queued into a context it stops the context's work until
+    the event is set.
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def set(self):
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback, args in callbacks:
+            callback(*args)
+
+    def wait(self):
+        self._event.wait()
+
+    def add_callback(self, callback, *args):
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append((callback, args))
+                return
+        callback(*args)
+
+
+class _WorkerPool(object):
+    def __init__(self, num_workers):
+        self._tasks = Queue.Queue()
+        self._threads = []
+        for _ in xrange(num_workers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def put(self, task):
+        self._tasks.put(task)
+
+    def stop(self):
+        for _ in self._threads:
+            self._tasks.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self):
+        _worker_state.active = True
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            task()
+
+
+_worker_state = threading.local()
\ No newline at end of file
@@ -170,6 +170,62 @@ __global__ void columnArgmax(int nrows,
 }
 
 
+__global__ void rowTopK(int nrows,
+                        int ncols,
+                        const float* __restrict__ a,
+                        int k,
+                        float* __restrict__ values,
+                        int* __restrict__ indxs) {
+    const int nthreads = blockDim.x * gridDim.x;
+    const int start_i = blockIdx.x * blockDim.x + threadIdx.x;
+
+    float val;
+    int j;
+    for (int i = start_i; i < nrows; i += nthreads) {
+        for (j = 0; j < k; j++) {
+            values[i + j * nrows] = -FLT_MAX;
+            indxs[i + j * nrows] = 0;
+        }
+        // insertion into the sorted k largest elements seen so far
+        for (int col = 0; col < ncols; col++) {
+            val = a[i + col * nrows];
+            if (val <= values[i + (k - 1) * nrows]) {
+                continue;
+            }
+            for (j = k - 1; j > 0 && values[i + (j - 1) * nrows] < val; j--) {
+                values[i + j * nrows] = values[i + (j - 1) * nrows];
+                indxs[i + j * nrows] = indxs[i + (j - 1) * nrows];
+            }
+            values[i + j * nrows] = val;
+            indxs[i + j * nrows] = col;
+        }
+    }
+}
+
+
+__global__ void sampleRows(int nrows,
+                           int ncols,
+                           const float* __restrict__ probs,
+                           const float* __restrict__ uniforms,
+                           int* __restrict__ indxs) {
+    const int nthreads = blockDim.x * gridDim.x;
+    const int start_i = blockIdx.x * blockDim.x + threadIdx.x;
+
+    float s;
+    int col;
+    for (int i = start_i; i < nrows; i += nthreads) {
+        s = 0.0f;
+        for (col = 0; col < ncols - 1; col++) {
+            s += probs[i + col * nrows];
+            if (uniforms[i] < s) {
+                break;
+            }
+        }
+        indxs[i] = col;
+    }
+}
+
+
 __global__ void hprodSum(int nelems,
                          int nrows,
                          const float* __restrict__ A,
@@ -331,6 +387,28 @@ __global__  void addScaledColumnsSlice(int nrows,
 }
 
 
+__global__  void assignRowsSlice(int nrows,
+                                 int ncols,
+                                 const float* __restrict__ dense_matrix,
+                                 const int* __restrict__ embedding_row_indxs,
+                                 int embd_nrows,
+                                 float* __restrict__ embedding_matrix) {
+    const int nthreads = blockDim.x * gridDim.x;
+    const int start_i = blockIdx.x * blockDim.x + threadIdx.x;
+    const int nelems = nrows * ncols;
+
+    int embd_col_idx;
+    int embd_row_idx;
+    int embd_offset;
+    for (int i = start_i; i < nelems; i += nthreads) {
+        embd_row_idx = embedding_row_indxs[i % nrows];
+        embd_col_idx = i / nrows;
+        embd_offset = embd_col_idx * embd_nrows + embd_row_idx;
+        embedding_matrix[embd_offset] = dense_matrix[i];
+    }
+}
+
+
 __global__  void addScaledRowsSlice(int nrows,
                                     int ncols,
                                     float alpha,
@@ -499,6 +577,43 @@ __global__ void addSoftmaxCeDerivative(int batchSize,
 
 
 
+__global__ void softmaxCe(int batchSize,
+                          int numClasses,
+                          const float* __restrict__ logits,
+                          const int* __restrict__ targetClasses,
+                          float beta,
+                          float* __restrict__ losses,
+                          float* derivatives) {
+    const int nthreads = blockDim.x * gridDim.x;
+    const int start_i = blockIdx.x * blockDim.x + threadIdx.x;
+
+    // a thread per row, neighbouring threads read neighbouring elements
+    // of the column-major logits
+    for (int i = start_i; i < batchSize; i += nthreads) {
+        float max_logit = -FLT_MAX;
+        for (int j = 0; j < numClasses; j++) {
+            max_logit = fmaxf(max_logit, logits[j * batchSize + i]);
+        }
+        float sum_exp = 0.0f;
+        for (int j = 0; j < numClasses; j++) {
+            sum_exp += expf(logits[j * batchSize + i] - max_logit);
+        }
+        const int target_class = targetClasses[i];
+        if (losses) {
+            losses[i] = logf(sum_exp) + max_logit - logits[target_class * batchSize + i];
+        }
+        if (derivatives) {
+            const float normalizer = sum_exp * batchSize;
+            for (int j = 0; j < numClasses; j++) {
+                const int k = j * batchSize + i;
+                const float derivative = (expf(logits[k] - max_logit) / normalizer) - (j == target_class) / (float)batchSize;
+                derivatives[k] = beta == 0.0f ? derivative : beta * derivatives[k] + derivative;
+            }
+        }
+    }
+}
+
+
 __global__ void assignSequentialMeanPooling(int nrows,
                                             int ncols,
                                             const float* matrices[],
@@ -871,6 +986,55 @@ __global__ void transpose(int nrows,
 }
 
 
+__global__ void sumAlongAxis(int nrows,
+                             int ncols,
+                             int axis,
+                             float alpha,
+                             const float* __restrict__ a,
+                             float beta,
+                             float* __restrict__ out) {
+    const int nthreads = blockDim.x * gridDim.x;
+    const int start_i = blockIdx.x * blockDim.x + threadIdx.x;
+    const int nelems = axis == 0 ? ncols : nrows;
+    const int n = axis == 0 ? nrows : ncols;
+    const int stride = axis == 0 ? 1 : nrows;
+    const int offset_stride = axis == 0 ? nrows : 1;
+
+    float s;
+    for (int i = start_i; i < nelems; i += nthreads) {
+        s = 0.0f;
+        for (int k = 0; k < n; k++) {
+            s += a[i * offset_stride + k * stride];
+        }
+        out[i] = (beta == 0.0f ? 0.0f : beta * out[i]) + alpha * s;
+    }
+}
+
+
+__global__ void maxAlongAxis(int nrows,
+                             int ncols,
+                             int axis,
+                             const float* __restrict__ a,
+                             float beta,
+                             float* __restrict__ out) {
+    const int nthreads = blockDim.x * gridDim.x;
+    const int start_i = blockIdx.x * blockDim.x + threadIdx.x;
+    const int nelems = axis == 0 ? ncols : nrows;
+    const int n = axis == 0 ? nrows : ncols;
+    const int stride = axis == 0 ? 1 : nrows;
+    const int offset_stride = axis == 0 ? nrows : 1;
+
+    float m;
+    for (int i = start_i; i < nelems; i += nthreads) {
+        m = -FLT_MAX;
+        for (int k = 0; k < n; k++) {
+            m = fmaxf(m, a[i * offset_stride + k * stride]);
+        }
+        out[i] = (beta == 0.0f ? 0.0f : beta * out[i]) + m;
+    }
+}
+
+
 extern "C" {
     cudaError_t _transposeFloat(cudaStream_t stream,
                                 int nrows,
@@ -1293,6 +1457,31 @@ extern "C" {
     }
 
 
+    cudaError_t _rowTopK(cudaStream_t stream,
+                         int nrows,
+                         int ncols,
+                         const float* __restrict__ a,
+                         int k,
+                         float* __restrict__ values,
+                         int* __restrict__ indxs) {
+        int num_blocks = std::min(MAX_NUM_BLOCKS_PER_KERNEL, (nrows - 1) / MAX_NUM_THREADS_PER_BLOCK + 1);
+        rowTopK<<<num_blocks, MAX_NUM_THREADS_PER_BLOCK, 0, stream>>>(nrows, ncols, a, k, values, indxs);
+        return cudaGetLastError();
+    }
+
+
+    cudaError_t _sampleRows(cudaStream_t stream,
+                            int nrows,
+                            int ncols,
+                            const float* __restrict__ probs,
+                            const float* __restrict__ uniforms,
+                            int* __restrict__ indxs) {
+        int num_blocks = std::min(MAX_NUM_BLOCKS_PER_KERNEL, (nrows - 1) / MAX_NUM_THREADS_PER_BLOCK + 1);
+        sampleRows<<<num_blocks, MAX_NUM_THREADS_PER_BLOCK, 0, stream>>>(nrows, ncols, probs, uniforms, indxs);
+        return cudaGetLastError();
+    }
+
+
     cudaError_t _hprodSum(cudaStream_t stream,
                           int nrows,
                           int ncols,
@@ -1429,6 +1618,19 @@ extern "C" {
     }
 
 
+    cudaError_t _assignRowsSlice(cudaStream_t stream,
+                                 int nrows,
+                                 int ncols,
+                                 const float* __restrict__ dense_matrix,
+                                 const int* __restrict__ embedding_row_indxs,
+                                 int embd_nrows,
+                                 float* __restrict__ embedding_matrix) {
+        int num_blocks = std::min(MAX_NUM_BLOCKS_PER_KERNEL, (nrows * ncols - 1) / MAX_NUM_THREADS_PER_BLOCK + 1);
+        assignRowsSlice<<<num_blocks, MAX_NUM_THREADS_PER_BLOCK, 0, stream>>>(nrows, ncols, dense_matrix, embedding_row_indxs, embd_nrows, embedding_matrix);
+        return cudaGetLastError();
+    }
+
+
     cudaError_t _addScaledRowsSlice(cudaStream_t stream,
                                     int nrows,
                                     int ncols,
@@ -1593,6 +1795,20 @@ extern "C" {
     }
 
 
+    cudaError_t _softmaxCe(cudaStream_t stream,
+                           int batchSize,
+                           int numClasses,
+                           const float* __restrict__ logits,
+                           const int* __restrict__ targetClasses,
+                           float beta,
+                           float* __restrict__ losses,
+                           float* derivatives) {
+        int num_blocks = std::min(MAX_NUM_BLOCKS_PER_KERNEL, (batchSize - 1) / MAX_NUM_THREADS_PER_BLOCK + 1);
+        softmaxCe<<<num_blocks, MAX_NUM_THREADS_PER_BLOCK, 0, stream>>>(batchSize, numClasses, logits, targetClasses, beta, losses, derivatives);
+        return cudaGetLastError();
+    }
+
+
     cudaError_t _matrixVectorColumnHprod(cudaStream_t stream,
                                          int nrows,
                                          int ncols,
@@ -1603,4 +1819,33 @@ extern "C" {
         matrixVectorColumnHprod<<<num_blocks, MAX_NUM_THREADS_PER_BLOCK, 0, stream>>>(nrows, ncols, matrix, vector, out);
         return cudaGetLastError();
     }
-}
\ No newline at end of file
+
+
+    cudaError_t _sumAlongAxis(cudaStream_t stream,
+                              int nrows,
+                              int ncols,
+                              int axis,
+                              float alpha,
+                              const float* __restrict__ a,
+                              float beta,
+                              float* __restrict__ out) {
+        int nelems = axis == 0 ? ncols : nrows;
+        int num_blocks = std::min(MAX_NUM_BLOCKS_PER_KERNEL, (nelems - 1) / MAX_NUM_THREADS_PER_BLOCK + 1);
+        sumAlongAxis<<<num_blocks, MAX_NUM_THREADS_PER_BLOCK, 0, stream>>>(nrows, ncols, axis, alpha, a, beta, out);
+        return cudaGetLastError();
+    }
+
+
+    cudaError_t _maxAlongAxis(cudaStream_t stream,
+                              int nrows,
+                              int ncols,
+                              int axis,
+                              const float* __restrict__ a,
+                              float beta,
+                              float* __restrict__ out) {
+        int nelems = axis == 0 ? ncols : nrows;
+        int num_blocks = std::min(MAX_NUM_BLOCKS_PER_KERNEL, (nelems - 1) / MAX_NUM_THREADS_PER_BLOCK + 1);
+        maxAlongAxis<<<num_blocks, MAX_NUM_THREADS_PER_BLOCK, 0, stream>>>(nrows, ncols, axis, a, beta, out);
+        return cudaGetLastError();
+    }
+}
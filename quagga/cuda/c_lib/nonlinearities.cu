@@ -181,6 +181,85 @@ __global__ void relu(int nelems,
 }
 
 
+__global__ void addSigmoidDerivative(int nelems,
+                                     const float* __restrict__ sigmoidData,
+                                     const float* __restrict__ derivData,
+                                     float* __restrict__ out) {
+    const int nthreads = blockDim.x * gridDim.x;
+    const int start_i = blockIdx.x * blockDim.x + threadIdx.x;
+
+    for (int i = start_i; i < nelems; i += nthreads) {
+        out[i] += derivData[i] * sigmoidData[i] * (1.0f - sigmoidData[i]);
+    }
+}
+
+
+__global__ void addTanhDerivative(int nelems,
+                                  const float* __restrict__ tanhData,
+                                  const float* __restrict__ derivData,
+                                  float* __restrict__ out) {
+    const int nthreads = blockDim.x * gridDim.x;
+    const int start_i = blockIdx.x * blockDim.x + threadIdx.x;
+
+    for (int i = start_i; i < nelems; i += nthreads) {
+        out[i] += derivData[i] * (1.0f - tanhData[i] * tanhData[i]);
+    }
+}
+
+
+__global__ void addReluDerivative(int nelems,
+                                  const float* __restrict__ reluData,
+                                  const float* __restrict__ derivData,
+                                  float* __restrict__ out) {
+    const int nthreads = blockDim.x * gridDim.x;
+    const int start_i = blockIdx.x * blockDim.x + threadIdx.x;
+
+    for (int i = start_i; i < nelems; i += nthreads) {
+        if (reluData[i] > 0.0f) {
+            out[i] += derivData[i];
+        }
+    }
+}
+
+
+__global__ void tanhSigmDerivativeRow(int nrows,
+                                      int ncols,
+                                      const float* __restrict__ tanhSigmData,
+                                      float* __restrict__ derivative) {
+    const int nthreads = blockDim.x * gridDim.x;
+    const int start_i = blockIdx.x * blockDim.x + threadIdx.x;
+    const int nelems = nrows * ncols;
+    const int margin  = nrows / 4;
+
+    for (int i = start_i; i < nelems; i += nthreads) {
+        if (i % nrows < margin) {
+            derivative[i] = 1.0f - tanhSigmData[i] * tanhSigmData[i];
+        } else {
+            derivative[i] = tanhSigmData[i] * (1.0f - tanhSigmData[i]);
+        }
+    }
+}
+
+
+__global__ void tanhSigmDerivativeColumn(int nrows,
+                                         int ncols,
+                                         const float* __restrict__ tanhSigmData,
+                                         float* __restrict__ derivative) {
+    const int nthreads = blockDim.x * gridDim.x;
+    const int start_i = blockIdx.x * blockDim.x + threadIdx.x;
+    const int nelems  = ncols * nrows;
+    const int margin  = ncols / 4 * nrows;
+    int i;
+
+    for (i = start_i; i < margin; i += nthreads) {
+        derivative[i] = 1.0f - tanhSigmData[i] * tanhSigmData[i];
+    }
+    for (; i < nelems; i += nthreads) {
+        derivative[i] = tanhSigmData[i] * (1.0f - tanhSigmData[i]);
+    }
+}
+
+
 extern "C" {
     cudaError_t _sigmoid(cudaStream_t stream,
                          int nelems,
@@ -275,4 +354,53 @@ extern "C" {
         relu<<<num_blocks, MAX_NUM_THREADS_PER_BLOCK, 0, stream>>>(nelems, data, relu_data, derivative);
         return cudaGetLastError();
     }
-}
\ No newline at end of file
+
+
+    cudaError_t _addSigmoidDerivative(cudaStream_t stream,
+                                      int nelems,
+                                      const float* __restrict__ sigmoid_data,
+                                      const float* __restrict__ deriv_data,
+                                      float* __restrict__ out) {
+        int num_blocks = std::min(MAX_NUM_BLOCKS_PER_KERNEL, (nelems - 1) / MAX_NUM_THREADS_PER_BLOCK + 1);
+        addSigmoidDerivative<<<num_blocks, MAX_NUM_THREADS_PER_BLOCK, 0, stream>>>(nelems, sigmoid_data, deriv_data, out);
+        return cudaGetLastError();
+    }
+
+
+    cudaError_t _addTanhDerivative(cudaStream_t stream,
+                                   int nelems,
+                                   const float* __restrict__ tanh_data,
+                                   const float* __restrict__ deriv_data,
+                                   float* __restrict__ out) {
+        int num_blocks = std::min(MAX_NUM_BLOCKS_PER_KERNEL, (nelems - 1) / MAX_NUM_THREADS_PER_BLOCK + 1);
+        addTanhDerivative<<<num_blocks, MAX_NUM_THREADS_PER_BLOCK, 0, stream>>>(nelems, tanh_data, deriv_data, out);
+        return cudaGetLastError();
+    }
+
+
+    cudaError_t _addReluDerivative(cudaStream_t stream,
+                                   int nelems,
+                                   const float* __restrict__ relu_data,
+                                   const float* __restrict__ deriv_data,
+                                   float* __restrict__ out) {
+        int num_blocks = std::min(MAX_NUM_BLOCKS_PER_KERNEL, (nelems - 1) / MAX_NUM_THREADS_PER_BLOCK + 1);
+        addReluDerivative<<<num_blocks, MAX_NUM_THREADS_PER_BLOCK, 0, stream>>>(nelems, relu_data, deriv_data, out);
+        return cudaGetLastError();
+    }
+
+
+    cudaError_t _tanhSigmDerivative(cudaStream_t stream,
+                                    int axis,
+                                    int nrows,
+                                    int ncols,
+                                    const float* __restrict__ tanh_sigm_data,
+                                    float* __restrict__ derivative) {
+        int num_blocks = std::min(MAX_NUM_BLOCKS_PER_KERNEL, (nrows * ncols - 1) / MAX_NUM_THREADS_PER_BLOCK + 1);
+        if (axis) {
+            tanhSigmDerivativeColumn<<<num_blocks, MAX_NUM_THREADS_PER_BLOCK, 0, stream>>>(nrows, ncols, tanh_sigm_data, derivative);
+        } else {
+            tanhSigmDerivativeRow<<<num_blocks, MAX_NUM_THREADS_PER_BLOCK, 0, stream>>>(nrows, ncols, tanh_sigm_data, derivative);
+        }
+        return cudaGetLastError();
+    }
+}
@@ -76,6 +76,19 @@ def add_scaled_columns_slice(stream, nrows, ncols, alpha, dense_matrix, embeddin
     cudart.check_cuda_status(status)
 
 
+gpu_matrix_kernels._assignRowsSlice.restype = cudart.ct_cuda_error
+gpu_matrix_kernels._assignRowsSlice.argtypes = [cudart.ct_cuda_stream,
+                                                ct.c_int,
+                                                ct.c_int,
+                                                ct.POINTER(ct.c_float),
+                                                ct.POINTER(ct.c_int),
+                                                ct.c_int,
+                                                ct.POINTER(ct.c_float)]
+def assign_rows_slice(stream, nrows, ncols, dense_matrix, embedding_row_indxs, embd_nrows, embedding_matrix):
+    status = gpu_matrix_kernels._assignRowsSlice(stream, nrows, ncols, dense_matrix, embedding_row_indxs, embd_nrows, embedding_matrix)
+    cudart.check_cuda_status(status)
+
+
 gpu_matrix_kernels._addScaledRowsSlice.restype = cudart.ct_cuda_error
 gpu_matrix_kernels._addScaledRowsSlice.argtypes = [cudart.ct_cuda_stream,
                                                    ct.c_int,
@@ -198,6 +211,31 @@ def sum_hprod_11(stream, nelems, a, b, c, d, e, f, g, h, i, j, k, l):
     cudart.check_cuda_status(status)
 
 
+gpu_matrix_kernels._rowTopK.restype = cudart.ct_cuda_error
+gpu_matrix_kernels._rowTopK.argtypes = [cudart.ct_cuda_stream,
+                                        ct.c_int,
+                                        ct.c_int,
+                                        ct.POINTER(ct.c_float),
+                                        ct.c_int,
+                                        ct.POINTER(ct.c_float),
+                                        ct.POINTER(ct.c_int)]
+def row_top_k(stream, nrows, ncols, a, k, values, indxs):
+    status = gpu_matrix_kernels._rowTopK(stream, nrows, ncols, a, k, values, indxs)
+    cudart.check_cuda_status(status)
+
+
+gpu_matrix_kernels._sampleRows.restype = cudart.ct_cuda_error
+gpu_matrix_kernels._sampleRows.argtypes = [cudart.ct_cuda_stream,
+                                           ct.c_int,
+                                           ct.c_int,
+                                           ct.POINTER(ct.c_float),
+                                           ct.POINTER(ct.c_float),
+                                           ct.POINTER(ct.c_int)]
+def sample_rows(stream, nrows, ncols, probs, uniforms, indxs):
+    status = gpu_matrix_kernels._sampleRows(stream, nrows, ncols, probs, uniforms, indxs)
+    cudart.check_cuda_status(status)
+
+
 gpu_matrix_kernels._columnArgmax.restype = cudart.ct_cuda_error
 gpu_matrix_kernels._columnArgmax.argtypes = [cudart.ct_cuda_stream,
                                              ct.c_int,
@@ -481,6 +519,20 @@ def add_softmax_ce_derivative(stream, batchSize, num_classes, probs, target_clas
     cudart.check_cuda_status(status)
 
 
+gpu_matrix_kernels._softmaxCe.restype = cudart.ct_cuda_error
+gpu_matrix_kernels._softmaxCe.argtypes = [cudart.ct_cuda_stream,
+                                          ct.c_int,
+                                          ct.c_int,
+                                          ct.POINTER(ct.c_float),
+                                          ct.POINTER(ct.c_int),
+                                          ct.c_float,
+                                          ct.POINTER(ct.c_float),
+                                          ct.POINTER(ct.c_float)]
+def softmax_ce(stream, batchSize, num_classes, logits, target_classes, beta, losses, derivatives):
+    status = gpu_matrix_kernels._softmaxCe(stream, batchSize, num_classes, logits, target_classes, beta, losses, derivatives)
+    cudart.check_cuda_status(status)
+
+
 gpu_matrix_kernels._dropout.restype = cudart.ct_cuda_error
 gpu_matrix_kernels._dropout.argtypes = [cudart.ct_cuda_stream,
                                         ct.c_int,
@@ -707,4 +759,31 @@ gpu_matrix_kernels._transposeInt.argtypes = [cudart.ct_cuda_stream,
                                              ct.POINTER(ct.c_int)]
 def transpose_int(stream, nrows, ncols, in_, out):
     status = gpu_matrix_kernels._transposeInt(stream, nrows, ncols, in_, out)
-    cudart.check_cuda_status(status)
\ No newline at end of file
+    cudart.check_cuda_status(status)
+
+
+gpu_matrix_kernels._sumAlongAxis.restype = cudart.ct_cuda_error
+gpu_matrix_kernels._sumAlongAxis.argtypes = [cudart.ct_cuda_stream,
+                                             ct.c_int,
+                                             ct.c_int,
+                                             ct.c_int,
+                                             ct.c_float,
+                                             ct.POINTER(ct.c_float),
+                                             ct.c_float,
+                                             ct.POINTER(ct.c_float)]
+def sum_along_axis(stream, nrows, ncols, axis, alpha, a, beta, out):
+    status = gpu_matrix_kernels._sumAlongAxis(stream, nrows, ncols, axis, alpha, a, beta, out)
+    cudart.check_cuda_status(status)
+
+
+gpu_matrix_kernels._maxAlongAxis.restype = cudart.ct_cuda_error
+gpu_matrix_kernels._maxAlongAxis.argtypes = [cudart.ct_cuda_stream,
+                                             ct.c_int,
+                                             ct.c_int,
+                                             ct.c_int,
+                                             ct.POINTER(ct.c_float),
+                                             ct.c_float,
+                                             ct.POINTER(ct.c_float)]
+def max_along_axis(stream, nrows, ncols, axis, a, beta, out):
+    status = gpu_matrix_kernels._maxAlongAxis(stream, nrows, ncols, axis, a, beta, out)
+    cudart.check_cuda_status(status)
@@ -105,4 +105,49 @@ nonlinearities._tanhSigmDer.argtypes = [cudart.ct_cuda_stream,
                                         ct.POINTER(ct.c_float)]
 def tanh_sigm_der(stream, axis, nrows, ncols, data, tanh_sigm_data, derivatve):
     status = nonlinearities._tanhSigmDer(stream, axis, nrows, ncols, data, tanh_sigm_data, derivatve)
-    cudart.check_cuda_status(status)
\ No newline at end of file
+    cudart.check_cuda_status(status)
+
+
+nonlinearities._addSigmoidDerivative.restype = cudart.ct_cuda_error
+nonlinearities._addSigmoidDerivative.argtypes = [cudart.ct_cuda_stream,
+                                                 ct.c_int,
+                                                 ct.POINTER(ct.c_float),
+                                                 ct.POINTER(ct.c_float),
+                                                 ct.POINTER(ct.c_float)]
+def add_sigmoid_derivative(stream, nelems, sigmoid_data, deriv_data, out):
+    status = nonlinearities._addSigmoidDerivative(stream, nelems, sigmoid_data, deriv_data, out)
+    cudart.check_cuda_status(status)
+
+
+nonlinearities._addTanhDerivative.restype = cudart.ct_cuda_error
+nonlinearities._addTanhDerivative.argtypes = [cudart.ct_cuda_stream,
+                                              ct.c_int,
+                                              ct.POINTER(ct.c_float),
+                                              ct.POINTER(ct.c_float),
+                                              ct.POINTER(ct.c_float)]
+def add_tanh_derivative(stream, nelems, tanh_data, deriv_data, out):
+    status = nonlinearities._addTanhDerivative(stream, nelems, tanh_data, deriv_data, out)
+    cudart.check_cuda_status(status)
+
+
+nonlinearities._addReluDerivative.restype = cudart.ct_cuda_error
+nonlinearities._addReluDerivative.argtypes = [cudart.ct_cuda_stream,
+                                              ct.c_int,
+                                              ct.POINTER(ct.c_float),
+                                              ct.POINTER(ct.c_float),
+                                              ct.POINTER(ct.c_float)]
+def add_relu_derivative(stream, nelems, relu_data, deriv_data, out):
+    status = nonlinearities._addReluDerivative(stream, nelems, relu_data, deriv_data, out)
+    cudart.check_cuda_status(status)
+
+
+nonlinearities._tanhSigmDerivative.restype = cudart.ct_cuda_error
+nonlinearities._tanhSigmDerivative.argtypes = [cudart.ct_cuda_stream,
+                                               ct.c_int,
+                                               ct.c_int,
+                                               ct.c_int,
+                                               ct.POINTER(ct.c_float),
+                                               ct.POINTER(ct.c_float)]
+def tanh_sigm_derivative(stream, axis, nrows, ncols, tanh_sigm_data, derivative):
+    status = nonlinearities._tanhSigmDerivative(stream, axis, nrows, ncols, tanh_sigm_data, derivative)
+    cudart.check_cuda_status(status)
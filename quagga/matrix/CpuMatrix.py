@@ -14,10 +14,90 @@
 # limitations under the License.
 # ----------------------------------------------------------------------------
 import quagga
+import inspect
 import weakref
+import functools
+import threading
 import numpy as np
 from itertools import izip
+from numpy.lib.stride_tricks import as_strided
 from quagga.matrix import ShapeElement
+from quagga.matrix.MemoryArena import MemoryArena
+from quagga.matrix.SparseMatrix import CoalescedSlices
+
+
+def _deferred(*written):
+    """
+    Makes the decorated operation asynchronous for asynchronous contexts
+    (see :class:`~quagga.context.CpuContext`). The call is queued into the
+    context with matrix arguments replaced by views of their current shapes,
+    so that later shape changes do not affect it. The context waits for the
+    contexts that modified the arguments last and becomes
+    ``last_modif_context`` of the ``written`` arguments.
+    """
+    def decorator(method):
+        context_position = inspect.getargspec(method).args.index('context')
+
+        @functools.wraps(method)
+        def deferred_method(*args, **kwargs):
+            if context_position < len(args):
+                context = args[context_position]
+            else:
+                context = kwargs['context']
+            if context is None or not context.deferring:
+                return method(*args, **kwargs)
+            call_args = inspect.getcallargs(method, *args, **kwargs)
+            frozen_call_args = {}
+            matrices = []
+            for name, value in call_args.iteritems():
+                frozen_call_args[name] = _freeze(value, matrices)
+            contexts = set(m.last_modif_context for m in matrices)
+            contexts.discard(None)
+            contexts.discard(context)
+            context.wait(*contexts)
+            for m in matrices:
+                m.last_usage_context = context
+            for name in written:
+                written_matrices = []
+                _freeze(call_args[name], written_matrices)
+                for m in written_matrices:
+                    m.last_modif_context = context
+            context.submit(functools.partial(method, **frozen_call_args))
+        return deferred_method
+    return decorator
+
+
+def _freeze(value, matrices):
+    """
+    Returns ``value`` in which matrices are replaced by fixed shape views
+    and ``ShapeElement`` instances by their values. Original matrices are
+    appended to ``matrices``.
+    """
+    if isinstance(value, ShapeElement):
+        return value.value
+    if hasattr(value, 'npa'):
+        matrices.append(value)
+        npa = value.npa
+        return CpuMatrix(npa, npa.shape[0], npa.shape[1], value.dtype)
+    if isinstance(value, quagga.matrix.SparseMatrix) and value.compact:
+        # coalesced slices are filled by the sparse matrix's context, so
+        # they are waited for and read at the time of execution
+        matrices.append(value)
+        sparse_matrix = quagga.matrix.SparseMatrix()
+        sparse_matrix.compact = True
+        sparse_matrix.coalesced_rows = value.coalesced_rows
+        sparse_matrix.coalesced_columns = value.coalesced_columns
+        return sparse_matrix
+    if isinstance(value, quagga.matrix.SparseMatrix):
+        sparse_matrix = quagga.matrix.SparseMatrix()
+        for attr_name in ['columns', 'rows', 'rows_batch']:
+            frozen = getattr(sparse_matrix, attr_name)
+            for indxs, v in getattr(value, attr_name).iteritems():
+                frozen[_freeze(indxs, matrices)] = _freeze(v, matrices)
+        return sparse_matrix
+    if hasattr(value, '__iter__') and not isinstance(value, np.ndarray):
+        return [_freeze(e, matrices) for e in value]
+    return value
 
 
 class CpuMatrix(object):
@@ -32,7 +112,7 @@ class CpuMatrix(object):
 
     @staticmethod
     def get_setable_attributes():
-        return ['nrows', 'ncols', 'npa']
+        return ['nrows', 'ncols', 'npa', 'last_modif_context']
 
     @property
     def npa(self):
@@ -52,7 +132,7 @@ class CpuMatrix(object):
 
     @nrows.setter
     def nrows(self, value):
-        data = self.data.base if self.data.base is not None else self.data
+        data = self.data.base if getattr(self.data.base, 'ndim', None) == 2 else self.data
         if value > data.shape[0]:
             raise ValueError('There is no so many preallocated memory! '
                              'Maximum for `nrows` is {}'.format(self.data.shape[0]))
@@ -64,7 +144,7 @@ class CpuMatrix(object):
 
     @ncols.setter
     def ncols(self, value):
-        data = self.data.base if self.data.base is not None else self.data
+        data = self.data.base if getattr(self.data.base, 'ndim', None) == 2 else self.data
         if value > data.shape[1]:
             raise ValueError('There is no so many preallocated memory! '
                              'Maximum for `ncols` is {}'.format(self.data.shape[1]))
@@ -93,6 +173,16 @@ class CpuMatrix(object):
             return a
         if isinstance(key, slice) and self.ncols == 1:
             key = (key, 0)
+        # get first rows, the view follows the value of the stop element
+        if isinstance(key, slice) and not key.step and not key.start and isinstance(key.stop, ShapeElement):
+            return CpuMatrix(self.data, key.stop, self.ncols, self.dtype)
+        # get row slice
+        if isinstance(key, slice) and not key.step and \
+                isinstance(key.start, (int, type(None))) and isinstance(key.stop, (int, type(None))):
+            # bounds are clipped to the logical rows like for numpy arrays
+            start, stop, _ = key.indices(int(self.nrows))
+            stop = max(start, stop)
+            return CpuMatrix(self.data[start:stop], stop - start, self.ncols, self.dtype)
         # get row slice with one column
         if isinstance(key[0], slice) and not key[0].step and isinstance(key[1], (int, ShapeElement)):
             start = key[0].start if key[0].start else 0
@@ -191,7 +281,12 @@ class CpuMatrix(object):
         a = cls(None, nrows, ncols, dtype)
         nrows = nrows.value if isinstance(nrows, ShapeElement) else nrows
         ncols = ncols.value if isinstance(ncols, ShapeElement) else ncols
-        a.data = np.nan_to_num(np.empty((nrows, ncols), dtype=np_dtype))
+        arena = MemoryArena.current()
+        if arena:
+            a.data = arena.empty((nrows, ncols), np_dtype)
+        else:
+            # calloc'ed memory is zeroed lazily by the operating system
+            a.data = np.zeros((nrows, ncols), dtype=np_dtype)
         return a
 
     @classmethod
@@ -199,11 +294,25 @@ class CpuMatrix(object):
         return cls.empty(other.nrows, other.ncols, other.dtype)
 
     def to_host(self, context=None):
+        if context:
+            host_array = np.empty(self.npa.shape, self.npa.dtype)
+            self._to_host(context, host_array)
+            return host_array
+        if self.last_modif_context:
+            self.last_modif_context.synchronize()
         return np.copy(self.npa)
 
+    @_deferred()
+    def _to_host(self, context, host_array):
+        np.copyto(host_array, self.npa)
+
     def assign(self, context, a):
         self.nrows, self.ncols = a.nrows, a.ncols
-        self.npa = np.copy(a.npa)
+        self._assign(context, a)
+
+    @_deferred('self')
+    def _assign(self, context, a):
+        np.copyto(self.npa, a.npa)
 
     def assign_npa(self, context, a, nrows=None, ncols=None):
         # TODO(sergii): add support for ctypes pointer
@@ -214,23 +323,32 @@ class CpuMatrix(object):
         if a.ndim != 2:
             raise ValueError('CpuMatrix works only with 2-d numpy arrays!')
         self.nrows, self.ncols = a.shape
-        self.npa = np.copy(a)
+        if context and context.deferring:
+            # the caller is free to reuse `a` right after the call
+            a = np.copy(a)
+        self._assign_npa(context, a)
 
+    @_deferred('self')
+    def _assign_npa(self, context, a):
+        np.copyto(self.npa, a)
+
+    @_deferred('self')
     def fill(self, context, value):
-        self.npa = value
+        self.npa.fill(value)
 
     def sync_fill(self, value):
-        self.npa = value
+        self.npa.fill(value)
 
+    @_deferred('out')
     def slice_columns(self, context, column_indxs, out):
-        out.npa = self.npa[:, column_indxs.npa.flatten()]
+        np.take(self.npa, _indices(column_indxs), axis=1, out=out.npa)
 
+    @_deferred('self')
     def add_scaled_columns_slice(self, context, column_indxs, alpha, a):
         """
         self[:, column_indxs] += alpha * a
         """
-        for i, idx in enumerate(column_indxs.npa.flatten()):
-            self.npa[:, idx] += alpha * a.npa[:, i]
+        _scatter_add(self.npa.T, [_indices(column_indxs)], [a.npa.T], alpha)
 
     def add_columns_slice(self, context, column_indxs, a):
         """
@@ -238,18 +356,29 @@ class CpuMatrix(object):
         """
         self.add_scaled_columns_slice(context, column_indxs, 1.0, a)
 
+    @_deferred('out')
     def slice_columns_and_transpose(self, context, column_indxs, out):
-        out.npa = self.npa[:, column_indxs.npa.flatten()].T
+        temp = _get_temp_npa(out.npa.T.shape)[0]
+        np.take(self.npa, _indices(column_indxs), axis=1, out=temp)
+        np.copyto(out.npa, temp.T)
 
+    @_deferred('out')
     def slice_rows(self, context, row_indxs, out):
-        out.npa = self.npa[row_indxs.npa.flatten()]
+        np.take(self.npa, _indices(row_indxs), axis=0, out=out.npa)
+
+    @_deferred('self')
+    def assign_rows_slice(self, context, row_indxs, a):
+        """
+        self[row_indxs] = a
+        """
+        self.npa[_indices(row_indxs)] = a.npa
 
+    @_deferred('self')
     def add_scaled_rows_slice(self, context, row_indxs, alpha, a):
         """
         self[row_indxs] += alpha * a
         """
-        for i, idx in enumerate(row_indxs.npa.flatten()):
-            self.npa[idx] += alpha * a.npa[i]
+        _scatter_add(self.npa, [_indices(row_indxs)], [a.npa], alpha)
 
     def add_rows_slice(self, context, row_indxs, a):
         """
@@ -257,6 +386,7 @@ class CpuMatrix(object):
         """
         self.add_scaled_rows_slice(context, row_indxs, 1.0, a)
 
+    @_deferred('dense_matrices')
     def slice_rows_batch(self, context, rows_indxs, dense_matrices):
         """
         for k in range(K):
@@ -264,20 +394,33 @@ class CpuMatrix(object):
         """
         n = rows_indxs.ncols
         for i in xrange(n):
-            dense_matrices[i].npa = self.npa[rows_indxs.npa[:, i]]
+            np.take(self.npa, rows_indxs.npa[:, i], axis=0, out=dense_matrices[i].npa)
 
+    @_deferred('self')
     def add_scaled_rows_batch_slice(self, context, rows_indxs, alpha, dense_matrices):
         """
         for k in range(K):
             self[rows_indxs[:, k]] += alpha * dense_matrices[k]
         """
-        for k, m in enumerate(dense_matrices):
-            for i, idx in enumerate(rows_indxs.npa[:, k]):
-                self.npa[idx] += alpha * m.npa[i]
+        _scatter_add(self.npa, rows_indxs.npa.T, [m.npa for m in dense_matrices], alpha)
 
     def add_rows_batch_slice(self, context, rows_indxs, dense_matrices):
         self.add_scaled_rows_batch_slice(context, rows_indxs, 1.0, dense_matrices)
 
+    @staticmethod
+    @_deferred()
+    def coalesce_slices(context, indxs, dense_matrices, axis, coalesced_slices):
+        """
+        Adds slices of ``dense_matrices`` to ``coalesced_slices``. For
+        axis=0 ``dense_matrices[k]`` are rows located at ``indxs[:, k]``,
+        for axis=1 the only dense matrix holds columns located at ``indxs``.
+        """
+        if axis == 0:
+            coalesced_slices.add(indxs.npa.T, [m.npa for m in dense_matrices])
+        else:
+            coalesced_slices.add([_indices(indxs)], [dense_matrices[0].npa.T])
+
+    @_deferred('self')
     def assign_hstack(self, context, matrices):
         ncols = 0
         for matrix in matrices:
@@ -288,12 +431,17 @@ class CpuMatrix(object):
         if ncols != self.ncols:
             raise ValueError("The number of columns in the assigning matrix differs"
                              "from the summed numbers of columns in buffers!")
-        self.npa = np.hstack(m.npa for m in matrices)
+        k = 0
+        for m in matrices:
+            ncols = int(m.ncols)
+            np.copyto(self.npa[:, k:k+ncols], m.npa)
+            k += ncols
 
+    @_deferred('matrices')
     def hsplit(self, context, matrices, col_slices=None):
         if col_slices:
             for i, col_slice in enumerate(col_slices):
-                matrices[i].npa = self.npa[:, col_slice[0]:col_slice[1]]
+                np.copyto(matrices[i].npa, self.npa[:, col_slice[0]:col_slice[1]])
         else:
             ncols = 0
             for matrix in matrices:
@@ -304,25 +452,43 @@ class CpuMatrix(object):
             if ncols != self.ncols:
                 raise ValueError("The number of columns in the matrix to be split differs "
                                  "from the summed numbers of columns in buffers!")
-            indices_or_sections = [matrices[0].ncols]
-            for m in matrices[1:-1]:
-                indices_or_sections.append(indices_or_sections[-1] + m.ncols)
-            _matrices = np.hsplit(self.npa, indices_or_sections)
-            for _m, m in izip(_matrices, matrices):
-                m.npa = _m
+            k = 0
+            for m in matrices:
+                ncols = int(m.ncols)
+                np.copyto(m.npa, self.npa[:, k:k+ncols])
+                k += ncols
 
     @staticmethod
+    @_deferred('output_sequence')
     def batch_hstack(context, x_sequence, y_sequence, output_sequence):
+        x_ncols = x_sequence[0].npa.shape[1]
+        stacked = _stacked_npa(output_sequence)
+        x_stacked = _stacked_npa(x_sequence)
+        y_stacked = _stacked_npa(y_sequence)
+        if stacked is not None and x_stacked is not None and y_stacked is not None:
+            np.copyto(stacked[:, :, :x_ncols], x_stacked)
+            np.copyto(stacked[:, :, x_ncols:], y_stacked)
+            return
         for x, y, out in izip(x_sequence, y_sequence, output_sequence):
-            out.npa = np.hstack((x.npa, y.npa))
+            np.copyto(out.npa[:, :x_ncols], x.npa)
+            np.copyto(out.npa[:, x_ncols:], y.npa)
 
     @staticmethod
+    @_deferred('x_sequence', 'y_sequence')
     def batch_hsplit(context, input_sequence, x_sequence, y_sequence):
         x_ncols = x_sequence[0].npa.shape[1]
+        stacked = _stacked_npa(input_sequence)
+        x_stacked = _stacked_npa(x_sequence)
+        y_stacked = _stacked_npa(y_sequence)
+        if stacked is not None and x_stacked is not None and y_stacked is not None:
+            np.copyto(x_stacked, stacked[:, :, :x_ncols])
+            np.copyto(y_stacked, stacked[:, :, x_ncols:])
+            return
         for in_matrix, x, y in izip(input_sequence, x_sequence, y_sequence):
-            x.npa = in_matrix.npa[:, :x_ncols]
-            y.npa = in_matrix.npa[:, x_ncols:]
+            np.copyto(x.npa, in_matrix.npa[:, :x_ncols])
+            np.copyto(y.npa, in_matrix.npa[:, x_ncols:])
 
+    @_deferred('self')
     def assign_vstack(self, context, matrices):
         nrows = 0
         for matrix in matrices:
@@ -333,12 +499,17 @@ class CpuMatrix(object):
         if nrows != self.nrows:
             raise ValueError("The number of rows in the assigning matrix differs"
                              "from the summed numbers of rows in buffers!")
-        self.npa = np.vstack(m.npa for m in matrices)
+        k = 0
+        for m in matrices:
+            nrows = int(m.nrows)
+            np.copyto(self.npa[k:k+nrows], m.npa)
+            k += nrows
 
+    @_deferred('matrices')
     def vsplit(self, context, matrices, row_slices=None):
         if row_slices:
             for i, row_slice in enumerate(row_slices):
-                matrices[i].npa = self.npa[row_slice[0]:row_slice[1], :]
+                np.copyto(matrices[i].npa, self.npa[row_slice[0]:row_slice[1], :])
         else:
             nrows = 0
             for matrix in matrices:
@@ -349,110 +520,205 @@ class CpuMatrix(object):
             if nrows != self.nrows:
                 raise ValueError("The number of rows in the matrix to be split differs "
                                  "from the summed numbers of rows in buffers!")
-            indices_or_sections = [matrices[0].nrows]
-            for m in matrices[1:-1]:
-                indices_or_sections.append(indices_or_sections[-1] + m.nrows)
-            _matrices = np.vsplit(self.npa, indices_or_sections)
-            for _m, m in izip(_matrices, matrices):
-                m.npa = _m
+            k = 0
+            for m in matrices:
+                nrows = int(m.nrows)
+                np.copyto(m.npa, self.npa[k:k+nrows])
+                k += nrows
 
+    @_deferred('self')
     def assign_sequential_mean_pooling(self, context, matrices):
-        for i in xrange(matrices[0].nrows):
-            self.npa[i] = np.mean([matrix.npa[i] for matrix in matrices], axis=0)
+        self.assign_sequential_sum_pooling(context, matrices)
+        self.npa *= 1.0 / len(matrices)
 
+    @_deferred('self')
     def assign_sequential_sum_pooling(self, context, matrices):
-        for i in xrange(matrices[0].nrows):
-            self.npa[i] = np.sum([matrix.npa[i] for matrix in matrices], axis=0)
+        stacked = _stacked_npa(matrices)
+        if stacked is not None:
+            np.sum(stacked, axis=0, out=self.npa)
+            return
+        np.copyto(self.npa, matrices[0].npa)
+        for m in matrices[1:]:
+            self.npa += m.npa
 
     @staticmethod
+    @_deferred('matrices')
     def sequentially_tile(context, a, matrices):
+        stacked = _stacked_npa(matrices)
+        if stacked is not None:
+            np.copyto(stacked, a.npa)
+            return
+        for m in matrices:
+            np.copyto(m.npa, a.npa)
+
+    @staticmethod
+    @_deferred('matrices')
+    def add_scaled_sequentially_tile(context, alpha, a, matrices):
+        """
+        for k in range(K):
+            matrices[k] += alpha * a
+        """
+        temp = _get_temp_npa(a.npa.shape)[0]
+        np.multiply(a.npa, alpha, out=temp)
+        stacked = _stacked_npa(matrices)
+        if stacked is not None:
+            stacked += temp
+            return
         for m in matrices:
-            m.npa = a.npa
+            m.npa += temp
 
+    @staticmethod
+    def add_sequentially_tile(context, a, matrices):
+        CpuMatrix.add_scaled_sequentially_tile(context, 1.0, a, matrices)
+
+    @_deferred('self')
     def tile(self, context, axis, a):
-        n = int(self.nrows if axis == 0 else self.ncols)
-        self.npa = np.repeat(a.npa, n, axis)
+        # `a` is a row (axis=0) or a column (axis=1), so broadcasting
+        # it over `self` is the same as repeating it
+        np.copyto(self.npa, a.npa)
 
+    @_deferred('self')
     def assign_repeat(self, context, a, repeats, axis):
-        reps = [1, 1]
-        reps[axis] = int(repeats)
-        self.npa = np.tile(a.npa, reps)
+        np.copyto(_repeat_view(self.npa, a.npa.shape, repeats, axis), _expand(a.npa, axis))
+
+    @_deferred('self')
+    def assign_sum_along_axis(self, context, a, axis):
+        """
+        self = sum(a, axis)
+        """
+        _reduce_along_axis(np.sum, a.npa, axis, self.npa)
+
+    @_deferred('self')
+    def add_sum_along_axis(self, context, a, axis):
+        """
+        self += sum(a, axis)
+        """
+        _reduce_along_axis(np.sum, a.npa, axis, self.npa, add=True)
+
+    @_deferred('self')
+    def assign_mean_along_axis(self, context, a, axis):
+        """
+        self = mean(a, axis)
+        """
+        _reduce_along_axis(np.mean, a.npa, axis, self.npa)
 
+    @_deferred('self')
+    def add_mean_along_axis(self, context, a, axis):
+        """
+        self += mean(a, axis)
+        """
+        _reduce_along_axis(np.mean, a.npa, axis, self.npa, add=True)
+
+    @_deferred('self')
+    def assign_max_along_axis(self, context, a, axis):
+        """
+        self = max(a, axis)
+        """
+        _reduce_along_axis(np.max, a.npa, axis, self.npa)
+
+    @_deferred('self')
+    def add_max_along_axis(self, context, a, axis):
+        """
+        self += max(a, axis)
+        """
+        _reduce_along_axis(np.max, a.npa, axis, self.npa, add=True)
+
+    @_deferred('self')
     def add_repeat_derivative(self, context, a, repeats, axis):
-        n = self.npa.shape[axis]
-        if axis == 0:
-            for i in xrange(repeats):
-                self.npa += a.npa[i*n:(i+1)*n]
-        elif axis == 1:
-            for i in xrange(repeats):
-                self.npa += a.npa[:, i*n:(i+1)*n]
-        else:
+        if axis not in (0, 1):
             raise ValueError('TODO')
+        temp = _get_temp_npa(self.npa.shape)[0]
+        np.sum(_repeat_view(a.npa, self.npa.shape, repeats, axis), axis=axis, out=temp)
+        self.npa += temp
 
     @staticmethod
     def get_random_generator(seed):
         return np.random.RandomState(seed)
 
+    @_deferred('out')
     def dropout(self, context, generator, dropout_prob, out):
-        out.npa = generator.binomial(n=1, p=1-dropout_prob, size=self.npa.shape).astype(np.float32) * self.npa
+        mask = generator.binomial(n=1, p=1-dropout_prob, size=self.npa.shape)
+        np.multiply(mask, self.npa, out=out.npa)
 
+    @_deferred('out')
     def add_gaussian_noise(self, context, generator, mean, std, out):
-        out.npa = generator.normal(loc=mean, scale=std, size=self.npa.shape).astype(np.float32) + self.npa
+        noise = generator.normal(loc=mean, scale=std, size=self.npa.shape)
+        np.add(noise, self.npa, out=out.npa)
 
     def assign_gaussian_noise(self, context, generator, mean, std):
         # TODO(sergii)
         raise NotImplemented()
 
+    @_deferred('self')
     def assign_mask_zeros(self, context, a, b):
         """
         self = a .* (b != 0)
         """
 
-        self.npa = a.npa * (b.npa != 0)
+        temp = _get_temp_npa(b.npa.shape)[0]
+        np.not_equal(b.npa, 0.0, out=temp)
+        np.multiply(a.npa, temp, out=self.npa)
 
+    @_deferred('self')
     def add_mask_zeros(self, context, a, b):
         """
         self += a .* (b != 0)
         """
 
-        self.npa += a.npa * (b.npa != 0)
+        temp = _get_temp_npa(b.npa.shape)[0]
+        np.not_equal(b.npa, 0.0, out=temp)
+        temp *= a.npa
+        self.npa += temp
 
+    @_deferred('self')
     def assign_masked_addition(self, context, mask, a, b):
         """
         self = mask .* a + (1 - mask) .* b
         """
 
-        self.npa = mask.npa * a.npa + (1 - mask.npa) * b.npa
+        # self = b + mask .* (a - b), `self` can be `a` or `b`
+        temp = _get_temp_npa(self.npa.shape)[0]
+        np.subtract(a.npa, b.npa, out=temp)
+        temp *= mask.npa
+        np.add(b.npa, temp, out=self.npa)
 
+    @_deferred('self')
     def add_hprod_one_minus_mask(self, context, mask, a):
         """
         self += (1 - mask) .* a
         """
 
-        self.npa += (1 - mask.npa) * a.npa
+        temp = _get_temp_npa(self.npa.shape)[0]
+        np.multiply(mask.npa, a.npa, out=temp)
+        np.subtract(a.npa, temp, out=temp)
+        self.npa += temp
 
+    @_deferred('self')
     def mask_column_numbers_row_wise(self, context, numbers):
         """
         self[i, j] = j < numbers[i]
         """
-        for i in xrange(numbers.npa.shape[0]):
-            self.npa[i] = np.arange(self.npa.shape[1]) < numbers.npa[i]
+        np.less(np.arange(self.npa.shape[1]), numbers.npa, out=self.npa)
 
+    @_deferred('self', 'out')
     def clip(self, context, min_value, max_value, out=None):
         if out is None:
             out = self
-        out.npa = np.clip(self.npa, min_value, max_value)
+        np.clip(self.npa, min_value, max_value, out=out.npa)
 
+    @_deferred('tanh_matrix', 'derivative_matrix')
     def tanh(self, context, tanh_matrix, derivative_matrix=None):
-        np.tanh(self.npa, tanh_matrix.npa)
+        np.tanh(self.npa, out=tanh_matrix.npa)
         if derivative_matrix:
-            derivative_matrix.npa = 1.0 - tanh_matrix.npa ** 2
+            _tanh_derivative(tanh_matrix.npa, derivative_matrix.npa)
 
+    @_deferred('sigmoid_matrix', 'derivative_matrix')
     def sigmoid(self, context, sigmoid_matrix, derivative_matrix=None):
-        sigmoid_matrix.npa = 1.0 / (1.0 + np.exp(-self.npa))
+        _sigmoid(self.npa, sigmoid_matrix.npa)
         if derivative_matrix:
-            derivative_matrix.npa = sigmoid_matrix.npa * (1.0 - sigmoid_matrix.npa)
+            _sigmoid_derivative(sigmoid_matrix.npa, derivative_matrix.npa)
 
+    @_deferred('tanh_sigm_matrix', 'derivative_matrix')
     def tanh_sigm(self, context, tanh_sigm_matrix, derivative_matrix=None, axis=0):
         """
         This is a fancy function that is used during forward propagation into
@@ -460,93 +726,340 @@ class CpuMatrix(object):
         tanh function and sigmoid for the 3/4 remaining elements.
         """
 
-        n = self.npa.shape[axis] / 4
         if axis == 0:
-            tanh_npa = np.tanh(self.npa[:n])
-            sigmoid_npa = 1.0 / (1.0 + np.exp(-self.npa[n:]))
-            tanh_sigm_matrix.npa = np.vstack((tanh_npa, sigmoid_npa))
+            n = self.npa.shape[0] // 4
+            x, y = self.npa[:n], tanh_sigm_matrix.npa[:n]
+            sigm_x, sigm_y = self.npa[n:], tanh_sigm_matrix.npa[n:]
         elif axis == 1:
-            tanh_npa = np.tanh(self.npa[:, :n])
-            sigmoid_npa = 1.0 / (1.0 + np.exp(-self.npa[:, n:]))
-            tanh_sigm_matrix.npa = np.hstack((tanh_npa, sigmoid_npa))
+            n = self.npa.shape[1] // 4
+            x, y = self.npa[:, :n], tanh_sigm_matrix.npa[:, :n]
+            sigm_x, sigm_y = self.npa[:, n:], tanh_sigm_matrix.npa[:, n:]
         else:
             raise ValueError('TODO')
+        np.tanh(x, out=y)
+        _sigmoid(sigm_x, sigm_y)
         if derivative_matrix:
-            tanh_der_npa = 1.0 - tanh_npa ** 2
-            sigmoid_der_npa = sigmoid_npa * (1.0 - sigmoid_npa)
-            f = np.hstack if axis else np.vstack
-            derivative_matrix.npa = f((tanh_der_npa, sigmoid_der_npa))
-
+            der = derivative_matrix.npa
+            if axis == 0:
+                tanh_der, sigm_der = der[:n], der[n:]
+            else:
+                tanh_der, sigm_der = der[:, :n], der[:, n:]
+            _tanh_derivative(y, tanh_der)
+            _sigmoid_derivative(sigm_y, sigm_der)
+
+    @_deferred('self', 'c', 'tanh_c', 'h')
+    def lstm_cell(self, context, x, W, prev_h, R, b, prev_c, c, tanh_c, h, mask=None, input_projected=False):
+        """
+        Fused forward pass of the LSTM cell, ``self`` is the zifo matrix.
+        After the matrix products everything is done in a single pass over
+        blocks of rows that fit into the cache.
+
+        self = tanh_sigm(x * W + prev_h * R + b)
+        c = i .* z + f .* prev_c
+        tanh_c = tanh(c)
+        h = o .* tanh_c
+        c = mask .* c + (1 - mask) .* prev_c
+        h = mask .* h + (1 - mask) .* prev_h
+
+        ``x`` and ``W`` can be None for the inputless cell. If
+        ``input_projected`` is True ``self`` already holds x * W.
+        """
+        if input_projected or x is not None:
+            if not input_projected:
+                self.assign_dot(context, x, W)
+            hR, temp = _get_temp_npa(self.npa.shape, prev_c.npa.shape)
+            np.dot(prev_h.npa, R.npa, out=hR)
+        else:
+            self.assign_dot(context, prev_h, R)
+            hR, temp = None, _get_temp_npa(prev_c.npa.shape)[0]
+        zifo = self.npa
+        n = zifo.shape[1] // 4
+        block_nrows = max(1, _CELL_BLOCK_NELEMS // zifo.shape[1])
+        for start in xrange(0, zifo.shape[0], block_nrows):
+            rows = slice(start, start + block_nrows)
+            pre_zifo = zifo[rows]
+            if hR is not None:
+                pre_zifo += hR[rows]
+            pre_zifo += b.npa
+            z, i, f, o = [pre_zifo[:, k*n:(k+1)*n] for k in xrange(4)]
+            np.tanh(z, out=z)
+            _sigmoid(pre_zifo[:, n:], pre_zifo[:, n:])
+            c_rows, prev_c_rows, tanh_c_rows = c.npa[rows], prev_c.npa[rows], tanh_c.npa[rows]
+            h_rows, prev_h_rows, temp_rows = h.npa[rows], prev_h.npa[rows], temp[rows]
+            np.multiply(i, z, out=c_rows)
+            np.multiply(f, prev_c_rows, out=temp_rows)
+            c_rows += temp_rows
+            np.tanh(c_rows, out=tanh_c_rows)
+            np.multiply(o, tanh_c_rows, out=h_rows)
+            if mask is not None:
+                mask_rows = mask.npa[rows]
+                for s, prev_s in [(c_rows, prev_c_rows), (h_rows, prev_h_rows)]:
+                    np.subtract(s, prev_s, out=temp_rows)
+                    temp_rows *= mask_rows
+                    np.add(prev_s, temp_rows, out=s)
+
+    @_deferred('self', 'dL_dprev_c', 'dL_dprev_h')
+    def lstm_cell_derivative(self, context, zifo, prev_c, tanh_c, dL_dc, dL_dh,
+                             grad_clipping=None, mask=None, dL_dprev_c=None, dL_dprev_h=None):
+        """
+        Fused backward pass of the LSTM cell, ``self`` is dL/dpre_zifo. The
+        activation derivatives are recomputed from ``zifo`` and ``tanh_c``
+        so they do not have to be stored during the forward pass.
+        The product with the recurrent matrix is not included.
+
+        dL/dprev_c += (1 - mask) .* dL/dc
+        dL/dprev_h += (1 - mask) .* dL/dh
+        dL/dc = mask .* dL/dc + mask .* dL/dh .* o .* (1 - tanh_c .* tanh_c)
+        dL/dpre_o = mask .* dL/dh .* tanh_c .* o .* (1 - o)
+        dL/dpre_f = dL/dc .* prev_c .* f .* (1 - f)
+        dL/dpre_i = dL/dc .* z .* i .* (1 - i)
+        dL/dpre_z = dL/dc .* i .* (1 - z .* z)
+        self = clip(dL/dpre_zifo, -grad_clipping, grad_clipping)
+        dL/dprev_c += f .* dL/dc
+        """
+        dL_dpre_zifo = self.npa
+        n = dL_dpre_zifo.shape[1] // 4
+        block_nrows = max(1, _CELL_BLOCK_NELEMS // dL_dpre_zifo.shape[1])
+        shape = (min(block_nrows, dL_dpre_zifo.shape[0]), n)
+        dc, dh, temp = _get_temp_npa(shape, shape, shape)
+        for start in xrange(0, dL_dpre_zifo.shape[0], block_nrows):
+            rows = slice(start, start + block_nrows)
+            z, i, f, o = [zifo.npa[rows, k*n:(k+1)*n] for k in xrange(4)]
+            dL_dpre_z, dL_dpre_i, dL_dpre_f, dL_dpre_o = \
+                [dL_dpre_zifo[rows, k*n:(k+1)*n] for k in xrange(4)]
+            dL_dc_rows, dL_dh_rows = dL_dc.npa[rows], dL_dh.npa[rows]
+            tanh_c_rows = tanh_c.npa[rows]
+            nrows = tanh_c_rows.shape[0]
+            dc_rows, dh_rows, temp_rows = dc[:nrows], dh[:nrows], temp[:nrows]
+            if mask is not None:
+                mask_rows = mask.npa[rows]
+                np.multiply(dL_dc_rows, mask_rows, out=dc_rows)
+                np.multiply(dL_dh_rows, mask_rows, out=dh_rows)
+                if dL_dprev_c is not None:
+                    np.subtract(dL_dc_rows, dc_rows, out=temp_rows)
+                    dL_dprev_c.npa[rows] += temp_rows
+                if dL_dprev_h is not None:
+                    np.subtract(dL_dh_rows, dh_rows, out=temp_rows)
+                    dL_dprev_h.npa[rows] += temp_rows
+            else:
+                np.copyto(dc_rows, dL_dc_rows)
+                np.copyto(dh_rows, dL_dh_rows)
+            _tanh_derivative(tanh_c_rows, temp_rows)
+            temp_rows *= o
+            temp_rows *= dh_rows
+            dc_rows += temp_rows
+
+            _sigmoid_derivative(o, dL_dpre_o)
+            dL_dpre_o *= tanh_c_rows
+            dL_dpre_o *= dh_rows
+            _sigmoid_derivative(f, dL_dpre_f)
+            dL_dpre_f *= prev_c.npa[rows]
+            dL_dpre_f *= dc_rows
+            _sigmoid_derivative(i, dL_dpre_i)
+            dL_dpre_i *= z
+            dL_dpre_i *= dc_rows
+            _tanh_derivative(z, dL_dpre_z)
+            dL_dpre_z *= i
+            dL_dpre_z *= dc_rows
+            if grad_clipping:
+                np.clip(dL_dpre_zifo[rows], -grad_clipping, grad_clipping, out=dL_dpre_zifo[rows])
+            if dL_dprev_c is not None:
+                np.multiply(f, dc_rows, out=temp_rows)
+                dL_dprev_c.npa[rows] += temp_rows
+
+    @_deferred('relu_matrix', 'derivative_matrix')
     def relu(self, context, relu_matrix, derivative_matrix=None):
-        relu_matrix.npa = np.maximum(self.npa, 0.0)
         if derivative_matrix:
-            derivative_matrix.npa = (self.npa > 0).astype(np.float32)
+            np.greater(self.npa, 0.0, out=derivative_matrix.npa)
+        np.maximum(self.npa, 0.0, out=relu_matrix.npa)
 
-    def softmax(self, context, softmax_matrix):
-        maximums = np.max(self.npa, axis=1, keepdims=True)
-        softmax_matrix.npa = self.npa - maximums
-        np.exp(softmax_matrix.npa, softmax_matrix.npa)
-        z = np.sum(softmax_matrix.npa, axis=1, keepdims=True)
-        softmax_matrix.npa /= z
+    @_deferred('self')
+    def add_tanh_derivative(self, context, tanh_matrix, deriv_matrix):
+        """
+        self += deriv_matrix .* (1 - tanh_matrix .* tanh_matrix)
+        """
+        temp = _get_temp_npa(self.npa.shape)[0]
+        _tanh_derivative(tanh_matrix.npa, temp)
+        temp *= deriv_matrix.npa
+        self.npa += temp
+
+    @_deferred('self')
+    def add_sigmoid_derivative(self, context, sigmoid_matrix, deriv_matrix):
+        """
+        self += deriv_matrix .* sigmoid_matrix .* (1 - sigmoid_matrix)
+        """
+        temp = _get_temp_npa(self.npa.shape)[0]
+        _sigmoid_derivative(sigmoid_matrix.npa, temp)
+        temp *= deriv_matrix.npa
+        self.npa += temp
+
+    @_deferred('self')
+    def add_relu_derivative(self, context, relu_matrix, deriv_matrix):
+        """
+        self += deriv_matrix .* (relu_matrix > 0)
+        """
+        temp = _get_temp_npa(self.npa.shape)[0]
+        np.greater(relu_matrix.npa, 0.0, out=temp)
+        temp *= deriv_matrix.npa
+        self.npa += temp
+
+    @_deferred('self')
+    def assign_tanh_sigm_derivative(self, context, tanh_sigm_matrix, axis=0):
+        """
+        Computes derivative of ``tanh_sigm`` from its output ``tanh_sigm_matrix``.
+        """
+        y, der = tanh_sigm_matrix.npa, self.npa
+        if axis == 0:
+            n = y.shape[0] // 4
+            _tanh_derivative(y[:n], der[:n])
+            _sigmoid_derivative(y[n:], der[n:])
+        elif axis == 1:
+            n = y.shape[1] // 4
+            _tanh_derivative(y[:, :n], der[:, :n])
+            _sigmoid_derivative(y[:, n:], der[:, n:])
+        else:
+            raise ValueError('TODO')
 
+    @_deferred('softmax_matrix')
+    def softmax(self, context, softmax_matrix):
+        out = softmax_matrix.npa
+        z = _get_temp_npa((out.shape[0], 1))[0]
+        np.max(self.npa, axis=1, out=z, keepdims=True)
+        np.subtract(self.npa, z, out=out)
+        np.exp(out, out=out)
+        np.sum(out, axis=1, out=z, keepdims=True)
+        out /= z
+
+    @_deferred('self')
     def add_softmax_derivative(self, context, softmax_matrix, deriv_matrix):
-        grad_x = softmax_matrix.npa * deriv_matrix.npa
-        grad_x -= softmax_matrix.npa * grad_x.sum(axis=1, keepdims=True)
+        s = softmax_matrix.npa
+        grad_x, z = _get_temp_npa(s.shape, (s.shape[0], 1))
+        np.multiply(s, deriv_matrix.npa, out=grad_x)
         self.npa += grad_x
+        np.sum(grad_x, axis=1, out=z, keepdims=True)
+        np.multiply(s, z, out=grad_x)
+        self.npa -= grad_x
 
+    @_deferred('self')
     def assign_softmax_ce_derivative(self, context, probs, target_classes):
-        self.npa = probs.npa / probs.npa.shape[0]
-        self.npa[range(probs.nrows), target_classes.npa.flatten()] -= 1.0 / probs.npa.shape[0]
+        n = probs.npa.shape[0]
+        np.multiply(probs.npa, 1.0 / n, out=self.npa)
+        self.npa[np.arange(n), _indices(target_classes)] -= 1.0 / n
 
+    @_deferred('self')
     def add_softmax_ce_derivative(self, context, probs, target_classes):
-        temp = probs.npa / probs.npa.shape[0]
-        temp[range(probs.nrows), target_classes.npa.flatten()] -= 1.0 / probs.npa.shape[0]
+        n = probs.npa.shape[0]
+        temp = _get_temp_npa(probs.npa.shape)[0]
+        np.multiply(probs.npa, 1.0 / n, out=temp)
         self.npa += temp
+        self.npa[np.arange(n), _indices(target_classes)] -= 1.0 / n
 
+    @_deferred('losses', 'derivative')
+    def softmax_ce(self, context, target_classes, losses=None, derivative=None, beta=0.0):
+        """
+        Fused softmax cross entropy of the logits stored in ``self``:
+        losses = log(sum(exp(self), axis=1)) - self[range(n), target_classes]
+        derivative = beta * derivative + (softmax(self) - one_hot(target_classes)) / n
+        Probabilities are never stored. ``derivative`` can be ``self``.
+        """
+        x = self.npa
+        n = x.shape[0]
+        rows = np.arange(n)
+        t = _indices(target_classes)
+        target_logits = x[rows, t]
+        z, s = _get_temp_npa((n, 1), (n, 1))
+        in_place = derivative and beta == 0.0 and np.may_share_memory(derivative.npa, x)
+        if in_place:
+            e = x
+        else:
+            e = _get_temp_npa((n, 1), (n, 1), x.shape)[2]
+        np.max(x, axis=1, out=z, keepdims=True)
+        np.subtract(x, z, out=e)
+        np.exp(e, out=e)
+        np.sum(e, axis=1, out=s, keepdims=True)
+        if losses:
+            np.log(s, out=losses.npa)
+            losses.npa += z
+            losses.npa[:, 0] -= target_logits
+        if derivative:
+            s *= n
+            e /= s
+            e[rows, t] -= 1.0 / n
+            if not in_place:
+                if beta == 0.0:
+                    np.copyto(derivative.npa, e)
+                else:
+                    derivative.npa *= beta
+                    derivative.npa += e
+
+    @_deferred('self', 'out')
     def scale(self, context, alpha, out=None):
         if out:
-            out.npa = (self.npa * alpha)
+            np.multiply(self.npa, alpha, out=out.npa)
         else:
             self.npa *= alpha
 
+    @_deferred('self')
     def assign_scaled_addition(self, context, alpha, a, b):
         """
         self = alpha * (a + b)
         """
-        self.npa = alpha * (a.npa + b.npa)
+        np.add(a.npa, b.npa, out=self.npa)
+        self.npa *= alpha
 
     def assign_add(self, context, a, b):
         self.assign_scaled_addition(context, 1.0, a, b)
 
+    @_deferred('self')
     def assign_scaled_subtraction(self, context, alpha, a, b):
         """
         self = alpha * (a - b)
         """
-        self.npa = alpha * (a.npa - b.npa)
+        np.subtract(a.npa, b.npa, out=self.npa)
+        self.npa *= alpha
 
+    @_deferred('self')
     def add_scaled_subtraction(self, context, alpha, a, b):
-        self.npa += alpha * (a.npa - b.npa)
+        temp = _get_temp_npa(self.npa.shape)[0]
+        np.subtract(a.npa, b.npa, out=temp)
+        temp *= alpha
+        self.npa += temp
 
     def assign_sub(self, context, a, b):
         self.assign_scaled_addition(context, 1.0, a, b)
 
+    @_deferred('self')
     def add_scaled(self, context, alpha, a):
         """
         self += alpha * a
         """
 
         if isinstance(a, CpuMatrix):
-            self.npa += alpha * a.npa
+            temp = _get_temp_npa(a.npa.shape)[0]
+            np.multiply(a.npa, alpha, out=temp)
+            self.npa += temp
+        elif isinstance(a, quagga.matrix.SparseMatrix) and a.compact:
+            _add_coalesced_slices(self.npa, a.coalesced_rows, alpha)
+            _add_coalesced_slices(self.npa.T, a.coalesced_columns, alpha)
         elif isinstance(a, quagga.matrix.SparseMatrix):
+            # all contributions are coalesced into one update of the rows
+            # and one update of the columns
+            indices, values = [], []
             for column_indxs, v in a.columns.iteritems():
                 for dense_matrix in v:
-                    self.add_scaled_columns_slice(context, column_indxs, alpha, dense_matrix)
+                    indices.append(_indices(column_indxs))
+                    values.append(dense_matrix.npa.T)
+            _scatter_add(self.npa.T, indices, values, alpha)
+            indices, values = [], []
             for row_indxs, v in a.rows.iteritems():
                 for dense_matrix in v:
-                    self.add_scaled_rows_slice(context, row_indxs, alpha, dense_matrix)
+                    indices.append(_indices(row_indxs))
+                    values.append(dense_matrix.npa)
             for rows_indxs, v in a.rows_batch.iteritems():
                 for dense_matrices in v:
-                    self.add_scaled_rows_batch_slice(context, rows_indxs, alpha, dense_matrices)
+                    indices.extend(rows_indxs.npa.T)
+                    values.extend(m.npa for m in dense_matrices)
+            _scatter_add(self.npa, indices, values, alpha)
         else:
             raise ValueError('TODO')
 
@@ -556,10 +1069,12 @@ class CpuMatrix(object):
     def sub(self, context, a):
         self.add_scaled(context, -1.0, a)
 
+    @_deferred('self')
     def assign_sum(self, context, matrices):
-        self.npa = 0.0
+        self.npa.fill(0.0)
         self.add_sum(context, matrices)
 
+    @_deferred('self')
     def add_sum(self, context, matrices):
         for m in matrices:
             self.npa += m.npa
@@ -570,74 +1085,270 @@ class CpuMatrix(object):
         """
         self.add_hprod(context, self, a, alpha=0.0)
 
+    @_deferred('self')
     def add_hprod(self, context, a, b, c=None, alpha=1.0):
         """
         self = a .* b + alpha * self        or
         self = a .* b .* c + alpha * self
         """
-        if not c:
-            self.npa = a.npa * b.npa + alpha * self.npa
-        else:
-            self.npa = a.npa * b.npa * c.npa + alpha * self.npa
+        if alpha == 0.0:
+            self.assign_hprod(context, a, b, c)
+            return
+        temp = _get_temp_npa(self.npa.shape)[0]
+        np.multiply(a.npa, b.npa, out=temp)
+        if c:
+            temp *= c.npa
+        if alpha != 1.0:
+            self.npa *= alpha
+        self.npa += temp
 
+    @_deferred('self')
     def add_scaled_hprod(self, context, a, b, alpha, beta):
         """
         self = alpha * self + beta * a .* b
         """
-        self.npa = alpha * self.npa + beta * a.npa * b.npa
+        temp = _get_temp_npa(self.npa.shape)[0]
+        np.multiply(a.npa, b.npa, out=temp)
+        temp *= beta
+        self.npa *= alpha
+        self.npa += temp
 
+    @_deferred('self')
     def assign_hprod(self, context, a, b, c=None):
         """
         self = a .* b
         self = a .* b .* c  or
         """
         if not c:
-            np.multiply(a.npa, b.npa, self.npa)
+            np.multiply(a.npa, b.npa, out=self.npa)
         else:
-            self.npa = a.npa * b.npa * c.npa
-
+            # `self` is often one of the factors (e.g. dL/dpre_o .*= ...),
+            # so it must be consumed by the first multiplication
+            a, b, c = a.npa, b.npa, c.npa
+            if np.may_share_memory(self.npa, c):
+                a, c = c, a
+            np.multiply(a, b, out=self.npa)
+            self.npa *= c
+
+    @_deferred('self')
     def assign_sum_hprod(self, context, a, b, c, d, e=None, f=None, g=None, h=None, i=None, j=None, k=None):
         """
         self = a .* b + c .* d                                   or
         self = a .* b .* c + d .* e                              or
         self = a .* b .* c + d .* e + f .* g + h .* i + j .* k
         """
-        np.multiply(a.npa, b.npa, self.npa)
+        temp = _get_temp_npa(self.npa.shape)[0]
+        np.multiply(a.npa, b.npa, out=self.npa)
         if k is not None:
             self.npa *= c.npa
-            self.npa += d.npa * e.npa
-            self.npa += f.npa * g.npa
-            self.npa += h.npa * i.npa
-            self.npa += j.npa * k.npa
+            for x, y in [(d, e), (f, g), (h, i), (j, k)]:
+                np.multiply(x.npa, y.npa, out=temp)
+                self.npa += temp
         elif e is not None:
             self.npa *= c.npa
-            self.npa += d.npa * e.npa
+            np.multiply(d.npa, e.npa, out=temp)
+            self.npa += temp
         else:
-            self.npa += c.npa * d.npa
+            np.multiply(c.npa, d.npa, out=temp)
+            self.npa += temp
 
+    @_deferred('self')
     def assign_hprod_sum(self, context, a, b):
         """
         self = sum(a .* b, axis=1)
         """
-        np.sum(a.npa * b.npa, axis=1, out=self.npa, keepdims=True)
+        temp = _get_temp_npa(a.npa.shape)[0]
+        np.multiply(a.npa, b.npa, out=temp)
+        np.sum(temp, axis=1, out=self.npa, keepdims=True)
 
+    @_deferred('self')
     def add_scaled_div_sqrt(self, context, alpha, a, b, epsilon):
         """
         self += alpha * a ./ sqrt(b + epsilon)
         """
-        self.npa += alpha * a.npa / np.sqrt(b.npa + epsilon)
+        temp = _get_temp_npa(self.npa.shape)[0]
+        np.add(b.npa, epsilon, out=temp)
+        np.sqrt(temp, out=temp)
+        np.divide(a.npa, temp, out=temp)
+        temp *= alpha
+        self.npa += temp
 
     def assign_dot(self, context, a, b, matrix_operation_a='N', matrix_operation_b='N'):
         self.add_dot(context, a, b, matrix_operation_a, matrix_operation_b, beta=0.0)
 
+    @_deferred('self')
     def add_dot(self, context, a, b, matrix_operation_a='N', matrix_operation_b='N', alpha=1.0, beta=1.0):
         """
         self = alpha * op(a) * b + beta * self
         """
-        self.npa *= beta
         a = a.npa if matrix_operation_a == 'N' else a.npa.T
         b = b.npa if matrix_operation_b == 'N' else b.npa.T
-        self.npa += alpha * np.dot(a, b)
+        if beta == 0.0 and self.npa.flags.c_contiguous:
+            # np.dot can write straight into C-contiguous output only
+            np.dot(a, b, out=self.npa)
+            if alpha != 1.0:
+                self.npa *= alpha
+            return
+        temp = _get_temp_npa(self.npa.shape)[0]
+        np.dot(a, b, out=temp)
+        if alpha != 1.0:
+            temp *= alpha
+        if beta != 1.0:
+            self.npa *= beta
+        self.npa += temp
 
+    @_deferred('out')
     def argmax(self, context, out, axis=1):
-        out.npa[:, 0] = np.argmax(self.npa, axis=axis)
\ No newline at end of file
+        out.npa[:, 0] = np.argmax(self.npa, axis=axis)
+
+    @_deferred('values', 'indices')
+    def top_k(self, context, values, indices):
+        """
+        values, indices = k largest elements of every row and their columns
+        in decreasing order, k = values.ncols
+        """
+        a = self.npa
+        k = values.npa.shape[1]
+        rows = np.arange(a.shape[0])[:, np.newaxis]
+        idx = np.argpartition(a, a.shape[1] - k, axis=1)[:, a.shape[1] - k:]
+        idx = idx[rows, np.argsort(-a[rows, idx], axis=1, kind='mergesort')]
+        indices.npa = idx
+        values.npa = a[rows, idx]
+
+    @_deferred('out')
+    def sample(self, context, uniforms, out):
+        """
+        out[i] = min(j : uniforms[i] < sum(self[i, :j+1])), that is a column
+        sampled from the distribution stored in the i-th row
+        """
+        c = np.cumsum(self.npa, axis=1)
+        out.npa[:, 0] = np.minimum(np.sum(c <= uniforms.npa, axis=1), c.shape[1] - 1)
+
+
+def _indices(indxs):
+    """
+    Returns 1-d view of the indices matrix without copying it.
+    """
+    npa = indxs.npa
+    if npa.shape[1] == 1:
+        return npa[:, 0]
+    if npa.shape[0] == 1:
+        return npa[0]
+    return npa.ravel()
+
+
+def _scatter_add(out, indices, values, alpha):
+    """
+    out[indices[k][i]] += alpha * values[k][i] for all k and i
+
+    Contributions are coalesced first, so duplicate indices are accumulated
+    correctly and every touched row of ``out`` is updated only once.
+    """
+    if not len(indices):
+        return
+    coalesced_slices = CoalescedSlices()
+    coalesced_slices.add(indices, values)
+    _add_coalesced_slices(out, coalesced_slices, alpha)
+
+
+def _add_coalesced_slices(out, coalesced_slices, alpha):
+    if coalesced_slices.indices is not None:
+        out[coalesced_slices.indices] += getattr(alpha, 'value', alpha) * coalesced_slices.values
+
+
+def _reduce_along_axis(function, a, axis, out, add=False):
+    if axis not in (0, 1):
+        raise ValueError('Invalid axis!')
+    if add:
+        temp = _get_temp_npa(out.shape)[0]
+        function(a, axis=axis, keepdims=True, out=temp)
+        out += temp
+    else:
+        function(a, axis=axis, keepdims=True, out=out)
+
+
+def _stacked_npa(matrices):
+    """
+    Returns 3-d view whose k-th element along the first axis is
+    ``matrices[k]`` when the matrices are equally spaced views of one
+    buffer (e.g. row blocks of a sequence buffer), otherwise returns None.
+    """
+    arrays = [m.npa for m in matrices]
+    first = arrays[0]
+    if len(arrays) == 1:
+        return first[np.newaxis]
+    root = _root_npa(first)
+    addresses = []
+    for array in arrays:
+        if array.shape != first.shape or array.strides != first.strides or _root_npa(array) is not root:
+            return None
+        addresses.append(array.__array_interface__['data'][0])
+    step = addresses[1] - addresses[0]
+    if step == 0 or any(b - a != step for a, b in izip(addresses, addresses[1:])):
+        return None
+    return as_strided(first, (len(arrays),) + first.shape, (step,) + first.strides)
+
+
+def _root_npa(npa):
+    while isinstance(npa.base, np.ndarray):
+        npa = npa.base
+    return npa
+
+
+def _expand(a, axis):
+    return a[np.newaxis] if axis == 0 else a[:, np.newaxis]
+
+
+def _repeat_view(out, shape, repeats, axis):
+    """
+    Returns 3-d view of ``out`` in which the k-th element along the new axis
+    is the k-th ``shape`` block of ``np.tile`` result along ``axis``.
+    """
+    nrows, ncols = shape
+    s0, s1 = out.strides
+    if axis == 0:
+        return as_strided(out, (int(repeats), nrows, ncols), (nrows * s0, s0, s1))
+    return as_strided(out, (nrows, int(repeats), ncols), (s0, ncols * s1, s1))
+
+
+def _sigmoid(x, out):
+    np.negative(x, out=out)
+    np.exp(out, out=out)
+    out += 1.0
+    np.reciprocal(out, out=out)
+
+
+def _sigmoid_derivative(sigmoid, out):
+    np.subtract(1.0, sigmoid, out=out)
+    out *= sigmoid
+
+
+def _tanh_derivative(tanh, out):
+    np.multiply(tanh, tanh, out=out)
+    np.subtract(1.0, out, out=out)
+
+
+def _get_temp_npa(*shapes):
+    """
+    Returns float32 arrays with the requested ``shapes`` that are carved out
+    of a scratch buffer. The buffer belongs to the calling thread and only
+    grows, so in the steady state intermediate results never allocate.
+    Returned arrays are valid until the next call from the same thread.
+    """
+    sizes = [int(nrows) * int(ncols) for nrows, ncols in shapes]
+    buffer = getattr(__temp, 'buffer', None)
+    if buffer is None or buffer.size < sum(sizes):
+        buffer = np.empty(sum(sizes), np.float32)
+        __temp.buffer = buffer
+    arrays = []
+    k = 0
+    for size, shape in izip(sizes, shapes):
+        arrays.append(buffer[k:k+size].reshape(shape))
+        k += size
+    return arrays
+
+
+__temp = threading.local()
+# number of elements in a block of zifo rows processed by the fused
+# lstm cell operations at once, 16K floats fit into L1/L2 caches
+_CELL_BLOCK_NELEMS = 16384
@@ -418,6 +418,15 @@ class GpuMatrix(object):
         else:
             gpu_matrix_kernels.slice_rows_int(context.cuda_stream, self.nrows, row_indxs.data, self.data, out.nrows, out.ncols, out.data)
 
+    def assign_rows_slice(self, context, row_indxs, a):
+        """
+        self[row_indxs] = a
+        """
+        GpuMatrix.wait_matrices(context, self, row_indxs, a)
+        self.last_modif_context = context
+        context.activate()
+        gpu_matrix_kernels.assign_rows_slice(context.cuda_stream, a.nrows, a.ncols, a.data, row_indxs.data, self.nrows, self.data)
+
     def add_scaled_rows_slice(self, context, row_indxs, alpha, a):
         """
         self[row_indxs] += alpha * a
@@ -681,6 +690,19 @@ class GpuMatrix(object):
         cudart.cuda_memcpy_async(device_pointer, matrices, n * elem_size, 'default', context.cuda_stream)
         gpu_matrix_kernels.sequentially_tile(context.cuda_stream, a.nelems, a.data, device_pointer, n)
 
+    @staticmethod
+    def add_scaled_sequentially_tile(context, alpha, a, matrices):
+        """
+        for k in range(K):
+            matrices[k] += alpha * a
+        """
+        for matrix in matrices:
+            matrix.add_scaled(context, alpha, a)
+
+    @staticmethod
+    def add_sequentially_tile(context, a, matrices):
+        GpuMatrix.add_scaled_sequentially_tile(context, ct.c_float(1.0), a, matrices)
+
     def tile(self, context, axis, a):
         GpuMatrix.wait_matrices(context, a)
         self.last_modif_context = context
@@ -720,6 +742,63 @@ class GpuMatrix(object):
         else:
             raise ValueError('TODO')
 
+    def assign_sum_along_axis(self, context, a, axis):
+        """
+        self = sum(a, axis)
+        """
+        self._reduce_along_axis(context, a, axis, 'sum', ct.c_float(1.0), ct.c_float(0.0))
+
+    def add_sum_along_axis(self, context, a, axis):
+        """
+        self += sum(a, axis)
+        """
+        self._reduce_along_axis(context, a, axis, 'sum', ct.c_float(1.0), ct.c_float(1.0))
+
+    def assign_mean_along_axis(self, context, a, axis):
+        """
+        self = mean(a, axis)
+        """
+        alpha = ct.c_float(1.0 / int(a.nrows if axis == 0 else a.ncols))
+        self._reduce_along_axis(context, a, axis, 'sum', alpha, ct.c_float(0.0))
+
+    def add_mean_along_axis(self, context, a, axis):
+        """
+        self += mean(a, axis)
+        """
+        alpha = ct.c_float(1.0 / int(a.nrows if axis == 0 else a.ncols))
+        self._reduce_along_axis(context, a, axis, 'sum', alpha, ct.c_float(1.0))
+
+    def assign_max_along_axis(self, context, a, axis):
+        """
+        self = max(a, axis)
+        """
+        self._reduce_along_axis(context, a, axis, 'max', None, ct.c_float(0.0))
+
+    def add_max_along_axis(self, context, a, axis):
+        """
+        self += max(a, axis)
+        """
+        self._reduce_along_axis(context, a, axis, 'max', None, ct.c_float(1.0))
+
+    def _reduce_along_axis(self, context, a, axis, reduction, alpha, beta):
+        if axis == 0:
+            if self.nrows != 1 or self.ncols != a.ncols:
+                raise ValueError('Invalid shape! Matrix must have one row and '
+                                 'the same number of columns as `a`!')
+        elif axis == 1:
+            if self.ncols != 1 or self.nrows != a.nrows:
+                raise ValueError('Invalid shape! Matrix must have one column and '
+                                 'the same number of rows as `a`!')
+        else:
+            raise ValueError('Invalid axis!')
+        GpuMatrix.wait_matrices(context, a)
+        self.last_modif_context = context
+        context.activate()
+        if reduction == 'sum':
+            gpu_matrix_kernels.sum_along_axis(context.cuda_stream, a.nrows, a.ncols, axis, alpha, a.data, beta, self.data)
+        else:
+            gpu_matrix_kernels.max_along_axis(context.cuda_stream, a.nrows, a.ncols, axis, a.data, beta, self.data)
+
     def add_repeat_derivative(self, context, a, repeats, axis):
         GpuMatrix.wait_matrices(context, a)
         self.last_modif_context = context
@@ -882,6 +961,44 @@ class GpuMatrix(object):
         else:
             nonlinearities.relu(context.cuda_stream, self.nelems, self.data, relu_matrix.data)
 
+    def add_tanh_derivative(self, context, tanh_matrix, deriv_matrix):
+        """
+        self += deriv_matrix .* (1 - tanh_matrix .* tanh_matrix)
+        """
+        GpuMatrix.wait_matrices(context, self, tanh_matrix, deriv_matrix)
+        self.last_modif_context = context
+        context.activate()
+        nonlinearities.add_tanh_derivative(context.cuda_stream, self.nelems, tanh_matrix.data, deriv_matrix.data, self.data)
+
+    def add_sigmoid_derivative(self, context, sigmoid_matrix, deriv_matrix):
+        """
+        self += deriv_matrix .* sigmoid_matrix .* (1 - sigmoid_matrix)
+        """
+        GpuMatrix.wait_matrices(context, self, sigmoid_matrix, deriv_matrix)
+        self.last_modif_context = context
+        context.activate()
+        nonlinearities.add_sigmoid_derivative(context.cuda_stream, self.nelems, sigmoid_matrix.data, deriv_matrix.data, self.data)
+
+    def add_relu_derivative(self, context, relu_matrix, deriv_matrix):
+        """
+        self += deriv_matrix .* (relu_matrix > 0)
+        """
+        GpuMatrix.wait_matrices(context, self, relu_matrix, deriv_matrix)
+        self.last_modif_context = context
+        context.activate()
+        nonlinearities.add_relu_derivative(context.cuda_stream, self.nelems, relu_matrix.data, deriv_matrix.data, self.data)
+
+    def assign_tanh_sigm_derivative(self, context, tanh_sigm_matrix, axis=0):
+        """
+        Computes derivative of ``tanh_sigm`` from its output ``tanh_sigm_matrix``.
+        """
+        GpuMatrix.wait_matrices(context, tanh_sigm_matrix)
+        self.last_modif_context = context
+        context.activate()
+        if axis not in {0, 1}:
+            raise ValueError('TODO!')
+        nonlinearities.tanh_sigm_derivative(context.cuda_stream, axis, self.nrows, self.ncols, tanh_sigm_matrix.data, self.data)
+
     def softmax(self, context, softmax_matrix):
         GpuMatrix.wait_matrices(context, self)
         softmax_matrix.last_modif_context = context
@@ -931,6 +1048,24 @@ class GpuMatrix(object):
         context.activate()
         gpu_matrix_kernels.add_softmax_ce_derivative(context.cuda_stream, probs.nrows, probs.ncols, probs.data, target_classes.data, self.data)
 
+    def softmax_ce(self, context, target_classes, losses=None, derivative=None, beta=0.0):
+        """
+        Fused softmax cross entropy of the logits stored in ``self``:
+        losses = log(sum(exp(self), axis=1)) - self[range(n), target_classes]
+        derivative = beta * derivative + (softmax(self) - one_hot(target_classes)) / n
+        Probabilities are never stored. ``derivative`` can be ``self``.
+        """
+        GpuMatrix.wait_matrices(context, self, target_classes)
+        if losses:
+            losses.last_modif_context = context
+        if derivative:
+            GpuMatrix.wait_matrices(context, derivative)
+            derivative.last_modif_context = context
+        context.activate()
+        gpu_matrix_kernels.softmax_ce(context.cuda_stream, self.nrows, self.ncols, self.data, target_classes.data,
+                                      ct.c_float(beta), losses.data if losses else None,
+                                      derivative.data if derivative else None)
+
     def scale(self, context, alpha, out=None):
         GpuMatrix.wait_matrices(context, self)
         if out:
@@ -1168,6 +1303,27 @@ class GpuMatrix(object):
         else:
             raise NotImplementedError
 
+    def top_k(self, context, values, indices):
+        """
+        values, indices = k largest elements of every row and their columns
+        in decreasing order, k = values.ncols
+        """
+        GpuMatrix.wait_matrices(context, self)
+        values.last_modif_context = context
+        indices.last_modif_context = context
+        context.activate()
+        gpu_matrix_kernels.row_top_k(context.cuda_stream, self.nrows, self.ncols, self.data, values.ncols, values.data, indices.data)
+
+    def sample(self, context, uniforms, out):
+        """
+        out[i] = min(j : uniforms[i] < sum(self[i, :j+1])), that is a column
+        sampled from the distribution stored in the i-th row
+        """
+        GpuMatrix.wait_matrices(context, self, uniforms)
+        out.last_modif_context = context
+        context.activate()
+        gpu_matrix_kernels.sample_rows(context.cuda_stream, self.nrows, self.ncols, self.data, uniforms.data, out.data)
+
 
 def _get_temp_memory(context, N):
     global __temp_pointer
@@ -0,0 +1,164 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import threading
+import numpy as np
+
+
+class MemoryArena(object):
+    """
+    Allocator that carves arrays out of a few large aligned slabs instead of
+    allocating every matrix separately. While the arena is active (inside
+    ``with arena:`` statement) :meth:`quagga.matrix.CpuMatrix.empty` takes
+    memory from it.
+
+    :meth:`reset` rewinds the arena keeping its slabs, so that a graph that is
+    built after the reset reuses the memory of the previous one. Matrices
+    allocated before the reset must not be used after it.
+
+    Parameters
+    ----------
+    slab_nbytes : int
+        Size of a slab. Arrays that do not fit into a slab get a slab of
+        their own.
+    alignment : int
+        Alignment of every array in bytes.
+    zero_init : bool
+        If True, arrays are filled with zeros. Memory of fresh slabs is
+        zeroed by the operating system, so only reused memory is filled.
+    hugepage_alignment : bool
+        If True, slabs are aligned to and sized in multiples of 2MB, so
+        that the operating system can back them with huge pages.
+    """
+    HUGEPAGE_NBYTES = 2 ** 21
+    _active = threading.local()
+
+    def __init__(self, slab_nbytes=2 ** 26, alignment=64, zero_init=True, hugepage_alignment=False):
+        if alignment <= 0 or alignment & (alignment - 1):
+            raise ValueError('Alignment must be a power of two!')
+        self.slab_alignment = MemoryArena.HUGEPAGE_NBYTES if hugepage_alignment else alignment
+        self.slab_nbytes = _round_up(slab_nbytes, self.slab_alignment)
+        self.alignment = alignment
+        self.zero_init = zero_init
+        self._lock = threading.Lock()
+        self._slabs = []
+        # index of the slab that is used now, offset inside it and
+        # offset up to which the slab memory was used before the reset
+        self._k = -1
+        self._offset = 0
+        self._dirty_offsets = []
+        self.nallocations = 0
+        self.allocated_nbytes = 0
+
+    @classmethod
+    def current(cls):
+        """
+        Returns the arena that is active in the calling thread or None.
+        """
+        arenas = getattr(cls._active, 'arenas', None)
+        return arenas[-1] if arenas else None
+
+    def __enter__(self):
+        if not hasattr(MemoryArena._active, 'arenas'):
+            MemoryArena._active.arenas = []
+        MemoryArena._active.arenas.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        MemoryArena._active.arenas.pop()
+
+    def empty(self, shape, dtype):
+        """
+        Returns C-ordered array of the given ``shape`` and ``dtype`` that is
+        located in one of the arena's slabs.
+        """
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        with self._lock:
+            slab, offset = self._carve(nbytes)
+            if self.zero_init and offset < self._dirty_offsets[self._k]:
+                slab[offset:offset+nbytes].fill(0)
+            self.nallocations += 1
+            self.allocated_nbytes += nbytes
+        return slab[offset:offset+nbytes].view(dtype).reshape(shape)
+
+    def register_usage(self, connector):
+        """
+        Called by :meth:`quagga.connector.Connector.register_usage` while the
+        arena is active. Arenas that plan memory use it to build the usage
+        graph of connectors.
+        """
+        pass
+
+    def _carve(self, nbytes):
+        offset = _round_up(self._offset, self.alignment)
+        while self._k < 0 or offset + nbytes > len(self._slabs[self._k]):
+            self._k += 1
+            if self._k == len(self._slabs):
+                slab_nbytes = max(self.slab_nbytes, _round_up(nbytes, self.slab_alignment))
+                self._slabs.append(_aligned_zeros(slab_nbytes, self.slab_alignment))
+                self._dirty_offsets.append(0)
+            offset = 0
+        self._offset = offset + nbytes
+        return self._slabs[self._k], offset
+
+    def reset(self):
+        """
+        Rewinds the arena to the beginning of its first slab. Slabs are kept
+        for the subsequent allocations.
+        """
+        with self._lock:
+            if self._k >= 0:
+                self._dirty_offsets[self._k] = max(self._dirty_offsets[self._k], self._offset)
+            for k in xrange(self._k):
+                self._dirty_offsets[k] = len(self._slabs[k])
+            self._k = -1
+            self._offset = 0
+            self.nallocations = 0
+            self.allocated_nbytes = 0
+
+    def release(self):
+        """
+        Drops all slabs. Memory is freed as soon as no matrix refers to it.
+        """
+        with self._lock:
+            del self._slabs[:]
+            del self._dirty_offsets[:]
+            self._k = -1
+            self._offset = 0
+            self.nallocations = 0
+            self.allocated_nbytes = 0
+
+    @property
+    def stats(self):
+        """
+        Returns dict with the number of allocations, the number of slabs,
+        allocated bytes and bytes reserved by slabs.
+        """
+        with self._lock:
+            return {'nallocations': self.nallocations,
+                    'nslabs': len(self._slabs),
+                    'allocated_nbytes': self.allocated_nbytes,
+                    'reserved_nbytes': sum(len(slab) for slab in self._slabs)}
+
+
+def _round_up(n, alignment):
+    return (n + alignment - 1) // alignment * alignment
+
+
+def _aligned_zeros(nbytes, alignment):
+    buffer = np.zeros(nbytes + alignment, np.uint8)
+    offset = -buffer.ctypes.data % alignment
+    return buffer[offset:offset+nbytes]
@@ -13,6 +13,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ----------------------------------------------------------------------------
+import quagga
+import threading
+import numpy as np
+from itertools import izip
 from collections import defaultdict
 
 
@@ -23,11 +27,33 @@ class SparseMatrix(object):
     ``SparseMatrix`` instances can be added to other such instances or instances
     of :class:`quagga.matrix.CpuMatrix` or :class:`quagga.matrix.GpuMatrix`.
 
+    In the compact mode added slices are not stored, instead they are
+    accumulated into :class:`CoalescedSlices` of unique row and column indices
+    with one block of values each (``coalesced_rows`` and
+    ``coalesced_columns``). Slices are copied in the sparse matrix's context
+    as soon as they are added and merged once, when they are first read, so
+    updates of the dense matrices scale with the number of unique indices.
+    The compact mode is supported only for :class:`quagga.matrix.CpuMatrix`.
+
+    Parameters
+    ----------
+    device_id : int
+    compact : bool
     """
-    def __init__(self):
+    def __init__(self, device_id=None, compact=False):
         self.columns = defaultdict(list)
         self.rows = defaultdict(list)
         self.rows_batch = defaultdict(list)
+        self.compact = compact
+        if compact:
+            if quagga.processor_type != 'cpu':
+                raise ValueError('Compact mode is supported only for CpuMatrix!')
+            # quagga.context imports quagga.utils, which imports quagga.matrix
+            from quagga.context import Context
+            self.context = Context(device_id)
+            self.last_modif_context = None
+            self.coalesced_rows = CoalescedSlices()
+            self.coalesced_columns = CoalescedSlices()
 
     def add_columns_slice(self, column_indxs, dense_matrix):
         """
@@ -46,7 +72,10 @@ class SparseMatrix(object):
             or :class:`~quagga.matrix.GpuMatrix`
             Dense matrix.
         """
-        self.columns[column_indxs].append(dense_matrix)
+        if self.compact:
+            self._coalesce(column_indxs, [dense_matrix], 1, self.coalesced_columns)
+        else:
+            self.columns[column_indxs].append(dense_matrix)
 
     def add_rows_slice(self, row_indxs, dense_matrix):
         """
@@ -65,7 +94,10 @@ class SparseMatrix(object):
         :class:`~quagga.matrix.GpuMatrix`
             Dense matrix.
         """
-        self.rows[row_indxs].append(dense_matrix)
+        if self.compact:
+            self._coalesce(row_indxs, [dense_matrix], 0, self.coalesced_rows)
+        else:
+            self.rows[row_indxs].append(dense_matrix)
 
     def add_rows_batch_slice(self, rows_indxs, dense_matrices):
         """
@@ -79,7 +111,14 @@ class SparseMatrix(object):
         dense_matrices : list of dense matrices \
         (:class:`~quagga.matrix.CpuMatrix` or :class:`~quagga.matrix.GpuMatrix`)
         """
-        self.rows_batch[rows_indxs].append(dense_matrices)
+        if self.compact:
+            self._coalesce(rows_indxs, dense_matrices, 0, self.coalesced_rows)
+        else:
+            self.rows_batch[rows_indxs].append(dense_matrices)
+
+    def _coalesce(self, indxs, dense_matrices, axis, coalesced_slices):
+        quagga.matrix.CpuMatrix.coalesce_slices(self.context, indxs, dense_matrices, axis, coalesced_slices)
+        self.last_modif_context = self.context
 
     def add(self, sparse_matrix):
         """
@@ -89,6 +128,26 @@ class SparseMatrix(object):
         ----------
         sparse_matrix : :class:`~quagga.matrix.SparseMatrix`
         """
+        if sparse_matrix.compact:
+            if not self.compact:
+                raise ValueError('Compact sparse matrix can be added only to another compact sparse matrix!')
+            self.context.wait(sparse_matrix.context)
+            for attr_name in ['coalesced_rows', 'coalesced_columns']:
+                other = getattr(sparse_matrix, attr_name)
+                self.context.add_callback(getattr(self, attr_name).add_coalesced, other)
+            self.last_modif_context = self.context
+            return
+        if self.compact:
+            for column_indxs, v in sparse_matrix.columns.iteritems():
+                for dense_matrix in v:
+                    self.add_columns_slice(column_indxs, dense_matrix)
+            for row_indxs, v in sparse_matrix.rows.iteritems():
+                for dense_matrix in v:
+                    self.add_rows_slice(row_indxs, dense_matrix)
+            for rows_indxs, v in sparse_matrix.rows_batch.iteritems():
+                for dense_matrices in v:
+                    self.add_rows_batch_slice(rows_indxs, dense_matrices)
+            return
         for k, v in sparse_matrix.columns.iteritems():
             self.columns[k].extend(v)
         for k, v in sparse_matrix.rows.iteritems():
@@ -103,6 +162,10 @@ class SparseMatrix(object):
         self.columns.clear()
         self.rows.clear()
         self.rows_batch.clear()
+        if self.compact:
+            # pending merges and readers keep references to the old slices
+            self.coalesced_rows = CoalescedSlices()
+            self.coalesced_columns = CoalescedSlices()
 
     @property
     def last_modif_contexts(self):
@@ -115,6 +178,8 @@ class SparseMatrix(object):
         last_modif_contexts : list of :class:`~quagga.context.CpuContext` \
         or :class:`~quagga.context.GpuContext`
         """
+        if self.compact:
+            return [self.last_modif_context] if self.last_modif_context else []
         last_modif_contexts = []
         for column_indxs, v in self.columns.iteritems():
             last_modif_contexts.append(column_indxs.last_modif_context)
@@ -129,4 +194,66 @@ class SparseMatrix(object):
             for dense_matrices in v:
                 for dense_matrix in dense_matrices:
                     last_modif_contexts.append(dense_matrix.last_modif_context)
-        return last_modif_contexts
\ No newline at end of file
+        return last_modif_contexts
+
+
+class CoalescedSlices(object):
+    """
+    Unique ``indices`` (sorted 1-d array) of rows (or columns) and ``values``
+    2-d array whose k-th row is the sum of all added slices located at
+    ``indices[k]``. Column slices are stored transposed. Added slices are
+    buffered and merged with one sort when ``indices`` or ``values`` are
+    read, so adding many slices costs linear time.
+    """
+    def __init__(self):
+        self._indices = None
+        self._values = None
+        self._pending = []
+        self._lock = threading.Lock()
+
+    @property
+    def indices(self):
+        self._merge()
+        return self._indices
+
+    @property
+    def values(self):
+        self._merge()
+        return self._values
+
+    def add(self, indices, values):
+        """
+        Adds ``values[k][i]`` located at ``indices[k][i]`` for all k and i.
+        ``values`` are lists of 2-d arrays whose rows are slices. The slices
+        are copied, so the arrays can be reused after the call.
+        """
+        slices = [(e, v) for e, v in izip(indices, values) if len(e)]
+        if not slices:
+            return
+        indices = np.concatenate([e[0] for e in slices])
+        values = np.concatenate([e[1] for e in slices])
+        with self._lock:
+            self._pending.append((indices, values))
+
+    def add_coalesced(self, coalesced_slices):
+        if coalesced_slices.indices is not None:
+            with self._lock:
+                # merged arrays are replaced, never modified, by their owner
+                self._pending.append((coalesced_slices.indices, coalesced_slices.values))
+
+    def _merge(self):
+        with self._lock:
+            if not self._pending:
+                return
+            runs = self._pending
+            if self._indices is not None:
+                runs = [(self._indices, self._values)] + runs
+            indices = np.concatenate([e[0] for e in runs]) if len(runs) > 1 else runs[0][0]
+            values = np.concatenate([e[1] for e in runs]) if len(runs) > 1 else runs[0][1]
+            # duplicates are summed segment-wise after stable sorting
+            order = np.argsort(indices, kind='mergesort')
+            indices = indices[order]
+            starts = np.flatnonzero(np.concatenate(([True], indices[1:] != indices[:-1])))
+            self._indices = indices[starts]
+            self._values = np.add.reduceat(values[order], starts, axis=0)
+            self._pending = []
\ No newline at end of file
@@ -14,6 +14,7 @@
 # limitations under the License.
 # ----------------------------------------------------------------------------
 from quagga.matrix.ShapeElement import ShapeElement
+from quagga.matrix.MemoryArena import MemoryArena
 from quagga.matrix.SparseMatrix import SparseMatrix
 from quagga.matrix.CpuMatrix import CpuMatrix
 from quagga.matrix.GpuMatrix import GpuMatrix
@@ -0,0 +1,100 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import quagga
+import numpy as np
+from quagga.utils.List import List
+from quagga.matrix import Matrix
+from quagga.matrix import ShapeElement
+from quagga.connector import Connector
+
+
+class SequenceTensor(List):
+    """
+    Time-major sequence of connectors whose matrices are row blocks of one
+    contiguous ``(max_length * nrows, ncols)`` buffer, i.e. of a
+    ``(max_length, nrows, ncols)`` tensor. The tensor can be used wherever
+    :class:`List` of connectors is used, while sequence-wide operations of
+    :class:`~quagga.matrix.CpuMatrix` (e.g. ``batch_hstack`` or
+    ``assign_sequential_mean_pooling``) process all timesteps with one
+    vectorized call. Only :class:`~quagga.matrix.CpuMatrix` supports row
+    slicing, so with GPU every timestep has a matrix of its own.
+
+    Parameters
+    ----------
+    max_length : int
+        Number of preallocated timesteps
+    nrows : int or ShapeElement
+        Batch size, which must not exceed the initial one
+    ncols : int
+    dtype : str
+    device_id : int
+        Device on which the matrices are allocated
+    bu_device_id : int
+        Backward usage device of the connectors. If set, backward matrices
+        are row blocks of a buffer of their own as well
+    length : int or ShapeElement
+        Number of active timesteps, ``max_length`` by default
+    """
+    def __init__(self, max_length, nrows, ncols, dtype=None, device_id=None, bu_device_id=None, length=None):
+        self.nrows = nrows if isinstance(nrows, ShapeElement) else ShapeElement(nrows)
+        self.ncols = ncols
+        self.batch_size = int(self.nrows)
+        self.contiguous = quagga.processor_type == 'cpu'
+        if self.contiguous:
+            self.buffer = Matrix.empty(max_length * self.batch_size, ncols, dtype, device_id)
+            f_matrices = self._get_row_block_views(self.buffer, max_length)
+            if bu_device_id is not None:
+                self.backward_buffer = Matrix.empty_like(self.buffer, bu_device_id)
+                b_matrices = self._get_row_block_views(self.backward_buffer, max_length)
+            else:
+                b_matrices = [None] * max_length
+        else:
+            f_matrices = [Matrix.empty(self.nrows, ncols, dtype, device_id) for _ in xrange(max_length)]
+            b_matrices = [None] * max_length
+        elements = [Connector(f, bu_device_id, b) for f, b in zip(f_matrices, b_matrices)]
+        super(SequenceTensor, self).__init__(elements, max_length if length is None else length)
+
+    def _get_row_block_views(self, buffer, max_length):
+        views = []
+        for k in xrange(max_length):
+            view = buffer[k * self.batch_size:(k + 1) * self.batch_size]
+            view.nrows = self.nrows
+            views.append(view)
+        return views
+
+    def assign_npa(self, context, a):
+        """
+        Copies ``(length, nrows, ncols)`` array into the first ``length``
+        timesteps and sets the length and the batch size of the tensor.
+        """
+        if a.ndim != 3 or a.shape[2] != self.ncols:
+            raise ValueError('SequenceTensor requires (length, nrows, ncols) array!')
+        self.length = a.shape[0]
+        self.nrows[:] = a.shape[1]
+        if self.contiguous and a.shape[1] == self.batch_size:
+            # the active timesteps are one row range of the buffer
+            self.buffer[:a.shape[0] * a.shape[1]].assign_npa(context, a.reshape(-1, a.shape[2]))
+            for e in self:
+                e.last_modif_context = context
+        else:
+            for e, matrix in zip(self, a):
+                e.assign_npa(context, matrix)
+
+    def to_host(self, context=None):
+        """
+        Returns ``(length, nrows, ncols)`` array of the active timesteps.
+        """
+        return np.array([e.to_host(context) for e in self])
@@ -0,0 +1,134 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+from unittest import TestCase
+
+import numpy as np
+
+import quagga
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.connector import Connector
+from quagga.blocks import AdaptiveSoftmaxCeBlock
+
+
+def softmax(a):
+    e = np.exp(a - a.max(axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+
+class TestAdaptiveSoftmaxCeBlock(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 20
+
+    def get_data(self):
+        batch_size = self.rng.random_integers(64)
+        dim = self.rng.random_integers(100)
+        cutoffs = list(np.cumsum(self.rng.random_integers(100, size=self.rng.random_integers(4))))
+        x = self.rng.randn(batch_size, dim).astype(np.float32)
+        # frequent classes are more likely
+        true_labels = np.minimum(self.rng.geometric(3.0 / cutoffs[-1], size=(batch_size, 1)) - 1, cutoffs[-1] - 1)
+        true_labels = true_labels.astype(np.int32)
+        mask = (self.rng.rand(batch_size, 1) < 0.8).astype(np.float32)
+        head_W = 0.1 * self.rng.randn(dim, cutoffs[0] + len(cutoffs) - 1).astype(np.float32)
+        head_b = 0.1 * self.rng.randn(1, head_W.shape[1]).astype(np.float32)
+        tail_params = []
+        for start, stop in zip(cutoffs[:-1], cutoffs[1:]):
+            tail_dim = self.rng.random_integers(dim)
+            tail_params.append((0.1 * self.rng.randn(dim, tail_dim).astype(np.float32),
+                                0.1 * self.rng.randn(tail_dim, stop - start).astype(np.float32)))
+        return x, true_labels, mask, head_W, head_b, tail_params, cutoffs
+
+    def build_block(self, x, true_labels, mask, head_W, head_b, tail_params, cutoffs):
+        qx = Connector(Matrix.from_npa(x), 0)
+        qtrue_labels = Connector(Matrix.from_npa(true_labels))
+        qmask = Connector(Matrix.from_npa(mask))
+        qhead_W = Connector(Matrix.from_npa(head_W), 0)
+        qhead_b = Connector(Matrix.from_npa(head_b), 0)
+        qtail_params = [(Connector(Matrix.from_npa(P), 0), Connector(Matrix.from_npa(W), 0)) for P, W in tail_params]
+        block = AdaptiveSoftmaxCeBlock(qhead_W, qhead_b, qtail_params, qx, qtrue_labels, cutoffs, qmask)
+        for e in [qx, qtrue_labels, qmask, qhead_W, qhead_b] + sum(map(list, qtail_params), []):
+            e.fprop()
+        params = [qhead_W, qhead_b] + sum(map(list, qtail_params), [])
+        return block, qx, params
+
+    def test_grad(self):
+        """
+        compare gradients with numpy implementation
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            x, true_labels, mask, head_W, head_b, tail_params, cutoffs = self.get_data()
+            context = Context()
+            block, qx, params = self.build_block(x, true_labels, mask, head_W, head_b, tail_params, cutoffs)
+            block.fprop()
+            block.bprop()
+            block.calculate_loss(context)
+
+            # numpy model
+            n = x.shape[0]
+            t = true_labels[:, 0]
+            cluster = np.searchsorted(cutoffs, t, side='right')
+            head_t = np.where(cluster == 0, t, cutoffs[0] + cluster - 1)
+            head_probs = softmax(x.dot(head_W) + head_b)
+            losses = -np.log(head_probs[range(n), head_t])
+            dL_dhead = head_probs
+            dL_dhead[range(n), head_t] -= 1.0
+            dL_dhead *= mask / n
+            dL_dx = dL_dhead.dot(head_W.T)
+            grads = [x.T.dot(dL_dhead), dL_dhead.sum(axis=0, keepdims=True)]
+            for k, (P, W) in enumerate(tail_params):
+                rows = np.flatnonzero(cluster == k + 1)
+                h = x[rows].dot(P)
+                tail_probs = softmax(h.dot(W))
+                tail_t = t[rows] - cutoffs[k]
+                losses[rows] -= np.log(tail_probs[range(len(rows)), tail_t])
+                dL_dtail = tail_probs
+                dL_dtail[range(len(rows)), tail_t] -= 1.0
+                dL_dtail *= mask[rows] / n
+                dL_dh = dL_dtail.dot(W.T)
+                dL_dx[rows] += dL_dh.dot(P.T)
+                grads.extend([x[rows].T.dot(dL_dh), h.T.dot(dL_dtail)])
+
+            r.append(np.allclose(qx.backward_matrix.to_host(), dL_dx, atol=1e-5))
+            for param, grad in zip(params, grads):
+                r.append(np.allclose(param.backward_matrix.to_host(), grad, atol=1e-5))
+            r.append(np.allclose(block.loss, np.sum(losses * mask[:, 0]) / np.sum(mask), atol=1e-4))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_probs(self):
+        """
+        probabilities of all classes are normalized and agree with the loss
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            x, true_labels, mask, head_W, head_b, tail_params, cutoffs = self.get_data()
+            context = Context()
+            block, qx, params = self.build_block(x, true_labels, mask, head_W, head_b, tail_params, cutoffs)
+            block.set_testing_mode()
+            block.fprop()
+            block.calculate_loss(context)
+
+            probs = block.probs.to_host()
+            losses = -np.log(probs[range(x.shape[0]), true_labels[:, 0]])
+            r.append(np.allclose(probs.sum(axis=1), 1.0, atol=1e-5))
+            r.append(np.allclose(block.loss, np.sum(losses * mask[:, 0]) / np.sum(mask), atol=1e-4))
+
+        self.assertEqual(sum(r), len(r))
\ No newline at end of file
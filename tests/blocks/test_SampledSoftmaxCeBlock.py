@@ -0,0 +1,127 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+from unittest import TestCase
+
+import numpy as np
+
+import quagga
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.connector import Connector
+from quagga.blocks import SampledSoftmaxCeBlock
+
+
+class TestSampledSoftmaxCeBlock(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 20
+
+    def get_data(self):
+        batch_size = self.rng.random_integers(64)
+        dim = self.rng.random_integers(100)
+        num_classes = self.rng.random_integers(2, 1000)
+        x = self.rng.randn(batch_size, dim).astype(np.float32)
+        true_labels = self.rng.randint(num_classes, size=(batch_size, 1)).astype(np.int32)
+        mask = (self.rng.rand(batch_size, 1) < 0.8).astype(np.float32)
+        W = 0.1 * self.rng.randn(num_classes, dim).astype(np.float32)
+        b = 0.1 * self.rng.randn(num_classes, 1).astype(np.float32)
+        return x, true_labels, mask, W, b
+
+    def test_sampled_grad(self):
+        """
+        compare gradients with numpy implementation of sampled softmax
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            x, true_labels, mask, W, b = self.get_data()
+            num_samples = self.rng.random_integers(50)
+            counts = self.rng.random_integers(100, size=W.shape[0])
+            sampler = 'log_uniform' if i % 2 else counts
+            for dense in [True, False]:
+                context = Context()
+                qx = Connector(Matrix.from_npa(x), 0)
+                qtrue_labels = Connector(Matrix.from_npa(true_labels))
+                qmask = Connector(Matrix.from_npa(mask))
+                qW = Connector(Matrix.from_npa(W), 0)
+                qb = Connector(Matrix.from_npa(b), 0)
+                block = SampledSoftmaxCeBlock(qW, qb, qx, qtrue_labels, num_samples, sampler, qmask, dense)
+                for e in [qx, qtrue_labels, qmask, qW, qb]:
+                    e.fprop()
+                block.fprop()
+                block.bprop()
+                block.calculate_loss(context)
+                dL_dW, dL_db = qW.backward_matrix, qb.backward_matrix
+                if not dense:
+                    dL_dW, dL_db = Matrix.from_npa(np.zeros_like(W)), Matrix.from_npa(np.zeros_like(b))
+                    dL_dW.add(context, qW.backward_matrix)
+                    dL_db.add(context, qb.backward_matrix)
+
+                # numpy model
+                sampled_ids = block.sampled_ids.to_host()[:, 0]
+                probs = counts / float(counts.sum()) if i % 2 == 0 else \
+                    np.log((np.arange(W.shape[0]) + 2.0) / (np.arange(W.shape[0]) + 1.0)) / np.log(W.shape[0] + 1)
+                log_q = np.log(num_samples * probs)
+                ids = np.hstack([true_labels, np.tile(sampled_ids, (x.shape[0], 1))])
+                logits = np.sum(x[:, np.newaxis, :] * W[ids], axis=2) + b[ids, 0] - log_q[ids]
+                logits -= logits.max(axis=1, keepdims=True)
+                sampled_probs = np.exp(logits) / np.exp(logits).sum(axis=1, keepdims=True)
+                losses = -np.log(sampled_probs[:, 0])
+                dL_dlogits = sampled_probs
+                dL_dlogits[:, 0] -= 1.0
+                dL_dlogits *= mask / x.shape[0]
+                th_dL_dx = np.sum(dL_dlogits[:, :, np.newaxis] * W[ids], axis=1)
+                th_dL_dW = np.zeros_like(W)
+                th_dL_db = np.zeros_like(b)
+                np.add.at(th_dL_dW, ids, dL_dlogits[:, :, np.newaxis] * x[:, np.newaxis, :])
+                np.add.at(th_dL_db[:, 0], ids, dL_dlogits)
+
+                r.append(np.allclose(qx.backward_matrix.to_host(), th_dL_dx, atol=1e-5))
+                r.append(np.allclose(dL_dW.to_host(), th_dL_dW, atol=1e-5))
+                r.append(np.allclose(dL_db.to_host(), th_dL_db, atol=1e-5))
+                r.append(np.allclose(block.loss, np.sum(losses * mask[:, 0]) / np.sum(mask), atol=1e-4))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_full_softmax(self):
+        """
+        compare testing mode results with numpy softmax over all classes
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            x, true_labels, mask, W, b = self.get_data()
+            context = Context()
+            qx = Connector(Matrix.from_npa(x), 0)
+            qtrue_labels = Connector(Matrix.from_npa(true_labels))
+            qW = Connector(Matrix.from_npa(W), 0)
+            qb = Connector(Matrix.from_npa(b), 0)
+            block = SampledSoftmaxCeBlock(qW, qb, qx, qtrue_labels, 10)
+            block.set_testing_mode()
+            for e in [qx, qtrue_labels, qW, qb]:
+                e.fprop()
+            block.fprop()
+            block.calculate_loss(context)
+
+            logits = x.dot(W.T) + b.T
+            probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+            probs /= probs.sum(axis=1, keepdims=True)
+            loss = -np.mean(np.log(probs[range(x.shape[0]), true_labels[:, 0]]))
+            r.append(np.allclose(block.probs.to_host(), probs, atol=1e-6))
+            r.append(np.allclose(block.loss, loss, atol=1e-4))
+
+        self.assertEqual(sum(r), len(r))
\ No newline at end of file
@@ -0,0 +1,193 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+from itertools import izip
+from unittest import TestCase
+
+import numpy as np
+
+import quagga
+from quagga.utils import List
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.blocks import DotBlock
+from quagga.connector import Connector
+from quagga.blocks import SoftmaxCeBlock
+from quagga.blocks import SequencerBlock
+from quagga.blocks import SequentialDotSoftmaxCeBlock
+
+
+class TestSequentialDotSoftmaxCeBlock(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 10
+
+    def test_sequencer(self):
+        """
+        compare results with `DotBlock` and `SoftmaxCeBlock` that are
+        wrapped in `SequencerBlock`
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            max_input_sequence_len = self.rng.random_integers(50)
+            sequence_len = max_input_sequence_len if i == 0 else self.rng.random_integers(max_input_sequence_len)
+            batch_size = self.rng.random_integers(64)
+            input_dim, output_dim = self.rng.random_integers(200, size=2)
+            x = [self.rng.randn(batch_size, input_dim).astype(np.float32) for _ in xrange(max_input_sequence_len)]
+            true_labels = [self.rng.randint(output_dim, size=(batch_size, 1)).astype(np.int32) for _ in xrange(max_input_sequence_len)]
+            mask = (self.rng.rand(batch_size, max_input_sequence_len) < 0.8).astype(np.float32)
+            W = self.rng.randn(input_dim, output_dim).astype(np.float32)
+            b = self.rng.rand(1, output_dim).astype(np.float32)
+
+            for with_mask in [False, True]:
+                results = []
+                losses = []
+                for sequential in [False, True]:
+                    context = Context()
+                    qx = List([Connector(Matrix.from_npa(e), 0) for e in x], sequence_len)
+                    qtrue_labels = List([Connector(Matrix.from_npa(e)) for e in true_labels], qx.length)
+                    qW = Connector(Matrix.from_npa(W), 0)
+                    qb = Connector(Matrix.from_npa(b), 0)
+                    qmask = Matrix.from_npa(mask)
+                    qmask = List([Connector(qmask[:, k]) for k in xrange(max_input_sequence_len)], qx.length) if with_mask else None
+                    if sequential:
+                        block = SequentialDotSoftmaxCeBlock(qW, qb, qx, qtrue_labels, qmask)
+                        blocks = [block]
+                    else:
+                        dot_block = SequencerBlock(block_class=DotBlock,
+                                                   params=[qW, qb],
+                                                   sequences=[qx],
+                                                   output_names=['output'])
+                        sequences = [dot_block.output, qtrue_labels] + ([qmask] if with_mask else [])
+                        block = SequencerBlock(block_class=SoftmaxCeBlock,
+                                               params=[],
+                                               sequences=sequences)
+                        blocks = [dot_block, block]
+                    for e in [qx, qtrue_labels, qW, qb] + ([qmask] if with_mask else []):
+                        e.fprop()
+                    for each in blocks:
+                        each.fprop()
+                    for each in reversed(blocks):
+                        each.bprop()
+                    if sequential:
+                        probs = block.probs.to_host()
+                    else:
+                        probs = np.vstack([each.probs.to_host() for each in block.blocks[:sequence_len]])
+                    results.append([probs, qW.backward_matrix.to_host(), qb.backward_matrix.to_host()])
+                    results[-1].extend(e.backward_matrix.to_host() for e in qx)
+                    block.calculate_loss(context)
+                    losses.append(block.loss)
+
+                for result, sequential_result in izip(*results):
+                    r.append(np.allclose(result, sequential_result, atol=1e-5))
+                if not with_mask:
+                    r.append(np.allclose(np.mean(losses[0]), losses[1]))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_compact(self):
+        """
+        compare results with and without compaction of masked rows
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            max_input_sequence_len = self.rng.random_integers(50)
+            sequence_len = max_input_sequence_len if i == 0 else self.rng.random_integers(max_input_sequence_len)
+            batch_size = self.rng.random_integers(64)
+            input_dim, output_dim = self.rng.random_integers(200, size=2)
+            x = [self.rng.randn(batch_size, input_dim).astype(np.float32) for _ in xrange(max_input_sequence_len)]
+            true_labels = [self.rng.randint(output_dim, size=(batch_size, 1)).astype(np.int32) for _ in xrange(max_input_sequence_len)]
+            mask = (self.rng.rand(batch_size, max_input_sequence_len) < 0.5).astype(np.float32)
+            mask[0, 0] = 1.0
+            W = self.rng.randn(input_dim, output_dim).astype(np.float32)
+            b = self.rng.rand(1, output_dim).astype(np.float32)
+
+            results = []
+            losses = []
+            for compact in [False, True]:
+                context = Context()
+                qx = List([Connector(Matrix.from_npa(e), 0) for e in x], sequence_len)
+                qtrue_labels = List([Connector(Matrix.from_npa(e)) for e in true_labels], qx.length)
+                qW = Connector(Matrix.from_npa(W), 0)
+                qb = Connector(Matrix.from_npa(b), 0)
+                qmask = Matrix.from_npa(mask)
+                qmask = List([Connector(qmask[:, k]) for k in xrange(max_input_sequence_len)], qx.length)
+                block = SequentialDotSoftmaxCeBlock(qW, qb, qx, qtrue_labels, qmask, compact)
+                for e in [qx, qtrue_labels, qW, qb, qmask]:
+                    e.fprop()
+                block.fprop()
+                block.bprop()
+                probs = block.probs.to_host()
+                if not compact:
+                    probs = probs[mask[:, :sequence_len].T.flatten() != 0]
+                results.append([probs, qW.backward_matrix.to_host(), qb.backward_matrix.to_host()])
+                results[-1].extend(e.backward_matrix.to_host() for e in qx)
+                block.calculate_loss(context)
+                losses.append(block.loss)
+
+            for result, compact_result in izip(*results):
+                r.append(np.allclose(result, compact_result, atol=1e-5))
+            r.append(np.allclose(losses[0], losses[1]))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_output_probs(self):
+        """
+        compare results with and without stored probabilities
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            max_input_sequence_len = self.rng.random_integers(50)
+            sequence_len = max_input_sequence_len if i == 0 else self.rng.random_integers(max_input_sequence_len)
+            batch_size = self.rng.random_integers(64)
+            input_dim, output_dim = self.rng.random_integers(200, size=2)
+            x = [self.rng.randn(batch_size, input_dim).astype(np.float32) for _ in xrange(max_input_sequence_len)]
+            true_labels = [self.rng.randint(output_dim, size=(batch_size, 1)).astype(np.int32) for _ in xrange(max_input_sequence_len)]
+            mask = (self.rng.rand(batch_size, max_input_sequence_len) < 0.5).astype(np.float32)
+            mask[0, 0] = 1.0
+            # probabilities do not underflow, so the clipped log of `probs` is exact
+            W = 0.1 * self.rng.randn(input_dim, output_dim).astype(np.float32)
+            b = self.rng.rand(1, output_dim).astype(np.float32)
+
+            for with_mask, compact in [(False, False), (True, False), (True, True)]:
+                results = []
+                losses = []
+                for output_probs in [True, False]:
+                    context = Context()
+                    qx = List([Connector(Matrix.from_npa(e), 0) for e in x], sequence_len)
+                    qtrue_labels = List([Connector(Matrix.from_npa(e)) for e in true_labels], qx.length)
+                    qW = Connector(Matrix.from_npa(W), 0)
+                    qb = Connector(Matrix.from_npa(b), 0)
+                    qmask = Matrix.from_npa(mask)
+                    qmask = List([Connector(qmask[:, k]) for k in xrange(max_input_sequence_len)], qx.length) if with_mask else None
+                    block = SequentialDotSoftmaxCeBlock(qW, qb, qx, qtrue_labels, qmask, compact, output_probs)
+                    for e in [qx, qtrue_labels, qW, qb] + ([qmask] if with_mask else []):
+                        e.fprop()
+                    block.fprop()
+                    block.bprop()
+                    results.append([qW.backward_matrix.to_host(), qb.backward_matrix.to_host()])
+                    results[-1].extend(e.backward_matrix.to_host() for e in qx)
+                    block.calculate_loss(context)
+                    losses.append(block.loss)
+
+                for result, fused_result in izip(*results):
+                    r.append(np.allclose(result, fused_result, atol=1e-5))
+                r.append(np.allclose(losses[0], losses[1]))
+
+        self.assertEqual(sum(r), len(r))
\ No newline at end of file
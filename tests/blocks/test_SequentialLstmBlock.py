@@ -218,6 +218,514 @@ class TestSequentialLstmBlock(TestCase):
 
         self.assertEqual(sum(r), len(r))
 
+    def test_checkpointing(self):
+        """
+        compare `bprop` results with and without activation checkpointing
+        """
+
+        r = []
+        quagga.processor_type = 'cpu'
+        for i in xrange(self.N):
+            max_input_sequence_len = self.rng.random_integers(100)
+            sequence_len = max_input_sequence_len if i == 0 else self.rng.random_integers(max_input_sequence_len)
+            checkpoint_every = self.rng.random_integers(max_input_sequence_len)
+            batch_size = self.rng.random_integers(64)
+            input_dim, hidden_dim = self.rng.random_integers(256, size=2)
+
+            x = [self.rng.randn(batch_size, input_dim).astype(np.float32) for _ in xrange(max_input_sequence_len)]
+            true_labels = [self.rng.randint(3, size=(batch_size, 1)).astype(np.int32) for _ in xrange(max_input_sequence_len)]
+            mask = (self.rng.rand(batch_size, sequence_len) < 0.8).astype(np.float32)
+            h_0 = self.rng.randn(batch_size, hidden_dim).astype(np.float32)
+            c_0 = self.rng.randn(batch_size, hidden_dim).astype(np.float32)
+            W = self.get_orthogonal_matrix(input_dim, 4 * hidden_dim)
+            R = self.get_orthogonal_matrix(hidden_dim, 4 * hidden_dim)
+            b = self.rng.rand(1, 4 * hidden_dim).astype(np.float32)
+            lr_W = self.get_orthogonal_matrix(hidden_dim, 3)
+            lr_b = self.rng.rand(1, 3).astype(dtype=np.float32)
+            device_id = 0
+
+            for reverse in [False, True]:
+                for with_mask in [False, True]:
+                    quagga_grads = []
+                    for every in [None, checkpoint_every]:
+                        context = Context()
+                        qx = List([Connector(Matrix.from_npa(e), device_id) for e in x])
+                        qtrue_labels = List([Connector(Matrix.from_npa(e)) for e in true_labels], len(qx))
+                        qmask = Matrix.empty(batch_size, len(qx))
+                        qh_0 = Connector(Matrix.from_npa(h_0), device_id)
+                        qc_0 = Connector(Matrix.from_npa(c_0), device_id)
+                        qW = Connector(Matrix.from_npa(W), device_id)
+                        qR = Connector(Matrix.from_npa(R), device_id)
+                        qb = Connector(Matrix.from_npa(b), device_id)
+                        qlr_W = Connector(Matrix.from_npa(lr_W), device_id)
+                        qlr_b = Connector(Matrix.from_npa(lr_b), device_id)
+                        sequences = [qx]
+                        if with_mask:
+                            sequences.append(List([Connector(qmask[:, i]) for i in xrange(len(qx))], len(qx)))
+                            qmask.assign_npa(context, mask)
+                            qmask = sequences[-1]
+                        else:
+                            sequences.append([None] * len(qx))
+                        lstm = SequencerBlock(block_class=LstmBlock,
+                                              params=[qW, qR, qb, None],
+                                              sequences=sequences,
+                                              output_names=['h'],
+                                              prev_names=['c', 'h'],
+                                              paddings=[qc_0, qh_0],
+                                              reverse=reverse,
+                                              checkpoint_every=every)
+                        if every:
+                            r.append(all(block.dL_dpre_zifo is lstm.blocks[0].dL_dpre_zifo for block in lstm.blocks))
+                        seq_dot_block = SequencerBlock(block_class=DotBlock,
+                                                       params=[qlr_W, qlr_b],
+                                                       sequences=[lstm.h],
+                                                       output_names=['output'])
+                        seq_sce_block = SequencerBlock(block_class=SoftmaxCeBlock,
+                                                       params=[],
+                                                       sequences=[seq_dot_block.output, qtrue_labels] + ([qmask] if with_mask else []))
+                        qx.length = sequence_len
+                        qx.fprop()
+                        qtrue_labels.fprop()
+                        if with_mask:
+                            qmask.fprop()
+                        qlr_W.fprop()
+                        qlr_b.fprop()
+                        qh_0.fprop()
+                        qc_0.fprop()
+                        qW.fprop()
+                        qR.fprop()
+                        qb.fprop()
+                        lstm.fprop()
+                        seq_dot_block.fprop()
+                        seq_sce_block.fprop()
+                        seq_sce_block.bprop()
+                        seq_dot_block.bprop()
+                        lstm.bprop()
+                        quagga_grads.append([qlr_b.backward_matrix.to_host(),
+                                             qlr_W.backward_matrix.to_host(),
+                                             qW.backward_matrix.to_host(),
+                                             qR.backward_matrix.to_host(),
+                                             qb.backward_matrix.to_host(),
+                                             qc_0.backward_matrix.to_host(),
+                                             qh_0.backward_matrix.to_host()])
+                        quagga_grads[-1].extend(e.backward_matrix.to_host() for e in qx)
+
+                    for grad, checkpointed_grad in izip(*quagga_grads):
+                        r.append(np.allclose(grad, checkpointed_grad, atol=1e-6))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_input_projection(self):
+        """
+        compare `fprop` and `bprop` results with and without input projection
+        """
+
+        r = []
+        quagga.processor_type = 'cpu'
+        for i in xrange(self.N):
+            max_input_sequence_len = self.rng.random_integers(100)
+            sequence_len = max_input_sequence_len if i == 0 else self.rng.random_integers(max_input_sequence_len)
+            batch_size = self.rng.random_integers(64)
+            input_dim, hidden_dim = self.rng.random_integers(256, size=2)
+
+            x = [self.rng.randn(batch_size, input_dim).astype(np.float32) for _ in xrange(max_input_sequence_len)]
+            mask = (self.rng.rand(batch_size, max_input_sequence_len) < 0.8).astype(np.float32)
+            dL_dh = [self.rng.randn(batch_size, hidden_dim).astype(np.float32) for _ in xrange(sequence_len)]
+            h_0 = self.rng.randn(batch_size, hidden_dim).astype(np.float32)
+            c_0 = self.rng.randn(batch_size, hidden_dim).astype(np.float32)
+            W = self.get_orthogonal_matrix(input_dim, 4 * hidden_dim)
+            R = self.get_orthogonal_matrix(hidden_dim, 4 * hidden_dim)
+            b = self.rng.rand(1, 4 * hidden_dim).astype(np.float32)
+            device_id = 0
+
+            for reverse in [False, True]:
+                for with_mask in [False, True]:
+                    quagga_results = []
+                    for input_projection in [False, True]:
+                        context = Context()
+                        qx = List([Connector(Matrix.from_npa(e), device_id) for e in x])
+                        qmask = Matrix.empty(batch_size, len(qx))
+                        qh_0 = Connector(Matrix.from_npa(h_0), device_id)
+                        qc_0 = Connector(Matrix.from_npa(c_0), device_id)
+                        qW = Connector(Matrix.from_npa(W), device_id)
+                        qR = Connector(Matrix.from_npa(R), device_id)
+                        qb = Connector(Matrix.from_npa(b), device_id)
+                        sequences = [qx]
+                        if with_mask:
+                            sequences.append(List([Connector(qmask[:, i]) for i in xrange(len(qx))], len(qx)))
+                            qmask.assign_npa(context, mask)
+                            qmask = sequences[-1]
+                        else:
+                            sequences.append([None] * len(qx))
+                        lstm = SequencerBlock(block_class=LstmBlock,
+                                              params=[qW, qR, qb, None],
+                                              sequences=sequences,
+                                              output_names=['h'],
+                                              prev_names=['c', 'h'],
+                                              paddings=[qc_0, qh_0],
+                                              reverse=reverse,
+                                              input_projection=input_projection)
+                        qdL_dh = [h.register_usage(device_id, device_id)[1] for h in lstm.h]
+                        qx.length = sequence_len
+                        if with_mask:
+                            qmask.fprop()
+                        for e in [qx, qh_0, qc_0, qW, qR, qb]:
+                            e.fprop()
+                        lstm.fprop()
+                        for t in xrange(sequence_len):
+                            qdL_dh[t].assign_npa(context, dL_dh[t])
+                        lstm.bprop()
+                        quagga_results.append([qW.backward_matrix.to_host(),
+                                               qR.backward_matrix.to_host(),
+                                               qb.backward_matrix.to_host(),
+                                               qc_0.backward_matrix.to_host(),
+                                               qh_0.backward_matrix.to_host()])
+                        for t in xrange(sequence_len):
+                            quagga_results[-1].append(lstm.h[t].to_host())
+                            quagga_results[-1].append(qx[t].backward_matrix.to_host())
+
+                    for result, projected_result in izip(*quagga_results):
+                        r.append(np.allclose(result, projected_result, atol=1e-5))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_defer_weight_gradients(self):
+        """
+        compare `bprop` results with deferred and per-timestep weight
+        gradients, the second run of packed sequences leaves rows of the
+        first one in the buffers
+        """
+
+        r = []
+        quagga.processor_type = 'cpu'
+        for i in xrange(self.N):
+            max_input_sequence_len = self.rng.random_integers(50)
+            batch_size = self.rng.random_integers(64)
+            input_dim, hidden_dim = self.rng.random_integers(128, size=2)
+
+            runs = []
+            for lengths in [np.repeat(max_input_sequence_len, batch_size),
+                            np.sort(self.rng.random_integers(max_input_sequence_len, size=batch_size))[::-1]]:
+                sequence_len = lengths[0]
+                batch_sizes = [int(np.sum(lengths > t)) for t in xrange(sequence_len)]
+                x = [self.rng.randn(batch_size, input_dim).astype(np.float32) for _ in xrange(sequence_len)]
+                mask = (lengths[:, np.newaxis] > np.arange(max_input_sequence_len)).astype(np.float32)
+                dL_dh = [self.rng.randn(batch_size, hidden_dim).astype(np.float32) * mask[:, t, np.newaxis] for t in xrange(sequence_len)]
+                runs.append((batch_sizes, x, mask, dL_dh))
+            h_0 = self.rng.randn(batch_size, hidden_dim).astype(np.float32)
+            c_0 = self.rng.randn(batch_size, hidden_dim).astype(np.float32)
+            W = self.get_orthogonal_matrix(input_dim, 4 * hidden_dim)
+            R = self.get_orthogonal_matrix(hidden_dim, 4 * hidden_dim)
+            b = self.rng.rand(1, 4 * hidden_dim).astype(np.float32)
+            device_id = 0
+
+            for packed in [False, True]:
+                quagga_results = []
+                for defer_weight_gradients in [False, True]:
+                    context = Context()
+                    qx = List([Connector(Matrix.empty(batch_size, input_dim), device_id) for _ in xrange(max_input_sequence_len)])
+                    qmask = Matrix.empty(batch_size, len(qx))
+                    qh_0 = Connector(Matrix.from_npa(h_0), device_id)
+                    qc_0 = Connector(Matrix.from_npa(c_0), device_id)
+                    qW = Connector(Matrix.from_npa(W), device_id)
+                    qR = Connector(Matrix.from_npa(R), device_id)
+                    qb = Connector(Matrix.from_npa(b), device_id)
+                    sequences = [qx]
+                    if packed:
+                        sequences.append([None] * len(qx))
+                    else:
+                        sequences.append(List([Connector(qmask[:, i]) for i in xrange(len(qx))], len(qx)))
+                    lstm = SequencerBlock(block_class=LstmBlock,
+                                          params=[qW, qR, qb, None],
+                                          sequences=sequences,
+                                          output_names=['h'],
+                                          prev_names=['c', 'h'],
+                                          paddings=[qc_0, qh_0],
+                                          defer_weight_gradients=defer_weight_gradients,
+                                          packed=packed)
+                    qdL_dh = [h.register_usage(device_id, device_id)[1] for h in lstm.h]
+                    quagga_results.append([])
+                    for batch_sizes, x, mask, dL_dh in runs:
+                        sequence_len = len(batch_sizes)
+                        qx.length = sequence_len
+                        for t in xrange(sequence_len):
+                            qx[t].assign_npa(context, x[t][:batch_sizes[t]] if packed else x[t])
+                        if not packed:
+                            qmask.assign_npa(context, mask)
+                            sequences[-1].fprop()
+                        for e in [qx, qh_0, qc_0, qW, qR, qb]:
+                            e.fprop()
+                        lstm.fprop()
+                        for t in xrange(sequence_len):
+                            qdL_dh[t].assign_npa(context, dL_dh[t][:batch_sizes[t]] if packed else dL_dh[t])
+                        lstm.bprop()
+                        quagga_results[-1].extend([qW.backward_matrix.to_host(),
+                                                   qR.backward_matrix.to_host(),
+                                                   qb.backward_matrix.to_host(),
+                                                   qc_0.backward_matrix.to_host(),
+                                                   qh_0.backward_matrix.to_host()])
+                        for t in xrange(sequence_len):
+                            quagga_results[-1].append(qx[t].backward_matrix.to_host()[:batch_sizes[t]])
+
+                for result, deferred_result in izip(*quagga_results):
+                    r.append(np.allclose(result, deferred_result, atol=1e-4))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_truncated_bptt(self):
+        """
+        compare windows of truncated BPTT with sequences that start from
+        the carried over states
+        """
+
+        r = []
+        quagga.processor_type = 'cpu'
+        for i in xrange(self.N):
+            window_len = self.rng.random_integers(20)
+            nwindows = self.rng.random_integers(2, 4)
+            last_window_len = self.rng.random_integers(window_len)
+            batch_size = self.rng.random_integers(64)
+            input_dim, hidden_dim = self.rng.random_integers(128, size=2)
+
+            x = [[self.rng.randn(batch_size, input_dim).astype(np.float32) for _ in xrange(window_len)] for _ in xrange(nwindows)]
+            true_labels = [[self.rng.randint(3, size=(batch_size, 1)).astype(np.int32) for _ in xrange(window_len)] for _ in xrange(nwindows)]
+            window_lens = [window_len] * (nwindows - 1) + [last_window_len]
+            h_0 = self.rng.randn(batch_size, hidden_dim).astype(np.float32)
+            c_0 = self.rng.randn(batch_size, hidden_dim).astype(np.float32)
+            W = self.get_orthogonal_matrix(input_dim, 4 * hidden_dim)
+            R = self.get_orthogonal_matrix(hidden_dim, 4 * hidden_dim)
+            b = self.rng.rand(1, 4 * hidden_dim).astype(np.float32)
+            lr_W = self.get_orthogonal_matrix(hidden_dim, 3)
+            lr_b = self.rng.rand(1, 3).astype(dtype=np.float32)
+            device_id = 0
+
+            def build(truncated_bptt, c_0, h_0):
+                qx = List([Connector(Matrix.empty(batch_size, input_dim), device_id) for _ in xrange(window_len)])
+                qtrue_labels = List([Connector(Matrix.empty(batch_size, 1, 'int')) for _ in xrange(window_len)], qx.length)
+                qh_0 = Connector(Matrix.from_npa(h_0))
+                qc_0 = Connector(Matrix.from_npa(c_0))
+                params = [Connector(Matrix.from_npa(e), device_id) for e in [W, R, b, lr_W, lr_b]]
+                lstm = SequencerBlock(block_class=LstmBlock,
+                                      params=params[:3] + [None],
+                                      sequences=[qx, [None] * window_len],
+                                      output_names=['h'],
+                                      prev_names=['c', 'h'],
+                                      paddings=[qc_0, qh_0],
+                                      truncated_bptt=truncated_bptt)
+                seq_dot_block = SequencerBlock(block_class=DotBlock,
+                                               params=params[3:],
+                                               sequences=[lstm.h],
+                                               output_names=['output'])
+                seq_sce_block = SequencerBlock(block_class=SoftmaxCeBlock,
+                                               params=[],
+                                               sequences=[seq_dot_block.output, qtrue_labels])
+                for e in params + [qh_0, qc_0]:
+                    e.fprop()
+                return qx, qtrue_labels, params, [lstm, seq_dot_block, seq_sce_block]
+
+            def run(model, w):
+                context = Context()
+                qx, qtrue_labels, params, blocks = model
+                qx.length = window_lens[w]
+                for e, a in izip(qx.elements, x[w]):
+                    e.assign_npa(context, a)
+                for e, a in izip(qtrue_labels.elements, true_labels[w]):
+                    e.assign_npa(context, a)
+                qx.fprop()
+                qtrue_labels.fprop()
+                for e in params:
+                    e.fprop()
+                for block in blocks:
+                    block.fprop()
+                for block in reversed(blocks):
+                    block.bprop()
+                lstm = blocks[0]
+                results = [e.to_host() for e in lstm.h]
+                results += [e.backward_matrix.to_host() for e in params]
+                results += [e.backward_matrix.to_host() for e in qx]
+                last_block = lstm.blocks[window_lens[w] - 1]
+                return results, last_block.c.to_host(), last_block.h.to_host()
+
+            truncated_model = build(True, c_0, h_0)
+            c, h = c_0, h_0
+            for w in xrange(nwindows):
+                results = run(truncated_model, w)[0]
+                expected_results, c, h = run(build(False, c, h), w)
+                for result, expected_result in izip(results, expected_results):
+                    r.append(np.allclose(result, expected_result, atol=1e-6))
+            truncated_model[3][0].reset_states()
+            results = run(truncated_model, 0)[0]
+            expected_results = run(build(False, c_0, h_0), 0)[0]
+            for result, expected_result in izip(results, expected_results):
+                r.append(np.allclose(result, expected_result, atol=1e-6))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_packed(self):
+        """
+        compare packed sequences with masked ones
+        """
+
+        r = []
+        quagga.processor_type = 'cpu'
+        for i in xrange(self.N):
+            max_input_sequence_len = self.rng.random_integers(50)
+            batch_size = self.rng.random_integers(64)
+            input_dim, hidden_dim = self.rng.random_integers(128, size=2)
+            lengths = np.sort(self.rng.random_integers(max_input_sequence_len, size=batch_size))[::-1]
+            sequence_len = lengths[0]
+            batch_sizes = [int(np.sum(lengths > t)) for t in xrange(sequence_len)]
+
+            x = [self.rng.randn(batch_size, input_dim).astype(np.float32) for _ in xrange(max_input_sequence_len)]
+            mask = (lengths[:, np.newaxis] > np.arange(sequence_len)).astype(np.float32)
+            dL_dh = [self.rng.randn(batch_size, hidden_dim).astype(np.float32) * mask[:, t, np.newaxis] for t in xrange(sequence_len)]
+            h_0 = self.rng.randn(batch_size, hidden_dim).astype(np.float32)
+            c_0 = self.rng.randn(batch_size, hidden_dim).astype(np.float32)
+            W = self.get_orthogonal_matrix(input_dim, 4 * hidden_dim)
+            R = self.get_orthogonal_matrix(hidden_dim, 4 * hidden_dim)
+            b = self.rng.rand(1, 4 * hidden_dim).astype(np.float32)
+            device_id = 0
+
+            for input_projection, defer_weight_gradients in [(False, False), (True, True)]:
+                quagga_results = []
+                for packed in [False, True]:
+                    context = Context()
+                    qx = List([Connector(Matrix.from_npa(e), device_id) for e in x])
+                    qmask = Matrix.empty(batch_size, len(qx))
+                    qh_0 = Connector(Matrix.from_npa(h_0), device_id)
+                    qc_0 = Connector(Matrix.from_npa(c_0), device_id)
+                    qW = Connector(Matrix.from_npa(W), device_id)
+                    qR = Connector(Matrix.from_npa(R), device_id)
+                    qb = Connector(Matrix.from_npa(b), device_id)
+                    sequences = [qx]
+                    if packed:
+                        sequences.append([None] * len(qx))
+                    else:
+                        sequences.append(List([Connector(qmask[:, i]) for i in xrange(len(qx))], len(qx)))
+                        qmask.assign_npa(context, mask)
+                        qmask = sequences[-1]
+                    lstm = SequencerBlock(block_class=LstmBlock,
+                                          params=[qW, qR, qb, None],
+                                          sequences=sequences,
+                                          output_names=['h'],
+                                          prev_names=['c', 'h'],
+                                          paddings=[qc_0, qh_0],
+                                          input_projection=input_projection,
+                                          defer_weight_gradients=defer_weight_gradients,
+                                          packed=packed)
+                    qdL_dh = [h.register_usage(device_id, device_id)[1] for h in lstm.h]
+                    qx.length = sequence_len
+                    if packed:
+                        for t in xrange(sequence_len):
+                            qx[t].assign_npa(context, x[t][:batch_sizes[t]])
+                    else:
+                        qmask.fprop()
+                    for e in [qx, qh_0, qc_0, qW, qR, qb]:
+                        e.fprop()
+                    lstm.fprop()
+                    for t in xrange(sequence_len):
+                        qdL_dh[t].assign_npa(context, dL_dh[t][:batch_sizes[t]] if packed else dL_dh[t])
+                    lstm.bprop()
+                    quagga_results.append([qW.backward_matrix.to_host(),
+                                           qR.backward_matrix.to_host(),
+                                           qb.backward_matrix.to_host(),
+                                           qc_0.backward_matrix.to_host(),
+                                           qh_0.backward_matrix.to_host()])
+                    for t in xrange(sequence_len):
+                        quagga_results[-1].append(lstm.h[t].to_host()[:batch_sizes[t]])
+                        quagga_results[-1].append(qx[t].backward_matrix.to_host()[:batch_sizes[t]])
+
+                for result, packed_result in izip(*quagga_results):
+                    r.append(np.allclose(result, packed_result, atol=1e-5))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_resets(self):
+        """
+        compare rows that hold two sequences separated by a reset with
+        the sequences that are processed separately
+        """
+
+        r = []
+        quagga.processor_type = 'cpu'
+        device_id = 0
+
+        def run(x, dL_dh, c_0, h_0, W, R, b, resets=None, learn_state=True):
+            context = Context()
+            qx = List([Connector(Matrix.from_npa(e), device_id) for e in x])
+            qh_0 = Connector(Matrix.from_npa(h_0), device_id if learn_state else None)
+            qc_0 = Connector(Matrix.from_npa(c_0), device_id if learn_state else None)
+            qW = Connector(Matrix.from_npa(W), device_id)
+            qR = Connector(Matrix.from_npa(R), device_id)
+            qb = Connector(Matrix.from_npa(b), device_id)
+            if resets is not None:
+                qresets = Matrix.from_npa(resets)
+                resets = List([Connector(qresets[:, i]) for i in xrange(len(qx))], len(qx))
+            lstm = SequencerBlock(block_class=LstmBlock,
+                                  params=[qW, qR, qb, None],
+                                  sequences=[qx, [None] * len(qx)],
+                                  output_names=['h'],
+                                  prev_names=['c', 'h'],
+                                  paddings=[qc_0, qh_0],
+                                  resets=resets)
+            qdL_dh = [h.register_usage(device_id, device_id)[1] for h in lstm.h]
+            for e in [qx, qh_0, qc_0, qW, qR, qb] + ([resets] if resets else []):
+                e.fprop()
+            lstm.fprop()
+            for e, a in izip(qdL_dh, dL_dh):
+                e.assign_npa(context, a)
+            lstm.bprop()
+            results = [qW.backward_matrix.to_host(),
+                       qR.backward_matrix.to_host(),
+                       qb.backward_matrix.to_host()]
+            if learn_state:
+                results += [qc_0.backward_matrix.to_host(), qh_0.backward_matrix.to_host()]
+            return results, [h.to_host() for h in lstm.h], [e.backward_matrix.to_host() for e in qx]
+
+        for i in xrange(self.N):
+            sequence_len = self.rng.random_integers(2, 30)
+            batch_size = self.rng.random_integers(8)
+            input_dim, hidden_dim = self.rng.random_integers(64, size=2)
+            starts = self.rng.random_integers(sequence_len - 1, size=batch_size)
+            resets = np.zeros((batch_size, sequence_len), np.float32)
+            resets[np.arange(batch_size), starts] = 1.0
+
+            x = [self.rng.randn(batch_size, input_dim).astype(np.float32) for _ in xrange(sequence_len)]
+            dL_dh = [self.rng.randn(batch_size, hidden_dim).astype(np.float32) for _ in xrange(sequence_len)]
+            h_0 = self.rng.randn(batch_size, hidden_dim).astype(np.float32)
+            c_0 = self.rng.randn(batch_size, hidden_dim).astype(np.float32)
+            W = self.get_orthogonal_matrix(input_dim, 4 * hidden_dim)
+            R = self.get_orthogonal_matrix(hidden_dim, 4 * hidden_dim)
+            b = self.rng.rand(1, 4 * hidden_dim).astype(np.float32)
+
+            grads, h, dL_dx = run(x, dL_dh, c_0, h_0, W, R, b, resets)
+            expected_grads = [np.zeros_like(W), np.zeros_like(R), np.zeros_like(b),
+                              np.zeros_like(c_0), np.zeros_like(h_0)]
+            expected_h = [np.empty_like(e) for e in dL_dh]
+            expected_dL_dx = [np.empty_like(e) for e in x]
+            zeros = np.zeros((1, hidden_dim), np.float32)
+            for row, start in enumerate(starts):
+                rows = slice(row, row + 1)
+                for steps, state, learn_state in [(xrange(start), (c_0[rows], h_0[rows]), True),
+                                                  (xrange(start, sequence_len), (zeros, zeros), False)]:
+                    sequence_grads, sequence_h, sequence_dL_dx = run([x[t][rows] for t in steps],
+                                                                     [dL_dh[t][rows] for t in steps],
+                                                                     state[0], state[1], W, R, b,
+                                                                     learn_state=learn_state)
+                    for k in xrange(3):
+                        expected_grads[k] += sequence_grads[k]
+                    if learn_state:
+                        expected_grads[3][rows] = sequence_grads[3]
+                        expected_grads[4][rows] = sequence_grads[4]
+                    for k, t in enumerate(steps):
+                        expected_h[t][rows] = sequence_h[k]
+                        expected_dL_dx[t][rows] = sequence_dL_dx[k]
+
+            for result, expected_result in izip(grads + h + dL_dx, expected_grads + expected_h + expected_dL_dx):
+                r.append(np.allclose(result, expected_result, atol=1e-5))
+
+        self.assertEqual(sum(r), len(r))
+
     def test_theano_fprop(self):
         quagga.processor_type = 'gpu'
         r = []
@@ -19,6 +19,7 @@ import numpy as np
 from unittest import TestCase
 from theano import tensor as T
 from quagga.matrix import Matrix
+from quagga.context import Context
 from quagga.connector import Connector
 from quagga.blocks import SoftmaxCeBlock
 
@@ -169,4 +170,39 @@ class TestSoftmaxCeBlock(TestCase):
 
                     r.append(np.allclose(th_dL_dx, q_dL_dx))
 
+        self.assertEqual(sum(r), len(r))
+
+    def test_output_probs(self):
+        """
+        compare results with and without stored probabilities
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            batch_size, dim = self.rng.random_integers(2000, size=2)
+            true_labels = self.rng.randint(dim, size=(batch_size, 1)).astype(np.int32)
+            x = self.rng.randn(batch_size, dim).astype(np.float32)
+            mask = (self.rng.rand(batch_size, 1) < 0.8).astype(np.float32)
+            for with_mask in [False, True]:
+                dL_dxs = []
+                losses = []
+                for output_probs in [True, False]:
+                    context = Context()
+                    x_cpu = Connector(Matrix.from_npa(x), 0)
+                    true_labels_cpu = Connector(Matrix.from_npa(true_labels))
+                    mask_cpu = Connector(Matrix.from_npa(mask)) if with_mask else None
+                    softmax_ce_block = SoftmaxCeBlock(x_cpu, true_labels_cpu, mask_cpu, output_probs)
+                    x_cpu.fprop()
+                    true_labels_cpu.fprop()
+                    if with_mask:
+                        mask_cpu.fprop()
+                    softmax_ce_block.fprop()
+                    softmax_ce_block.bprop()
+                    dL_dxs.append(x_cpu.backward_matrix.to_host())
+                    softmax_ce_block.calculate_loss(context)
+                    losses.append(softmax_ce_block.loss)
+
+                r.append(np.allclose(dL_dxs[0], dL_dxs[1]))
+                r.append(np.allclose(losses[0], losses[1]))
+
         self.assertEqual(sum(r), len(r))
\ No newline at end of file
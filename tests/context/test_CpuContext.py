@@ -0,0 +1,103 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import time
+import threading
+import numpy as np
+from unittest import TestCase
+from quagga.matrix import CpuMatrix
+from quagga.context import CpuContext
+
+
+class TestCpuContext(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        CpuContext.start_workers(4)
+
+    @classmethod
+    def tearDownClass(cls):
+        CpuContext.stop_workers()
+
+    def test_dependencies(self):
+        N = 10
+        k = 6
+        execution_checklist = []
+        test_results = []
+        contexts = [CpuContext() for _ in xrange(k)]
+
+        def check_dependencies(node, blocking_nodes):
+            time.sleep(np.random.uniform(0.0, 0.001))
+            test_results.append(all(e in execution_checklist for e in blocking_nodes))
+            execution_checklist.append(node)
+
+        contexts[5].add_callback(check_dependencies, 0, [])
+        contexts[5].block(*contexts[:3])
+        for i in xrange(N):
+            for context_id in xrange(3):
+                contexts[context_id].add_callback(check_dependencies, i * k + context_id + 1, [i * k])
+            for context_id in xrange(3, 5):
+                contexts[context_id].wait(*contexts[:3])
+                contexts[context_id].add_callback(check_dependencies, i * k + context_id + 1, range(i * k + 1, i * k + 4))
+            contexts[5].wait(*contexts[3:5])
+            contexts[5].add_callback(check_dependencies, i * k + 6, range(i * k + 4, i * k + 6))
+            contexts[5].block(*contexts[:3])
+
+        for context in contexts:
+            context.synchronize()
+        self.assertEqual(len(test_results), k * N + 1)
+        self.assertTrue(all(test_results))
+
+    def test_matrix_operations(self):
+        r = []
+        for _ in xrange(20):
+            a = np.random.rand(50, 30).astype(np.float32)
+            b = np.random.rand(30, 20).astype(np.float32)
+            first_context, second_context = CpuContext(), CpuContext()
+            a_cpu = CpuMatrix.from_npa(a)
+            b_cpu = CpuMatrix.from_npa(b)
+            c_cpu = CpuMatrix.empty(50, 20)
+            d_cpu = CpuMatrix.empty(50, 20)
+            c_cpu.assign_dot(first_context, a_cpu, b_cpu)
+            c_cpu.scale(first_context, 2.0)
+            d_cpu.assign_npa(second_context, np.ones((50, 20), np.float32))
+            # second context must see scaled `c`
+            d_cpu.add(second_context, c_cpu)
+            r.append(np.allclose(2.0 * np.dot(a, b) + 1.0, d_cpu.to_host(), atol=1e-5))
+        self.assertEqual(sum(r), len(r))
+
+    def test_other_thread(self):
+        a = np.random.rand(50, 30).astype(np.float32)
+        r = []
+
+        def run():
+            context = CpuContext()
+            a_cpu = CpuMatrix.from_npa(a)
+            a_cpu.scale(context, 2.0)
+            r.append(np.allclose(2.0 * a, a_cpu.to_host()))
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        self.assertEqual(r, [True])
+
+    def test_exception(self):
+        context = CpuContext()
+
+        def fail():
+            raise ValueError('Failure!')
+
+        context.add_callback(fail)
+        self.assertRaises(ValueError, context.synchronize)
+        context.synchronize()
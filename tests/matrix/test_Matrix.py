@@ -23,6 +23,7 @@ from quagga.matrix import CpuMatrix
 from quagga.context import GpuContext
 from quagga.context import CpuContext
 from quagga.matrix import SparseMatrix
+from quagga.matrix.SparseMatrix import CoalescedSlices
 
 
 class TestMatrix(TestCase):
@@ -64,6 +65,20 @@ class TestMatrix(TestCase):
     #                              a_gpu_column.to_host()))
     #     self.assertEqual(sum(r), self.N)
 
+    def test_getitem_row_slice(self):
+        r = []
+        for _ in xrange(self.N):
+            a = TestMatrix.get_random_array()
+            a_cpu = CpuMatrix.from_npa(a)
+            # logical rows can be fewer than the allocated ones
+            a_cpu.nrows = self.rng.random_integers(a.shape[0])
+            a = a[:int(a_cpu.nrows)]
+            start, stop = self.rng.randint(-2 * a.shape[0], 2 * a.shape[0] + 1, size=2)
+            for s in [slice(start, stop), slice(None, stop), slice(start, None), slice(0, 0)]:
+                r.append(np.array_equal(a_cpu[s].to_host(), a[s]))
+                r.append(int(a_cpu[s].nrows) == a[s].shape[0])
+        self.assertEqual(sum(r), len(r))
+
     def test_from_npa(self):
         r = []
         for _ in xrange(self.N):
@@ -243,6 +258,36 @@ class TestMatrix(TestCase):
 
         self.assertEqual(sum(r), self.N)
 
+    def test_slice_out_of_range(self):
+        a = CpuMatrix.from_npa(TestMatrix.get_random_array((10, 20)))
+        indxs = np.array([[3], [10]], dtype=np.int32)
+        self.assertRaises(IndexError, a.slice_rows, self.cpu_context,
+                          CpuMatrix.from_npa(indxs), CpuMatrix.empty(2, 20))
+        self.assertRaises(IndexError, a.slice_rows_batch, self.cpu_context,
+                          CpuMatrix.from_npa(indxs.reshape(1, 2)), [CpuMatrix.empty(1, 20) for _ in xrange(2)])
+        self.assertRaises(IndexError, a.slice_columns, self.cpu_context,
+                          CpuMatrix.from_npa(indxs.reshape(1, 2) * 2), CpuMatrix.empty(10, 2))
+
+    def test_assign_rows_slice(self):
+        r = []
+        for _ in xrange(self.N):
+            a = TestMatrix.get_random_array()
+            k = self.rng.random_integers(a.shape[0])
+            m = TestMatrix.get_random_array((k, a.shape[1]))
+            indxs = self.rng.choice(a.shape[0], k, replace=False)
+            indxs = np.array(indxs, dtype=np.int32, ndmin=2).T
+
+            a_cpu = CpuMatrix.from_npa(a)
+            a_gpu = GpuMatrix.from_npa(a)
+            a_cpu.assign_rows_slice(self.cpu_context, CpuMatrix.from_npa(indxs), CpuMatrix.from_npa(m))
+            a_gpu.assign_rows_slice(self.gpu_context, GpuMatrix.from_npa(indxs), GpuMatrix.from_npa(m))
+            a[indxs[:, 0]] = m
+
+            r.append(np.allclose(a_cpu.to_host(), a))
+            r.append(np.allclose(a_gpu.to_host(), a))
+
+        self.assertEqual(sum(r), 2 * self.N)
+
     def test_add_scaled_rows_slice(self):
         r = []
         for _ in xrange(self.N):
@@ -267,6 +312,24 @@ class TestMatrix(TestCase):
 
         self.assertEqual(sum(r), self.N)
 
+    def test_add_scaled_rows_slice_duplicates(self):
+        r = []
+        for _ in xrange(self.N):
+            a = TestMatrix.get_random_array(high=1000)
+            k = self.rng.random_integers(5000)
+            m = TestMatrix.get_random_array((k, a.shape[1]))
+            indxs = self.rng.randint(min(a.shape[0], 10), size=k)
+            indxs = np.array(indxs, dtype=np.int32, ndmin=2).T
+            alpha = 2 * self.rng.rand() - 1
+
+            a_cpu = CpuMatrix.from_npa(a)
+            a_cpu.add_scaled_rows_slice(self.cpu_context, CpuMatrix.from_npa(indxs), alpha, CpuMatrix.from_npa(m))
+            np.add.at(a, indxs[:, 0], alpha * m)
+
+            r.append(np.allclose(a_cpu.to_host(), a, atol=1e-3))
+
+        self.assertEqual(sum(r), self.N)
+
     def test_slice_rows_batch(self):
         r = []
         for _ in xrange(self.N):
@@ -576,6 +639,27 @@ class TestMatrix(TestCase):
 
         self.assertEqual(sum(r), self.N)
 
+    def test_add_scaled_sequentially_tile(self):
+        r = []
+        for _ in xrange(self.N):
+            a = self.get_random_array(high=1000)
+            n = self.rng.random_integers(100)
+            b = self.get_random_array((n * a.shape[0], a.shape[1]))
+            alpha = 2 * self.rng.rand() - 1
+
+            a_cpu = CpuMatrix.from_npa(a)
+            b_cpu = CpuMatrix.from_npa(b)
+            b_cpu_views = [b_cpu[k * a.shape[0]:(k + 1) * a.shape[0]] for k in xrange(n)]
+            a_gpu = GpuMatrix.from_npa(a)
+            b_gpu = [GpuMatrix.from_npa(b[k * a.shape[0]:(k + 1) * a.shape[0]]) for k in xrange(n)]
+
+            CpuMatrix.add_scaled_sequentially_tile(self.cpu_context, alpha, a_cpu, b_cpu_views)
+            GpuMatrix.add_scaled_sequentially_tile(self.gpu_context, ct.c_float(alpha), a_gpu, b_gpu)
+
+            r.append(np.allclose(b_cpu.to_host(), np.vstack([e.to_host() for e in b_gpu]), atol=1e-5))
+
+        self.assertEqual(sum(r), self.N)
+
     def test_tile(self):
         r = []
         for _ in xrange(self.N):
@@ -637,6 +721,24 @@ class TestMatrix(TestCase):
             r.append(np.allclose(a_gpu.to_host(), a_cpu.to_host()))
         self.assertEqual(sum(r), len(r))
 
+    def test_reductions_along_axis(self):
+        r = []
+        for _ in xrange(self.N):
+            a = self.get_random_array(high=4200)
+            axis = self.rng.randint(2)
+            b = self.get_random_array((1, a.shape[1]) if axis == 0 else (a.shape[0], 1))
+            a_cpu = CpuMatrix.from_npa(a)
+            a_gpu = GpuMatrix.from_npa(a)
+            for reduction in ['sum', 'mean', 'max']:
+                for mode in ['assign', 'add']:
+                    method_name = '{}_{}_along_axis'.format(mode, reduction)
+                    b_cpu = CpuMatrix.from_npa(b)
+                    b_gpu = GpuMatrix.from_npa(b)
+                    getattr(b_cpu, method_name)(self.cpu_context, a_cpu, axis)
+                    getattr(b_gpu, method_name)(self.gpu_context, a_gpu, axis)
+                    r.append(np.allclose(b_cpu.to_host(), b_gpu.to_host(), atol=1e-3))
+        self.assertEqual(sum(r), len(r))
+
     def test_dropout(self):
         r = []
         for _ in xrange(self.N):
@@ -901,6 +1003,47 @@ class TestMatrix(TestCase):
 
         self.assertEqual(sum(r), len(r))
 
+    def test_add_nonlinearity_derivatives(self):
+        r = []
+        for _ in xrange(self.N):
+            a = TestMatrix.get_random_array()
+            deriv = TestMatrix.get_random_array(a.shape)
+            out = TestMatrix.get_random_array(a.shape)
+            for nonlinearity in ['tanh', 'sigmoid', 'relu']:
+                a_cpu = CpuMatrix.from_npa(a)
+                f_cpu = CpuMatrix.empty_like(a_cpu)
+                deriv_cpu = CpuMatrix.from_npa(deriv)
+                out_cpu = CpuMatrix.from_npa(out)
+                a_gpu = GpuMatrix.from_npa(a)
+                f_gpu = GpuMatrix.empty_like(a_gpu)
+                deriv_gpu = GpuMatrix.from_npa(deriv)
+                out_gpu = GpuMatrix.from_npa(out)
+
+                getattr(a_cpu, nonlinearity)(self.cpu_context, f_cpu)
+                getattr(a_gpu, nonlinearity)(self.gpu_context, f_gpu)
+                add_derivative = 'add_{}_derivative'.format(nonlinearity)
+                getattr(out_cpu, add_derivative)(self.cpu_context, f_cpu, deriv_cpu)
+                getattr(out_gpu, add_derivative)(self.gpu_context, f_gpu, deriv_gpu)
+                r.append(np.allclose(out_cpu.to_host(), out_gpu.to_host()))
+
+            for axis in [0, 1]:
+                a_cpu = CpuMatrix.from_npa(a)
+                tanh_sigm_matrix_cpu = CpuMatrix.empty_like(a_cpu)
+                derivative_matrix_cpu = CpuMatrix.empty_like(a_cpu)
+                recomputed_cpu = CpuMatrix.empty_like(a_cpu)
+                a_gpu = GpuMatrix.from_npa(a)
+                tanh_sigm_matrix_gpu = GpuMatrix.empty_like(a_gpu)
+                recomputed_gpu = GpuMatrix.empty_like(a_gpu)
+
+                a_cpu.tanh_sigm(self.cpu_context, tanh_sigm_matrix_cpu, derivative_matrix_cpu, axis=axis)
+                a_gpu.tanh_sigm(self.gpu_context, tanh_sigm_matrix_gpu, axis=axis)
+                recomputed_cpu.assign_tanh_sigm_derivative(self.cpu_context, tanh_sigm_matrix_cpu, axis=axis)
+                recomputed_gpu.assign_tanh_sigm_derivative(self.gpu_context, tanh_sigm_matrix_gpu, axis=axis)
+                r.append(np.allclose(recomputed_cpu.to_host(), derivative_matrix_cpu.to_host()))
+                r.append(np.allclose(recomputed_cpu.to_host(), recomputed_gpu.to_host()))
+
+        self.assertEqual(sum(r), len(r))
+
     def test_softmax(self):
         r = []
         for _ in xrange(self.N):
@@ -960,6 +1103,79 @@ class TestMatrix(TestCase):
 
         self.assertEqual(sum(r), self.N)
 
+    def test_softmax_ce(self):
+        r = []
+        for _ in xrange(self.N):
+            logits = 4 * self.get_random_array() - 2
+            target_classes = self.rng.randint(logits.shape[1], size=(logits.shape[0], 1)).astype(np.int32)
+            derivative = self.get_random_array(logits.shape)
+            probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+            probs /= probs.sum(axis=1, keepdims=True)
+            idxs = range(logits.shape[0]), target_classes[:, 0]
+
+            for processor_type in ['cpu', 'gpu']:
+                Matrix = CpuMatrix if processor_type == 'cpu' else GpuMatrix
+                context = self.cpu_context if processor_type == 'cpu' else self.gpu_context
+                logits_q = Matrix.from_npa(logits)
+                target_classes_q = Matrix.from_npa(target_classes)
+                losses_q = Matrix.empty(logits.shape[0], 1)
+                probs_q = Matrix.empty_like(logits_q)
+                true_derivative_q = Matrix.from_npa(derivative)
+                derivative_q = Matrix.from_npa(derivative)
+
+                logits_q.softmax(context, probs_q)
+                true_derivative_q.add_softmax_ce_derivative(context, probs_q, target_classes_q)
+                logits_q.softmax_ce(context, target_classes_q, losses_q, derivative_q, 1.0)
+                r.append(np.allclose(derivative_q.to_host(), true_derivative_q.to_host(), atol=1e-6))
+                r.append(np.allclose(losses_q.to_host()[:, 0], -np.log(probs[idxs]), atol=1e-4))
+                # in place derivative
+                logits_q.softmax_ce(context, target_classes_q, derivative=logits_q)
+                true_derivative_q.assign_softmax_ce_derivative(context, probs_q, target_classes_q)
+                r.append(np.allclose(logits_q.to_host(), true_derivative_q.to_host(), atol=1e-6))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_top_k(self):
+        r = []
+        for _ in xrange(self.N):
+            a = self.get_random_array(high=1000)
+            k = self.rng.random_integers(min(a.shape[1], 10))
+            true_values = -np.sort(-a, axis=1)[:, :k]
+
+            for processor_type in ['cpu', 'gpu']:
+                Matrix = CpuMatrix if processor_type == 'cpu' else GpuMatrix
+                context = self.cpu_context if processor_type == 'cpu' else self.gpu_context
+                a_q = Matrix.from_npa(a)
+                values_q = Matrix.empty(a.shape[0], k)
+                indices_q = Matrix.empty(a.shape[0], k, 'int')
+                a_q.top_k(context, values_q, indices_q)
+                indices = indices_q.to_host()
+                r.append(np.allclose(values_q.to_host(), true_values))
+                r.append(np.allclose(a[np.arange(a.shape[0])[:, np.newaxis], indices], true_values))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_sample(self):
+        r = []
+        for _ in xrange(self.N):
+            probs = self.rng.rand(*self.rng.random_integers(1000, size=2)).astype(np.float32)
+            probs /= probs.sum(axis=1, keepdims=True)
+            uniforms = self.rng.rand(probs.shape[0], 1).astype(np.float32)
+            cdf = np.cumsum(probs, axis=1)
+            true_indices = np.minimum(np.argmax(uniforms < cdf, axis=1), probs.shape[1] - 1)
+            # uniforms that are too close to the bounds of cdf intervals
+            ambiguous = np.min(np.abs(cdf - uniforms), axis=1) < 1e-5
+
+            for processor_type in ['cpu', 'gpu']:
+                Matrix = CpuMatrix if processor_type == 'cpu' else GpuMatrix
+                context = self.cpu_context if processor_type == 'cpu' else self.gpu_context
+                indices_q = Matrix.empty(probs.shape[0], 1, 'int')
+                Matrix.from_npa(probs).sample(context, Matrix.from_npa(uniforms), indices_q)
+                indices = indices_q.to_host()[:, 0]
+                r.append(np.all((indices == true_indices) | ambiguous))
+
+        self.assertEqual(sum(r), len(r))
+
     def test_scale(self):
         r = []
         for _ in xrange(self.N):
@@ -1128,6 +1344,63 @@ class TestMatrix(TestCase):
 
         self.assertEqual(sum(r), len(r))
 
+    def test_coalesced_slices(self):
+        r = []
+        for _ in xrange(self.N):
+            nrows, ncols = self.rng.random_integers(100, size=2)
+            expected = np.zeros((nrows, ncols), np.float32)
+            coalesced_slices = CoalescedSlices()
+            for _ in xrange(self.rng.random_integers(30)):
+                k = self.rng.randint(2 * nrows)
+                indices = self.rng.randint(nrows, size=k).astype(np.int32)
+                values = self.get_random_array((k, ncols))
+                coalesced_slices.add([indices], [values])
+                np.add.at(expected, indices, values)
+                # added slices are copied
+                values.fill(np.nan)
+                if self.rng.rand() < 0.2:
+                    coalesced_slices.indices
+            a = np.zeros((nrows, ncols), np.float32)
+            if coalesced_slices.indices is not None:
+                r.append(np.array_equal(coalesced_slices.indices, np.unique(coalesced_slices.indices)))
+                a[coalesced_slices.indices] = coalesced_slices.values
+            r.append(np.allclose(a, expected, atol=1e-4))
+        self.assertEqual(sum(r), len(r))
+
+    def test_add_scaled_compact_sparse_matrix(self):
+        r = []
+        quagga.processor_type = 'cpu'
+        for _ in xrange(self.N):
+            a = self.get_random_array(high=1000)
+            k = self.rng.random_integers(a.shape[1])
+            column_indxs = self.rng.choice(a.shape[1], (1, k)).astype(np.int32)
+            column_dense_matrix = self.get_random_array((a.shape[0], k))
+            k = self.rng.random_integers(a.shape[0])
+            row_indxs = self.rng.choice(a.shape[0], (k, 1)).astype(np.int32)
+            row_dense_matrix = self.get_random_array((k, a.shape[1]))
+            m = self.rng.random_integers(20)
+            batch_rows_indxs = self.rng.choice(a.shape[0], (k, m)).astype(np.int32)
+            dense_matrices = [self.get_random_array((k, a.shape[1])) for _ in xrange(m)]
+            alpha = ct.c_float(2 * self.rng.rand() - 1)
+
+            a_cpu = []
+            for compact in [False, True]:
+                sparse_m_cpu = SparseMatrix(compact=compact)
+                sparse_m_cpu.add_columns_slice(CpuMatrix.from_npa(column_indxs),
+                                               CpuMatrix.from_npa(column_dense_matrix))
+                sparse_m_cpu.add_rows_slice(CpuMatrix.from_npa(row_indxs),
+                                            CpuMatrix.from_npa(row_dense_matrix))
+                sparse_m_cpu.add_rows_batch_slice(CpuMatrix.from_npa(batch_rows_indxs),
+                                                  [CpuMatrix.from_npa(e) for e in dense_matrices])
+                a_cpu.append(CpuMatrix.from_npa(a))
+                a_cpu[-1].add_scaled(self.cpu_context, alpha, sparse_m_cpu)
+            # reading the results waits for the slices to be added
+            r.append(np.allclose(a_cpu[0].to_host(), a_cpu[1].to_host(), atol=1e-5))
+            unique_rows = np.union1d(row_indxs.ravel(), batch_rows_indxs.ravel())
+            r.append(np.array_equal(sparse_m_cpu.coalesced_rows.indices, unique_rows))
+
+        self.assertEqual(sum(r), len(r))
+
     def test_assign_sum(self):
         r = []
         for _ in xrange(self.N):
@@ -0,0 +1,54 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+import numpy as np
+from unittest import TestCase
+from quagga.matrix import CpuMatrix
+from quagga.matrix import MemoryArena
+
+
+class TestMemoryArena(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 50
+
+    def test_empty(self):
+        arena = MemoryArena(slab_nbytes=2 ** 16)
+        shapes = [tuple(self.rng.random_integers(100, size=2)) for _ in xrange(self.N)]
+        with arena:
+            matrices = [CpuMatrix.empty(*shape) for shape in shapes]
+        self.assertIsNone(MemoryArena.current())
+        for k, m in enumerate(matrices):
+            self.assertEqual(m.npa.ctypes.data % arena.alignment, 0)
+            self.assertFalse(m.npa.any())
+            m.npa.fill(k)
+        # matrices do not overlap
+        for k, m in enumerate(matrices):
+            self.assertTrue((m.npa == k).all())
+        self.assertEqual(arena.stats['nallocations'], self.N)
+        self.assertEqual(arena.stats['allocated_nbytes'], sum(4 * a * b for a, b in shapes))
+
+    def test_reset(self):
+        arena = MemoryArena(slab_nbytes=2 ** 12)
+        for _ in xrange(3):
+            arena.reset()
+            with arena:
+                matrices = [CpuMatrix.empty(10, 10) for _ in xrange(self.N)]
+            self.assertFalse(any(m.npa.any() for m in matrices))
+            for m in matrices:
+                m.npa.fill(np.nan)
+        # slabs are reused after the reset
+        self.assertEqual(arena.stats['nslabs'], 6)
@@ -0,0 +1,109 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+from unittest import TestCase
+
+import numpy as np
+
+import quagga
+from quagga import Model
+from quagga.utils import List
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.blocks import DotBlock
+from quagga.blocks import LstmBlock
+from quagga.blocks import DropoutBlock
+from quagga.blocks import SoftmaxBlock
+from quagga.connector import Connector
+from quagga.blocks import SequencerBlock
+from quagga.blocks import NonlinearityBlock
+from quagga.blocks import ParameterContainer
+from quagga.MemoryPlanner import _reachable
+from quagga.InferenceCompiler import InferenceCompiler
+
+
+class TestInferenceCompiler(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 5
+
+    def get_builder(self, max_input_sequence_len, batch_size, input_dim, hidden_dim, output_dim, seed):
+        def build_blocks():
+            rng = np.random.RandomState(seed)
+            init = lambda nrows, ncols: lambda: rng.normal(0.0, 0.5, (nrows, ncols)).astype(np.float32)
+            p = ParameterContainer(W={'init': init(input_dim, 4 * hidden_dim), 'device_id': 0},
+                                   R={'init': init(hidden_dim, 4 * hidden_dim), 'device_id': 0},
+                                   b={'init': init(1, 4 * hidden_dim), 'device_id': 0},
+                                   ff_W={'init': init(hidden_dim, hidden_dim), 'device_id': 0},
+                                   out_W={'init': init(hidden_dim, output_dim), 'device_id': 0},
+                                   out_b={'init': init(1, output_dim), 'device_id': 0})
+            x = List([Connector(Matrix.empty(batch_size, input_dim)) for _ in xrange(max_input_sequence_len)])
+            c0 = Connector(Matrix.from_npa(np.zeros((batch_size, hidden_dim), np.float32)))
+            h0 = Connector(Matrix.from_npa(np.zeros((batch_size, hidden_dim), np.float32)))
+            lstm_block = SequencerBlock(block_class=LstmBlock,
+                                        params=[p['W'], p['R'], p['b'], None],
+                                        sequences=[x, [None] * max_input_sequence_len],
+                                        output_names=['h'],
+                                        prev_names=['c', 'h'],
+                                        paddings=[c0, h0])
+            ff_block = DotBlock(p['ff_W'], None, lstm_block.h.elements[-1])
+            tanh_block = NonlinearityBlock(ff_block.output, 'tanh')
+            dropout_block = DropoutBlock(0.4, tanh_block.output)
+            dot_block = DotBlock(p['out_W'], p['out_b'], dropout_block.output)
+            softmax_block = SoftmaxBlock(dot_block.output)
+            build_blocks.inputs = {'x': x}
+            return [p, lstm_block, ff_block, tanh_block, dropout_block, dot_block, softmax_block]
+        return build_blocks
+
+    def test_predict(self):
+        """
+        compare predictions with the trained model in testing mode
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            max_input_sequence_len = self.rng.random_integers(20)
+            batch_size, input_dim, hidden_dim, output_dim = self.rng.random_integers(64, size=4)
+            args = [max_input_sequence_len, batch_size, input_dim, hidden_dim, output_dim, i]
+            build_blocks = self.get_builder(*args)
+            blocks = build_blocks()
+            model = Model(blocks)
+            p = blocks[0]
+            # parameters that differ from the initial ones
+            context = Context()
+            for param in p.parameters.itervalues():
+                param.assign_npa(context, self.rng.randn(param.nrows, param.ncols).astype(np.float32))
+            model.set_testing_mode()
+
+            compiler = InferenceCompiler()
+            inference_build_blocks = self.get_builder(*args)
+            inference_model = compiler.compile(inference_build_blocks, p,
+                                               lambda blocks: inference_build_blocks.inputs,
+                                               lambda blocks: {'probs': blocks[-1].output})
+            r.append(len(inference_model.blocks) == len(blocks) - 1)
+            connectors = _reachable(inference_model.blocks)[1]
+            r.append(not any(c.bpropagable for c in connectors))
+            for _ in xrange(3):
+                x = [self.rng.rand(batch_size, input_dim).astype(np.float32) for _ in xrange(max_input_sequence_len)]
+                for e, v in zip(build_blocks.inputs['x'], x):
+                    e.assign_npa(context, v)
+                    e.fprop()
+                model.fprop()
+                probs = blocks[-1].output.to_host()
+                predictions = inference_model.predict({'x': x})
+                r.append(np.allclose(probs, predictions['probs'], atol=1e-6))
+
+        self.assertEqual(sum(r), len(r))
\ No newline at end of file
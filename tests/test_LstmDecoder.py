@@ -0,0 +1,193 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+from unittest import TestCase
+from itertools import product
+
+import numpy as np
+
+import quagga
+from quagga.matrix import Matrix
+from quagga.connector import Connector
+from quagga.LstmDecoder import LstmDecoder
+from quagga.StreamingLstm import StreamingLstm
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class NumpyLm(object):
+    def __init__(self, embd_W, W, R, b, out_W, out_b):
+        self.embd_W, self.W, self.R, self.b = embd_W, W, R, b
+        self.out_W, self.out_b = out_W, out_b
+
+    def initial_state(self):
+        return [(np.zeros((1, R.shape[0]), np.float32),) * 2 for R in self.R]
+
+    def step(self, state, token):
+        x = self.embd_W[token, np.newaxis]
+        new_state = []
+        for (c, h), W, R, b in zip(state, self.W, self.R, self.b):
+            dim = R.shape[0]
+            pre_zifo = x.dot(W) + h.dot(R) + b
+            z = np.tanh(pre_zifo[:, :dim])
+            i, f, o = [sigmoid(pre_zifo[:, k * dim:(k + 1) * dim]) for k in xrange(1, 4)]
+            c = i * z + f * c
+            x = o * np.tanh(c)
+            new_state.append((c, x))
+        logits = x.dot(self.out_W) + self.out_b
+        probs = np.exp(logits - logits.max())
+        return new_state, (probs / probs.sum())[0]
+
+    def log_prob(self, prompt, tokens):
+        state = self.initial_state()
+        for token in prompt[:-1]:
+            state = self.step(state, token)[0]
+        log_prob = 0.0
+        for prev_token, token in zip(prompt[-1:] + tokens, tokens):
+            state, probs = self.step(state, prev_token)
+            log_prob += np.log(probs[token])
+        return log_prob
+
+
+class TestLstmDecoder(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 5
+
+    def get_decoder(self, vocab_size, max_batch_size, eos):
+        input_dim, out_dim = self.rng.random_integers(16, size=2)
+        dims = self.rng.random_integers(16, size=self.rng.random_integers(2))
+        randn = lambda *shape: self.rng.randn(*shape).astype(np.float32)
+        embd_W = randn(vocab_size, input_dim)
+        W = [randn(input_dim if k == 0 else dims[k - 1], 4 * dim) for k, dim in enumerate(dims)]
+        R = [randn(dim, 4 * dim) for dim in dims]
+        b = [randn(1, 4 * dim) for dim in dims]
+        out_W = 2 * randn(dims[-1], vocab_size)
+        out_b = randn(1, vocab_size)
+        to_connector = lambda a: Connector(Matrix.from_npa(a))
+        stream = StreamingLstm(to_connector(embd_W), map(to_connector, W), map(to_connector, R),
+                               map(to_connector, b), [None] * len(dims), [None] * len(dims),
+                               max_batch_size, max_batch_size)
+        decoder = LstmDecoder(to_connector(out_W), to_connector(out_b), stream, eos)
+        return decoder, NumpyLm(embd_W, W, R, b, out_W, out_b)
+
+    def test_beam_search(self):
+        """
+        beam that keeps all hypotheses finds the most probable sequence,
+        scores agree with numpy model
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for _ in xrange(self.N):
+            vocab_size, max_len = 3, 3
+            eos = 0
+            num_prompts = self.rng.random_integers(3)
+            beam_size = vocab_size ** (max_len - 1)
+            decoder, lm = self.get_decoder(vocab_size, num_prompts * beam_size, eos)
+            prompts = [list(self.rng.randint(vocab_size, size=self.rng.random_integers(4))) for _ in xrange(num_prompts)]
+            hypotheses = decoder.beam_search(prompts, beam_size, max_len)
+
+            for prompt, prompt_hypotheses in zip(prompts, hypotheses):
+                # all sequences that end with eos or have max_len tokens
+                best = -np.inf
+                for length in xrange(1, max_len + 1):
+                    for tokens in product(range(1, vocab_size), repeat=length - 1):
+                        best = max(best, lm.log_prob(prompt, list(tokens) + [eos]))
+                        if length == max_len:
+                            for token in xrange(1, vocab_size):
+                                best = max(best, lm.log_prob(prompt, list(tokens) + [token]))
+                r.append(np.allclose(prompt_hypotheses[0][1], best, atol=1e-4))
+                for tokens, score in prompt_hypotheses:
+                    ended = tokens if len(tokens) == max_len else tokens + [eos]
+                    r.append(np.allclose(score, lm.log_prob(prompt, ended), atol=1e-4))
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_greedy(self):
+        """
+        beam of one hypothesis and sampling from one token are greedy
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for _ in xrange(self.N):
+            vocab_size = self.rng.random_integers(2, 50)
+            eos = self.rng.randint(vocab_size)
+            num_prompts = self.rng.random_integers(8)
+            max_len = self.rng.random_integers(20)
+            decoder, lm = self.get_decoder(vocab_size, num_prompts, eos)
+            prompts = [list(self.rng.randint(vocab_size, size=self.rng.random_integers(4))) for _ in xrange(num_prompts)]
+            hypotheses = decoder.beam_search(prompts, 1, max_len)
+            samples = decoder.sample(prompts, max_len, temperature=0.5, top_k=1)
+
+            for prompt, prompt_hypotheses, sample in zip(prompts, hypotheses, samples):
+                state = lm.initial_state()
+                for token in prompt[:-1]:
+                    state = lm.step(state, token)[0]
+                token, tokens = prompt[-1], []
+                while len(tokens) < max_len:
+                    state, probs = lm.step(state, token)
+                    token = np.argmax(probs)
+                    if token == eos:
+                        break
+                    tokens.append(token)
+                r.append(prompt_hypotheses[0][0] == tokens)
+                r.append(sample == tokens)
+
+        self.assertEqual(sum(r), len(r))
+
+    def test_sample(self):
+        """
+        compare sampled tokens with numpy sampling from the same uniforms
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            vocab_size = self.rng.random_integers(2, 50)
+            eos = self.rng.randint(vocab_size)
+            num_prompts = self.rng.random_integers(8)
+            max_len = self.rng.random_integers(20)
+            temperature = 0.5 + self.rng.rand()
+            decoder, lm = self.get_decoder(vocab_size, num_prompts, eos)
+            lm.out_W /= temperature
+            lm.out_b /= temperature
+            prompts = [list(self.rng.randint(vocab_size, size=self.rng.random_integers(4))) for _ in xrange(num_prompts)]
+            samples = decoder.sample(prompts, max_len, temperature, rng=np.random.RandomState(i))
+
+            rng = np.random.RandomState(i)
+            states, tokens, outputs = [], [], [[] for _ in prompts]
+            for prompt in prompts:
+                state = lm.initial_state()
+                for token in prompt[:-1]:
+                    state = lm.step(state, token)[0]
+                states.append(state)
+                tokens.append(prompt[-1])
+            live = range(num_prompts)
+            while live:
+                uniforms = rng.rand(len(live), 1).astype(np.float32)
+                next_live = []
+                for k, j in enumerate(live):
+                    states[j], probs = lm.step(states[j], tokens[j])
+                    tokens[j] = min(np.sum(np.cumsum(probs) <= uniforms[k, 0]), vocab_size - 1)
+                    if tokens[j] != eos:
+                        outputs[j].append(tokens[j])
+                    if tokens[j] != eos and len(outputs[j]) < max_len:
+                        next_live.append(j)
+                live = next_live
+            r.append(samples == outputs)
+
+        self.assertEqual(sum(r), len(r))
\ No newline at end of file
@@ -0,0 +1,117 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+from unittest import TestCase
+
+import numpy as np
+
+import quagga
+from quagga import Model
+from quagga.utils import List
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.blocks import DotBlock
+from quagga.blocks import LstmBlock
+from quagga.connector import Connector
+from quagga.blocks import SoftmaxCeBlock
+from quagga.blocks import SequencerBlock
+from quagga.blocks import ParameterContainer
+from quagga.MemoryPlanner import MemoryPlanner
+
+
+class TestMemoryPlanner(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 5
+
+    def get_builder(self, max_input_sequence_len, batch_size, input_dim, hidden_dim, output_dim, seed):
+        def build_blocks():
+            rng = np.random.RandomState(seed)
+            init = lambda nrows, ncols: lambda: rng.normal(0.0, 0.5, (nrows, ncols)).astype(np.float32)
+            p = ParameterContainer(W={'init': init(input_dim, 4 * hidden_dim), 'device_id': 0},
+                                   R={'init': init(hidden_dim, 4 * hidden_dim), 'device_id': 0},
+                                   b={'init': init(1, 4 * hidden_dim), 'device_id': 0},
+                                   out_W={'init': init(hidden_dim, output_dim), 'device_id': 0},
+                                   out_b={'init': init(1, output_dim), 'device_id': 0})
+            x = List([Connector(Matrix.empty(batch_size, input_dim), 0) for _ in xrange(max_input_sequence_len)])
+            true_labels = List([Connector(Matrix.empty(batch_size, 1, 'int')) for _ in xrange(max_input_sequence_len)], x.length)
+            c_fwd_repeat_block = Connector(Matrix.empty(batch_size, hidden_dim), 0)
+            h_fwd_repeat_block = Connector(Matrix.empty(batch_size, hidden_dim), 0)
+            lstm_block = SequencerBlock(block_class=LstmBlock,
+                                        params=[p['W'], p['R'], p['b'], None],
+                                        sequences=[x, [None] * max_input_sequence_len],
+                                        output_names=['h'],
+                                        prev_names=['c', 'h'],
+                                        paddings=[c_fwd_repeat_block, h_fwd_repeat_block])
+            dot_block = SequencerBlock(block_class=DotBlock,
+                                       params=[p['out_W'], p['out_b']],
+                                       sequences=[lstm_block.h],
+                                       output_names=['output'])
+            sce_block = SequencerBlock(block_class=SoftmaxCeBlock,
+                                       params=[],
+                                       sequences=[dot_block.output, true_labels, [None] * max_input_sequence_len])
+            build_blocks.inputs = x, true_labels, c_fwd_repeat_block, h_fwd_repeat_block
+            return [p, lstm_block, dot_block, sce_block]
+        return build_blocks
+
+    def run_model(self, model, build_blocks, sequence_len, learning, seed):
+        rng = np.random.RandomState(seed)
+        context = Context()
+        p, lstm_block, dot_block, sce_block = model.blocks
+        x, true_labels, c_fwd_repeat_block, h_fwd_repeat_block = build_blocks.inputs
+        x.length = sequence_len
+        for e in x.elements:
+            e.assign_npa(context, rng.rand(e.nrows, e.ncols).astype(np.float32))
+            e.fprop()
+        for e in true_labels.elements:
+            e.assign_npa(context, rng.randint(int(dot_block.output[0].ncols), size=(e.nrows, 1)).astype(np.int32))
+            e.fprop()
+        for e in [c_fwd_repeat_block, h_fwd_repeat_block]:
+            e.assign_npa(context, rng.rand(e.nrows, e.ncols).astype(np.float32))
+            e.fprop()
+        model.fprop()
+        results = [block.probs.to_host() for block in sce_block.blocks[:sequence_len]]
+        if learning:
+            model.bprop()
+            results += [param.backward_matrix.to_host() for param in p.trainable_parameters.itervalues()]
+            results += [e.backward_matrix.to_host() for e in x]
+        return results
+
+    def test_plan(self):
+        """
+        compare results of models with and without the memory plan
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            max_input_sequence_len = self.rng.random_integers(20)
+            args = [max_input_sequence_len] + list(self.rng.random_integers(64, size=4)) + [i]
+            storage_nbytes = []
+            for forward_only in [False, True]:
+                build_blocks = self.get_builder(*args)
+                model = Model(build_blocks())
+                planner = MemoryPlanner(forward_only)
+                planned_build_blocks = self.get_builder(*args)
+                planned_model = planner.build(planned_build_blocks)
+                for k in xrange(3):
+                    sequence_len = self.rng.random_integers(max_input_sequence_len)
+                    results = self.run_model(model, build_blocks, sequence_len, not forward_only, k)
+                    planned_results = self.run_model(planned_model, planned_build_blocks, sequence_len, not forward_only, k)
+                    r.extend(np.allclose(a, b, atol=1e-6) for a, b in zip(results, planned_results))
+                storage_nbytes.append(planner.stats['storage_nbytes'])
+                r.append(planner.stats['storage_nbytes'] <= planner.stats['planned_nbytes'])
+            r.append(storage_nbytes[1] < storage_nbytes[0])
+        self.assertEqual(sum(r), len(r))
@@ -0,0 +1,108 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+from unittest import TestCase
+
+import numpy as np
+
+import quagga
+from quagga.matrix import Matrix
+from quagga.connector import Connector
+from quagga.StreamingLstm import StreamingLstm
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def lstm_step(x, W, R, b, c, h):
+    dim = R.shape[0]
+    pre_zifo = h.dot(R) + b
+    if W is not None:
+        pre_zifo += x.dot(W)
+    z = np.tanh(pre_zifo[:, :dim])
+    i, f, o = [sigmoid(pre_zifo[:, k * dim:(k + 1) * dim]) for k in xrange(1, 4)]
+    c = i * z + f * c
+    return c, o * np.tanh(c)
+
+
+class TestStreamingLstm(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 10
+
+    def get_params(self, inputless):
+        vocab_size, input_dim = self.rng.random_integers(64, size=2)
+        num_layers = self.rng.random_integers(3)
+        dims = self.rng.random_integers(32, size=num_layers)
+        embd_W = None if inputless else self.rng.randn(vocab_size, input_dim).astype(np.float32)
+        W, R, b, c0, h0 = [], [], [], [], []
+        for k, dim in enumerate(dims):
+            prev_dim = input_dim if k == 0 else dims[k - 1]
+            W.append(None if inputless and k == 0 else 0.5 * self.rng.randn(prev_dim, 4 * dim).astype(np.float32))
+            R.append(0.5 * self.rng.randn(dim, 4 * dim).astype(np.float32))
+            b.append(0.5 * self.rng.randn(1, 4 * dim).astype(np.float32))
+            c0.append(self.rng.randn(1, dim).astype(np.float32) if k % 2 else None)
+            h0.append(self.rng.randn(1, dim).astype(np.float32) if k % 2 else None)
+        return vocab_size, embd_W, W, R, b, c0, h0
+
+    def test_step(self):
+        """
+        compare interleaved steps of sessions with separate numpy runs
+        """
+        quagga.processor_type = 'cpu'
+        r = []
+        for i in xrange(self.N):
+            inputless = i % 2 == 1
+            vocab_size, embd_W, W, R, b, c0, h0 = self.get_params(inputless)
+            to_connector = lambda a: None if a is None else Connector(Matrix.from_npa(a))
+            max_num_sessions, max_batch_size = self.rng.random_integers(2, 16, size=2)
+            stream = StreamingLstm(to_connector(embd_W), map(to_connector, W), map(to_connector, R),
+                                   map(to_connector, b), map(to_connector, c0), map(to_connector, h0),
+                                   max_num_sessions, max_batch_size)
+
+            # numpy states of the open sessions
+            states = {}
+            zeros = [np.zeros((1, e.shape[0]), np.float32) for e in R]
+            for _ in xrange(50):
+                if len(states) < max_num_sessions and self.rng.rand() < 0.3:
+                    code = self.rng.randn(1, R[-1].shape[0]).astype(np.float32)
+                    h = [None] * (len(R) - 1) + [code] if self.rng.rand() < 0.5 else None
+                    session = stream.open_session(h=h)
+                    states[session] = [[c0[k] if c0[k] is not None else zeros[k],
+                                        h[k] if h and h[k] is not None else h0[k] if h0[k] is not None else zeros[k]]
+                                       for k in xrange(len(R))]
+                if states and self.rng.rand() < 0.1:
+                    session = self.rng.choice(states.keys())
+                    stream.close_session(session)
+                    del states[session]
+                if not states:
+                    continue
+                batch_size = self.rng.random_integers(min(len(states), max_batch_size))
+                sessions = list(self.rng.choice(states.keys(), batch_size, replace=False))
+                tokens = None if inputless else list(self.rng.randint(vocab_size, size=batch_size))
+                stream.step(sessions, tokens)
+
+                outputs = []
+                for j, session in enumerate(sessions):
+                    x = None if inputless else embd_W[tokens[j], np.newaxis]
+                    for k in xrange(len(R)):
+                        states[session][k] = list(lstm_step(x, W[k], R[k], b[k], *states[session][k]))
+                        x = states[session][k][1]
+                    outputs.append(x)
+                r.append(np.allclose(stream.h.to_host(), np.vstack(outputs), atol=1e-5))
+
+        self.assertEqual(sum(r), len(r))
\ No newline at end of file
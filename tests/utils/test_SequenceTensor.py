@@ -0,0 +1,94 @@
+# ----------------------------------------------------------------------------
+# Copyright 2015 Grammarly, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ----------------------------------------------------------------------------
+from itertools import izip
+from unittest import TestCase
+
+import numpy as np
+
+import quagga
+from quagga.utils import List
+from quagga.matrix import Matrix
+from quagga.context import Context
+from quagga.connector import Connector
+from quagga.blocks import SequentialHorizontalStackBlock
+from quagga.utils.SequenceTensor import SequenceTensor
+
+
+class TestSequenceTensor(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rng = np.random.RandomState(seed=42)
+        cls.N = 20
+
+    def test_assign_npa(self):
+        quagga.processor_type = 'cpu'
+        context = Context()
+        r = []
+        for _ in xrange(self.N):
+            max_length, batch_size, dim = self.rng.random_integers(50, size=3)
+            tensor = SequenceTensor(max_length, batch_size, dim)
+            for _ in xrange(3):
+                length = self.rng.random_integers(max_length)
+                nrows = self.rng.random_integers(batch_size)
+                a = self.rng.rand(length, nrows, dim).astype(np.float32)
+                tensor.assign_npa(context, a)
+                r.append(len(tensor) == length)
+                r.append(np.allclose(tensor.to_host(), a))
+                r.append(all(np.allclose(e.to_host(), a[k]) for k, e in enumerate(tensor)))
+        self.assertEqual(sum(r), len(r))
+
+    def test_sequential_hstack(self):
+        """
+        compare the block that stacks sequence tensors with the one that
+        stacks lists of matrices
+        """
+        quagga.processor_type = 'cpu'
+        context = Context()
+        r = []
+        for _ in xrange(self.N):
+            max_length, batch_size = self.rng.random_integers(50, size=2)
+            x_dim, y_dim = self.rng.random_integers(100, size=2)
+            length = self.rng.random_integers(max_length)
+            x = self.rng.rand(length, batch_size, x_dim).astype(np.float32)
+            y = self.rng.rand(length, batch_size, y_dim).astype(np.float32)
+            dL_doutput = self.rng.rand(length, batch_size, x_dim + y_dim).astype(np.float32)
+
+            results = []
+            for tensors in [False, True]:
+                if tensors:
+                    qx = SequenceTensor(max_length, batch_size, x_dim, bu_device_id=0)
+                    qy = SequenceTensor(max_length, batch_size, y_dim, bu_device_id=0)
+                    qx.assign_npa(context, x)
+                    qy.assign_npa(context, y)
+                else:
+                    qx = List([Connector(Matrix.from_npa(e), 0) for e in x])
+                    qy = List([Connector(Matrix.from_npa(e), 0) for e in y])
+                block = SequentialHorizontalStackBlock(qx, qy)
+                qx.fprop()
+                qy.fprop()
+                block.fprop()
+                for e, a in izip(block.output, dL_doutput):
+                    e.backward_matrix.assign_npa(context, a)
+                block.bprop()
+                results.append([np.array([e.to_host() for e in block.output]),
+                                np.array([e.backward_matrix.to_host() for e in qx]),
+                                np.array([e.backward_matrix.to_host() for e in qy])])
+            r.append(np.allclose(results[0][0], np.concatenate((x, y), axis=2)))
+            r.append(np.allclose(results[0][1], dL_doutput[:, :, :x_dim]))
+            r.append(np.allclose(results[0][2], dL_doutput[:, :, x_dim:]))
+            for result, tensor_result in izip(*results):
+                r.append(np.allclose(result, tensor_result))
+        self.assertEqual(sum(r), len(r))